@@ -13,29 +13,3 @@
 #      You should have received a copy of the GNU General Public License
 #      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
 #      Copyright (c) 2019 E. Albiter
-
-#
-
-from libqnotero.qt.QtGui import QListWidgetItem
-
-
-class QnoteroItem(QListWidgetItem):
-
-	"""A single Qnotero result"""
-
-	def __init__(self, qnotero, zoteroItem, parent=None):
-
-		"""
-		Constructor
-
-		Arguments:
-		qnotero -- a Qnotero instance
-		zoteroItem -- a ZoteroItem
-
-		Keyword arguments:
-		parent -- a parent QWidget (default=None)
-		"""
-
-		QListWidgetItem.__init__(self, zoteroItem.hashKey(), parent)
-		self.qnotero = qnotero
-		self.zoteroItem = zoteroItem
@@ -0,0 +1,720 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# Generates a synthetic Zotero library, with a zotero.sqlite that has the
+# tables and columns of a Zotero 5 database, for benchmarking. The same size
+# and seed always produce the same library. For example:
+#
+#   python -m benchmarks.generate /tmp/zotero-10k --items 10000
+#   python -m benchmarks.generate /tmp/zotero-ft --items 1000 \
+#       --fulltext-words 2000
+
+import argparse
+import itertools
+import os
+import os.path
+import random
+import shutil
+import sqlite3
+import string
+
+# The userdata schema version of Zotero 5
+schema_version = 120
+
+schema = u"""
+create table version (
+    schema TEXT PRIMARY KEY,
+    version INT NOT NULL
+);
+create table itemTypes (
+    itemTypeID INTEGER PRIMARY KEY,
+    typeName TEXT,
+    templateItemTypeID INT,
+    display INT DEFAULT 1
+);
+create table fields (
+    fieldID INTEGER PRIMARY KEY,
+    fieldName TEXT,
+    fieldFormatID INT
+);
+create table items (
+    itemID INTEGER PRIMARY KEY,
+    itemTypeID INT NOT NULL,
+    dateAdded TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    dateModified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    clientDateModified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    libraryID INT NOT NULL,
+    key TEXT NOT NULL,
+    version INT NOT NULL DEFAULT 0,
+    synced INT NOT NULL DEFAULT 0,
+    UNIQUE (libraryID, key)
+);
+create table itemDataValues (
+    valueID INTEGER PRIMARY KEY,
+    value UNIQUE
+);
+create table itemData (
+    itemID INT,
+    fieldID INT,
+    valueID,
+    PRIMARY KEY (itemID, fieldID)
+);
+create index itemData_fieldID on itemData(fieldID);
+create table itemNotes (
+    itemID INTEGER PRIMARY KEY,
+    parentItemID INT,
+    note TEXT,
+    title TEXT
+);
+create index itemNotes_parentItemID on itemNotes(parentItemID);
+create table itemAttachments (
+    itemID INTEGER PRIMARY KEY,
+    parentItemID INT,
+    linkMode INT,
+    contentType TEXT,
+    charsetID INT,
+    path TEXT,
+    syncState INT DEFAULT 0,
+    storageModTime INT,
+    storageHash TEXT,
+    lastProcessedModificationTime INT
+);
+create index itemAttachments_parentItemID on itemAttachments(parentItemID);
+create index itemAttachments_contentType on itemAttachments(contentType);
+create table creatorTypes (
+    creatorTypeID INTEGER PRIMARY KEY,
+    creatorType TEXT
+);
+create table creators (
+    creatorID INTEGER PRIMARY KEY,
+    firstName TEXT,
+    lastName TEXT,
+    fieldMode INT,
+    UNIQUE (lastName, firstName, fieldMode)
+);
+create table itemCreators (
+    itemID INT NOT NULL,
+    creatorID INT NOT NULL,
+    creatorTypeID INT NOT NULL DEFAULT 1,
+    orderIndex INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (itemID, creatorID, creatorTypeID, orderIndex),
+    UNIQUE (itemID, orderIndex)
+);
+create index itemCreators_creatorTypeID on itemCreators(creatorTypeID);
+create table collections (
+    collectionID INTEGER PRIMARY KEY,
+    collectionName TEXT NOT NULL,
+    parentCollectionID INT DEFAULT NULL,
+    clientDateModified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    libraryID INT NOT NULL,
+    key TEXT NOT NULL,
+    version INT NOT NULL DEFAULT 0,
+    synced INT NOT NULL DEFAULT 0,
+    UNIQUE (libraryID, key)
+);
+create table collectionItems (
+    collectionID INT NOT NULL,
+    itemID INT NOT NULL,
+    orderIndex INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (collectionID, itemID)
+);
+create index collectionItems_itemID on collectionItems(itemID);
+create table tags (
+    tagID INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+create table itemTags (
+    itemID INT NOT NULL,
+    tagID INT NOT NULL,
+    type INT NOT NULL,
+    PRIMARY KEY (itemID, tagID)
+);
+create index itemTags_tagID on itemTags(tagID);
+create table deletedItems (
+    itemID INTEGER PRIMARY KEY,
+    dateDeleted DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+create index deletedItems_dateDeleted on deletedItems(dateDeleted);
+create table retractedItems (
+    itemID INTEGER PRIMARY KEY,
+    data TEXT,
+    flag INT DEFAULT 0
+);
+create table fulltextItems (
+    itemID INTEGER PRIMARY KEY,
+    indexedPages INT,
+    totalPages INT,
+    indexedChars INT,
+    totalChars INT,
+    version INT NOT NULL DEFAULT 0,
+    synced INT NOT NULL DEFAULT 0
+);
+create table fulltextWords (
+    wordID INTEGER PRIMARY KEY,
+    word TEXT UNIQUE
+);
+create table fulltextItemWords (
+    wordID INT,
+    itemID INT,
+    PRIMARY KEY (wordID, itemID)
+);
+create index fulltextItemWords_itemID on fulltextItemWords(itemID);
+"""
+
+# The ids are those of Zotero 5
+item_types = [
+    (1, u"note"),
+    (2, u"book"),
+    (3, u"bookSection"),
+    (4, u"journalArticle"),
+    (7, u"thesis"),
+    (13, u"webpage"),
+    (14, u"attachment"),
+    (15, u"report"),
+    ]
+note_type = 1
+attachment_type = 14
+# The types of regular items, and how often they occur
+regular_types = [2, 3, 4, 7, 13, 15]
+regular_weights = [10, 8, 60, 4, 8, 10]
+
+field_names = [u"title", u"abstractNote", u"date", u"volume", u"issue",
+               u"url", u"publicationTitle", u"bookTitle", u"websiteTitle",
+               u"DOI", u"pages", u"publisher", u"language"]
+
+creator_types = [(1, u"author"), (2, u"editor"), (3, u"contributor")]
+
+# The linkMode of attachments
+link_mode_imported_file = 0
+link_mode_imported_url = 1
+link_mode_linked_file = 2
+link_mode_linked_url = 3
+
+# Words and names that occur often, so that benchmark queries find results
+# in libraries of any size. They are the most frequent words after the
+# first few random ones.
+common_names = [u"Doe", u"Smith", u"Müller", u"Kahneman", u"Tversky",
+                u"O'Brien", u"van der Berg", u"Nguyen", u"García",
+                u"Schmidhuber"]
+common_words = [u"neural", u"network", u"memory", u"attention", u"ecology",
+                u"judgment", u"uncertainty", u"cognition", u"café", u"Ærø"]
+common_tags = [u"review", u"important", u"to read", u"méta"]
+common_journals = [u"Science", u"Nature", u"Psychological Review",
+                   u"Journal of Ecology", u"Cognition"]
+collection_names = [u"To Read", u"Vision", u"Memory", u"Ökologie",
+                    u"Methods", u"Thesis"]
+
+# The characters of Zotero keys
+key_alphabet = u"23456789ABCDEFGHIJKLMNPQRSTUVWXYZ"
+
+# Rows are inserted in batches of this size
+batch_size = 10000
+
+
+def zotero_key(n):
+
+    """
+    Arguments:
+    n			--	A number.
+
+    Returns:
+    A unique, eight-character Zotero key for the number.
+    """
+
+    key = []
+    for i in range(8):
+        n, digit = divmod(n, len(key_alphabet))
+        key.append(key_alphabet[digit])
+    return u"".join(reversed(key))
+
+
+def timestamp(rng, first_year=2005, last_year=2020):
+
+    """
+    Arguments:
+    rng			--	A random.Random object.
+
+    Keyword arguments:
+    first_year	--	The earliest year. (default=2005)
+    last_year	--	The latest year. (default=2020)
+
+    Returns:
+    A random timestamp in the format that Zotero uses.
+    """
+
+    return u"%d-%02d-%02d %02d:%02d:%02d" % (
+        rng.randint(first_year, last_year), rng.randint(1, 12),
+        rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59),
+        rng.randint(0, 59))
+
+
+def random_words(rng, n, min_length=3, max_length=10):
+
+    """
+    Arguments:
+    rng			--	A random.Random object.
+    n			--	The number of words.
+
+    Keyword arguments:
+    min_length	--	The minimum length of a word. (default=3)
+    max_length	--	The maximum length of a word. (default=10)
+
+    Returns:
+    A list of n distinct random words.
+    """
+
+    words = set()
+    while len(words) < n:
+        words.add(u"".join(rng.choice(string.ascii_lowercase) for _ in
+                           range(rng.randint(min_length, max_length))))
+    return sorted(words)
+
+
+def zipf(rng, words, common=()):
+
+    """
+    Creates a vocabulary in which the frequency of words falls off like in
+    natural text.
+
+    Arguments:
+    rng			--	A random.Random object.
+    words		--	A list of words.
+
+    Keyword arguments:
+    common		--	Words that are among the most frequent ones. (default=())
+
+    Returns:
+    A (words, cumulative weights) tuple for random.choices().
+    """
+
+    words = list(words)
+    rng.shuffle(words)
+    words[5:5] = common
+    weights = itertools.accumulate(1. / (rank + 1)
+                                   for rank in range(len(words)))
+    return words, list(weights)
+
+
+class Generator(object):
+
+    """
+    Writes a synthetic library to a Zotero database.
+    """
+
+    def __init__(self, conn, items, seed=0, fulltext_words=0,
+                 storage_path=None):
+
+        """
+        Constructor.
+
+        Arguments:
+        conn			--	An sqlite3 connection to an empty database.
+        items			--	The number of regular items.
+
+        Keyword arguments:
+        seed			--	The seed of the random numbers. (default=0)
+        fulltext_words	--	The number of words of text of each stored
+                            attachment, or 0 to not index any text.
+                            (default=0)
+        storage_path	--	The storage folder, in which the text of
+                            attachments is written. (default=None)
+        """
+
+        self.conn = conn
+        self.items = items
+        self.rng = random.Random(seed)
+        self.fulltext_words = fulltext_words
+        self.storage_path = storage_path
+        self.next_item_id = 1
+        self.values = {}
+        self.rows = {}
+        rng = self.rng
+        # Larger libraries have more distinct names and words, though not
+        # proportionally more
+        self.names = zipf(rng, random_words(rng, 1000 + items // 2, 4, 9),
+                          common_names)
+        self.first_names = random_words(rng, 500, 3, 8)
+        self.words = zipf(rng, random_words(rng, 5000 + items // 4),
+                          common_words)
+        self.tags = zipf(rng, random_words(rng, 200 + items // 200),
+                         common_tags)
+        self.journals = zipf(rng, [u" ".join(rng.choices(self.words[0][:2000],
+                                                          k=3)).title()
+                                   for _ in range(50 + items // 100)],
+                             common_journals)
+        self.creator_ids = {}
+        self.tag_ids = {}
+        self.word_ids = {}
+
+    def insert(self, table, row):
+
+        """
+        Inserts a row. Rows are buffered, and inserted in batches.
+
+        Arguments:
+        table		--	The name of the table.
+        row			--	A tuple with a value for each column.
+        """
+
+        rows = self.rows.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= batch_size:
+            self.flush(table)
+
+    def flush(self, table=None):
+
+        """
+        Inserts the buffered rows.
+
+        Keyword arguments:
+        table		--	The name of the table, or None for all tables.
+                        (default=None)
+        """
+
+        tables = list(self.rows) if table is None else [table]
+        for table in tables:
+            rows = self.rows.pop(table, [])
+            if rows:
+                self.conn.executemany(
+                    u"insert into %s values (%s)"
+                    % (table, u",".join(u"?" * len(rows[0]))), rows)
+
+    def item(self, item_type):
+
+        """
+        Adds a row to the items table.
+
+        Arguments:
+        item_type	--	The itemTypeID.
+
+        Returns:
+        The itemID.
+        """
+
+        item_id = self.next_item_id
+        self.next_item_id += 1
+        added = timestamp(self.rng)
+        self.insert(u"items", (item_id, item_type, added, added, added, 1,
+                               zotero_key(item_id), 1, 1))
+        return item_id
+
+    def value(self, item_id, field, value):
+
+        """
+        Sets a field of an item. Values are shared between items, as in
+        Zotero.
+
+        Arguments:
+        item_id		--	An itemID.
+        field		--	A field name.
+        value		--	The value.
+        """
+
+        value_id = self.values.get(value)
+        if value_id is None:
+            value_id = self.values[value] = len(self.values) + 1
+            self.insert(u"itemDataValues", (value_id, value))
+        self.insert(u"itemData", (item_id, field_names.index(field) + 1,
+                                  value_id))
+
+    def creator(self, last_name):
+
+        """
+        Arguments:
+        last_name	--	A last name.
+
+        Returns:
+        The creatorID of a creator with the last name.
+        """
+
+        creator_id = self.creator_ids.get(last_name)
+        if creator_id is None:
+            creator_id = self.creator_ids[last_name] = \
+                len(self.creator_ids) + 1
+            self.insert(u"creators", (creator_id,
+                                      self.rng.choice(self.first_names)
+                                      .title(), last_name.title()
+                                      if last_name.islower() else last_name,
+                                      0))
+        return creator_id
+
+    def tag(self, name):
+
+        """
+        Arguments:
+        name		--	A tag name.
+
+        Returns:
+        The tagID of the tag.
+        """
+
+        tag_id = self.tag_ids.get(name)
+        if tag_id is None:
+            tag_id = self.tag_ids[name] = len(self.tag_ids) + 1
+            self.insert(u"tags", (tag_id, name))
+        return tag_id
+
+    def text(self, k):
+
+        """
+        Arguments:
+        k			--	The number of words.
+
+        Returns:
+        A list of k random words.
+        """
+
+        words, weights = self.words
+        return self.rng.choices(words, cum_weights=weights, k=k)
+
+    def regular_item(self):
+
+        """Adds a regular item, with its notes and attachments."""
+
+        rng = self.rng
+        item_type = rng.choices(regular_types, regular_weights)[0]
+        item_id = self.item(item_type)
+        self.value(item_id, u"title", u" ".join(self.text(
+            rng.randint(3, 12))).capitalize())
+        year = int(rng.triangular(1950, 2024, 2018))
+        self.value(item_id, u"date", u"%d-%02d-00 %d" % (
+            year, rng.randint(1, 12), year))
+        if rng.random() < .6:
+            self.value(item_id, u"abstractNote", u" ".join(self.text(
+                rng.randint(30, 150))).capitalize() + u".")
+        if item_type == 4:
+            journals, weights = self.journals
+            self.value(item_id, u"publicationTitle",
+                       rng.choices(journals, cum_weights=weights)[0])
+            self.value(item_id, u"volume", str(rng.randint(1, 90)))
+            if rng.random() < .7:
+                self.value(item_id, u"issue", str(rng.randint(1, 12)))
+            self.value(item_id, u"pages", u"%d-%d" % (
+                rng.randint(1, 500), rng.randint(501, 900)))
+        elif item_type == 3:
+            self.value(item_id, u"bookTitle", u" ".join(self.text(
+                rng.randint(2, 6))).title())
+        elif item_type == 13:
+            self.value(item_id, u"websiteTitle", u" ".join(self.text(2))
+                       .title())
+        if item_type in (2, 3):
+            self.value(item_id, u"publisher", u" ".join(self.text(2)).title())
+        if rng.random() < .5:
+            self.value(item_id, u"DOI", u"10.%d/%s.%d" % (
+                rng.randint(1000, 9999), self.text(1)[0], item_id))
+        if item_type == 13 or rng.random() < .3:
+            self.value(item_id, u"url", u"https://example.org/%s/%d"
+                       % (self.text(1)[0], item_id))
+        self.value(item_id, u"language", u"en")
+        names, weights = self.names
+        authors = rng.choices(names, cum_weights=weights,
+                              k=rng.choice([1, 1, 2, 2, 3, 4, 6]))
+        order = 0
+        for name in dict.fromkeys(authors):
+            self.insert(u"itemCreators", (item_id, self.creator(name), 1,
+                                          order))
+            order += 1
+        if item_type == 3 or rng.random() < .03:
+            for name in dict.fromkeys(rng.choices(names, cum_weights=weights,
+                                                  k=rng.randint(1, 2))):
+                self.insert(u"itemCreators", (item_id, self.creator(name), 2,
+                                              order))
+                order += 1
+        tags, weights = self.tags
+        for name in set(rng.choices(tags, cum_weights=weights,
+                                    k=rng.choice([0, 0, 1, 2, 3, 5]))):
+            self.insert(u"itemTags", (item_id, self.tag(name),
+                                      rng.choice([0, 1])))
+        for collection_id in set(rng.choices(
+                range(1, len(collection_names) + 1),
+                k=rng.choice([0, 1, 1, 2]))):
+            self.insert(u"collectionItems", (collection_id, item_id,
+                                             item_id))
+        if rng.random() < .7:
+            self.attachment(item_id)
+        if rng.random() < .05:
+            self.attachment(item_id, link_mode_linked_url)
+        if rng.random() < .1:
+            note_id = self.item(note_type)
+            text = u" ".join(self.text(rng.randint(5, 40)))
+            self.insert(u"itemNotes", (note_id, item_id,
+                                       u"<p>%s</p>" % text, text[:80]))
+        if rng.random() < .02:
+            self.insert(u"deletedItems", (item_id, timestamp(rng, 2020, 2021)))
+        if rng.random() < .005:
+            self.insert(u"retractedItems", (item_id, u'{"date":"2021"}', 0))
+
+    def attachment(self, parent_id, link_mode=None):
+
+        """
+        Adds an attachment.
+
+        Arguments:
+        parent_id	--	The itemID of the parent item.
+
+        Keyword arguments:
+        link_mode	--	The linkMode, or None for a random linkMode.
+                        (default=None)
+        """
+
+        rng = self.rng
+        if link_mode is None:
+            link_mode = rng.choices(
+                [link_mode_imported_file, link_mode_imported_url,
+                 link_mode_linked_file], [80, 10, 10])[0]
+        item_id = self.item(attachment_type)
+        if link_mode == link_mode_linked_url:
+            self.value(item_id, u"title", u"Snapshot")
+            self.value(item_id, u"url", u"https://example.org/%d" % parent_id)
+            self.insert(u"itemAttachments", (item_id, parent_id, link_mode,
+                                             u"text/html", None, None, 0,
+                                             None, None, None))
+            return
+        self.value(item_id, u"title", u"Full Text PDF")
+        file_name = u"%s - %d.pdf" % (self.text(1)[0].title(), parent_id)
+        if link_mode == link_mode_linked_file:
+            path = u"/home/user/papers/" + file_name
+        else:
+            path = u"storage:" + file_name
+        self.insert(u"itemAttachments", (item_id, parent_id, link_mode,
+                                         u"application/pdf", None, path, 2,
+                                         rng.randint(10 ** 12, 2 * 10 ** 12),
+                                         u"%032x" % rng.getrandbits(128),
+                                         None))
+        if self.fulltext_words and link_mode != link_mode_linked_file:
+            self.fulltext(item_id)
+
+    def fulltext(self, item_id):
+
+        """
+        Writes the text of an attachment to its storage folder, and adds the
+        words of the text to the word tables, as Zotero does when it indexes
+        an attachment.
+
+        Arguments:
+        item_id		--	The itemID of the attachment.
+        """
+
+        words = self.text(self.fulltext_words)
+        folder = os.path.join(self.storage_path, zotero_key(item_id))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, u".zotero-ft-cache"), u"w",
+                  encoding=u"utf-8") as f:
+            for i in range(0, len(words), 12):
+                f.write(u" ".join(words[i:i + 12]) + u"\n")
+        for word in set(w.lower() for w in words):
+            self.insert(u"fulltextItemWords", (self.word_id(word), item_id))
+        chars = sum(len(w) + 1 for w in words)
+        self.insert(u"fulltextItems", (item_id, 1, 1, chars, chars, 1, 1))
+
+    def word_id(self, word):
+
+        """
+        Arguments:
+        word		--	A word from the text of an attachment.
+
+        Returns:
+        The wordID of the word.
+        """
+
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = self.word_ids[word] = len(self.word_ids) + 1
+            self.insert(u"fulltextWords", (word_id, word))
+        return word_id
+
+    def generate(self):
+
+        """Writes the library."""
+
+        conn = self.conn
+        conn.executescript(schema)
+        conn.execute(u"insert into version values (?, ?)",
+                     (u"userdata", schema_version))
+        conn.executemany(u"insert into itemTypes values (?, ?, null, 1)",
+                         item_types)
+        conn.executemany(u"insert into fields values (?, ?, null)",
+                         [(i, name) for i, name in enumerate(field_names, 1)])
+        conn.executemany(u"insert into creatorTypes values (?, ?)",
+                         creator_types)
+        conn.executemany(
+            u"insert into collections values (?, ?, null, ?, 1, ?, 1, 1)",
+            [(i, name, timestamp(self.rng), zotero_key(10 ** 9 + i))
+             for i, name in enumerate(collection_names, 1)])
+        for i in range(self.items):
+            self.regular_item()
+        self.flush()
+        conn.commit()
+
+
+def generate(path, items, seed=0, fulltext_words=0):
+
+    """
+    Generates a synthetic Zotero folder.
+
+    Arguments:
+    path			--	The Zotero folder, which is replaced if it exists.
+    items			--	The number of regular items.
+
+    Keyword arguments:
+    seed			--	The seed of the random numbers. (default=0)
+    fulltext_words	--	The number of words of text of each stored
+                        attachment, or 0 to not index any text. (default=0)
+    """
+
+    shutil.rmtree(path, ignore_errors=True)
+    storage_path = os.path.join(path, u"storage")
+    os.makedirs(storage_path)
+    conn = sqlite3.connect(os.path.join(path, u"zotero.sqlite"))
+    # The database is thrown away if generating it fails, so there's no need
+    # to protect it against crashes
+    conn.execute(u"pragma journal_mode = off")
+    conn.execute(u"pragma synchronous = off")
+    try:
+        Generator(conn, items, seed, fulltext_words, storage_path).generate()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+
+    """
+    Keyword arguments:
+    argv		--	The command-line arguments, or None to use sys.argv.
+                    (default=None)
+    """
+
+    parser = argparse.ArgumentParser(
+        prog=u"python -m benchmarks.generate",
+        description=u"Generates a synthetic Zotero library.")
+    parser.add_argument(u"path", help=u"the Zotero folder, which is replaced "
+                                      u"if it exists")
+    parser.add_argument(u"--items", type=int, default=10000,
+                        help=u"the number of regular items (default: 10000)")
+    parser.add_argument(u"--seed", type=int, default=0,
+                        help=u"the seed of the random numbers (default: 0)")
+    parser.add_argument(u"--fulltext-words", type=int, default=0,
+                        help=u"the number of words of text of each stored "
+                             u"attachment (default: 0, no text)")
+    args = parser.parse_args(argv)
+    generate(args.path, args.items, args.seed, args.fulltext_words)
+
+
+if __name__ == u"__main__":
+    main()
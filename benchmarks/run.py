@@ -0,0 +1,583 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# Benchmarks indexing and searching synthetic Zotero libraries. Libraries
+# are generated once by benchmarks.generate, and kept for later runs. Every
+# library is measured in a separate process, so that the peak memory use of
+# one library doesn't hide that of the next. For example:
+#
+#   python -m benchmarks.run --sizes 1k,10k,100k --output baseline.json
+#   python -m benchmarks.run --sizes 1k,10k,100k --output new.json \
+#       --baseline baseline.json
+#
+# With --baseline, the exit status is 1 if a time or the memory use grew by
+# more than the tolerance.
+
+import argparse
+import contextlib
+import json
+import os
+import os.path
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import generate
+
+# The repository, from which the benchmark processes are started
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Typical queries, from a single author to combinations of fields. Terms
+# that are not in the library are included, because they are as common as
+# terms that are.
+queries = [
+    u"doe",
+    u"kahneman 2019",
+    u"author:smith",
+    u"author:müller year:2018",
+    u"neural network",
+    u"title:attention",
+    u"tag:review",
+    u"collection:memory",
+    u"journal:science 2015",
+    u"ærø",
+    u"etwor",
+    u"neurl~",
+    u"smith cognition 2017",
+    u"xqzvw",
+    ]
+
+fulltext_queries = [
+    u"fulltext:neural",
+    u"doe fulltext:memory",
+    u'fulltext:"neural network"',
+    ]
+
+# Queries that are typed one character at a time, as in the Qnotero window,
+# which searches from the third character on
+typed_queries = [
+    u"kahneman 2019",
+    u"author:tversky judgment",
+    u"neural network memory",
+    ]
+min_query_length = 3
+
+# The number of results that Qnotero shows at once
+page_size = 50
+
+# Metrics are only compared to the baseline if they are larger than this,
+# because smaller differences are mostly noise
+min_delta = {u"ms": 1., u"mb": 2.}
+
+
+def percentiles(times):
+
+    """
+    Arguments:
+    times		--	A list of durations in seconds.
+
+    Returns:
+    A dict with the median, 90th and 99th percentile, and maximum of the
+    durations in milliseconds.
+    """
+
+    times = sorted(times)
+
+    def percentile(p):
+        return round(1000 * times[min(len(times) - 1,
+                                      int(p * len(times)))], 3)
+
+    return {u"p50_ms": percentile(.5), u"p90_ms": percentile(.9),
+            u"p99_ms": percentile(.99), u"max_ms": round(1000 * times[-1], 3)}
+
+
+def peak_rss():
+
+    """
+    Returns:
+    The peak memory use of this process in megabytes, or None if it can't be
+    determined.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == u"darwin":
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+def cache_state(zotero, query):
+
+    """
+    Determines how the search cache will answer a query.
+
+    Arguments:
+    zotero		--	A LibZotero object.
+    query		--	A search query.
+
+    Returns:
+    "hit" if the results are cached, "narrowed" if the results of a cached
+    search only need to be filtered, or "miss" otherwise.
+    """
+
+    from libzotero.libzotero import parse_query
+    from libzotero.search_cache import cache_key
+
+    key = tuple(term for term in cache_key(parse_query(query))
+                if term[0] != u"fulltext")
+    if key in zotero.search_cache.entries:
+        return u"hit"
+    if zotero.search_cache.narrowest(key) is not None:
+        return u"narrowed"
+    return u"miss"
+
+
+def timed_search(zotero, query):
+
+    """
+    Arguments:
+    zotero		--	A LibZotero object.
+    query		--	A search query.
+
+    Returns:
+    A (duration, results) tuple.
+    """
+
+    t = time.perf_counter()
+    results = zotero.search(query, limit=page_size)
+    return time.perf_counter() - t, results
+
+
+def forget_searches(zotero):
+
+    """
+    Forgets the results of earlier searches, including full-text searches,
+    so that the next search starts from scratch.
+
+    Arguments:
+    zotero		--	A LibZotero object.
+    """
+
+    from libzotero.search_cache import SearchCache
+
+    zotero.search_cache = SearchCache()
+    zotero.scores = None
+    zotero.fulltext_index.cache.clear()
+    zotero.phrase_search.cache.clear()
+
+
+def touch_items(database, item_ids):
+
+    """
+    Marks items as modified, as Zotero does when an item is edited.
+
+    Arguments:
+    database	--	The path of zotero.sqlite.
+    item_ids	--	A list of item ids.
+    """
+
+    mtime = os.stat(database).st_mtime
+    now = time.strftime(u"%Y-%m-%d %H:%M:%S", time.gmtime())
+    conn = sqlite3.connect(database)
+    conn.executemany(
+        u"update items set clientDateModified = ? where itemID = ?",
+        [(now, item_id) for item_id in item_ids])
+    conn.commit()
+    conn.close()
+    # Make sure that the change is noticed, also if the file system only
+    # stores modification times in seconds
+    t = max(time.time(), mtime + 1)
+    os.utime(database, (t, t))
+
+
+def measure(zotero_path, repeat, fulltext):
+
+    """
+    Measures a library. This runs in a separate process.
+
+    Arguments:
+    zotero_path	--	The Zotero folder.
+    repeat		--	How often each query is repeated.
+    fulltext	--	Indicates whether full-text queries are measured.
+
+    Returns:
+    A dict with the results.
+    """
+
+    work_path = tempfile.mkdtemp(prefix=u"qnotero-benchmark-")
+    try:
+        # The snapshot and copies of the database are written to the home
+        # folder, and the database is modified, so both are temporary
+        os.environ[u"HOME"] = os.environ[u"USERPROFILE"] = work_path
+        library_path = os.path.join(work_path, u"Zotero")
+        os.mkdir(library_path)
+        shutil.copyfile(os.path.join(zotero_path, u"zotero.sqlite"),
+                        os.path.join(library_path, u"zotero.sqlite"))
+        try:
+            os.symlink(os.path.join(zotero_path, u"storage"),
+                       os.path.join(library_path, u"storage"))
+        except OSError:
+            fulltext = False
+        return measure_library(library_path, repeat, fulltext)
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def measure_library(library_path, repeat, fulltext):
+
+    """
+    Measures indexing and searching a library.
+
+    Arguments:
+    library_path	--	A Zotero folder that may be modified.
+    repeat			--	How often each query is repeated.
+    fulltext		--	Indicates whether full-text queries are measured.
+
+    Returns:
+    A dict with the results.
+    """
+
+    from libzotero.libzotero import LibZotero
+
+    result = {u"start_rss_mb": peak_rss()}
+    # The index is built as Qnotero builds it in the background, including
+    # the indices that are only built there
+    zotero = LibZotero(library_path, auto_update=False)
+    t = time.perf_counter()
+    zotero.update()
+    result[u"build_ms"] = round(1000 * (time.perf_counter() - t), 1)
+    result[u"peak_rss_mb"] = peak_rss()
+    stats = zotero.stats()
+    result[u"items"] = stats[u"items"]
+    result[u"tokens"] = stats[u"tokens"]
+    # Loading the snapshot and updating a few items are fast enough to be
+    # repeated, and the fastest run is the least disturbed one
+    times = []
+    for i in range(3):
+        t = time.perf_counter()
+        LibZotero(library_path, auto_update=False).close()
+        times.append(time.perf_counter() - t)
+    result[u"snapshot_load_ms"] = round(1000 * min(times), 1)
+    times = []
+    for i in range(3):
+        item_ids = sorted(zotero.index)[i::max(1, len(zotero.index) // 10)]
+        touch_items(os.path.join(library_path, u"zotero.sqlite"),
+                    item_ids[:10])
+        t = time.perf_counter()
+        zotero.update()
+        times.append(time.perf_counter() - t)
+    result[u"incremental_update_ms"] = round(1000 * min(times), 1)
+    # Every query is measured without cached results, and when it is
+    # repeated
+    result[u"queries"] = {}
+    for query in queries + (fulltext_queries if fulltext else []):
+        cold = []
+        for i in range(repeat):
+            forget_searches(zotero)
+            duration, results = timed_search(zotero, query)
+            cold.append(duration)
+        warm = [timed_search(zotero, query)[0] for i in range(repeat)]
+        result[u"queries"][query] = {u"results": results.total,
+                                     u"cold": percentiles(cold),
+                                     u"warm": percentiles(warm)}
+    # While typing, most searches narrow the previous one
+    keystrokes = []
+    states = {u"hit": 0, u"narrowed": 0, u"miss": 0}
+    for i in range(repeat):
+        forget_searches(zotero)
+        for query in typed_queries:
+            for n in range(min_query_length, len(query) + 1):
+                states[cache_state(zotero, query[:n])] += 1
+                keystrokes.append(timed_search(zotero, query[:n])[0])
+    result[u"typing"] = dict(percentiles(keystrokes), **states)
+    zotero.close()
+    return result
+
+
+def run_measurement(zotero_path, repeat, fulltext):
+
+    """
+    Measures a library in a separate process.
+
+    Arguments:
+    zotero_path	--	The Zotero folder.
+    repeat		--	How often each query is repeated.
+    fulltext	--	Indicates whether full-text queries are measured.
+
+    Returns:
+    A dict with the results.
+    """
+
+    fd, result_path = tempfile.mkstemp(suffix=u".json")
+    os.close(fd)
+    try:
+        cmd = [sys.executable, u"-m", u"benchmarks.run", u"--measure",
+               zotero_path, u"--result", result_path, u"--repeat",
+               str(repeat)]
+        if fulltext:
+            cmd.append(u"--fulltext")
+        subprocess.run(cmd, cwd=root, check=True)
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def library(data_path, items, seed, fulltext_words):
+
+    """
+    Arguments:
+    data_path		--	The folder in which libraries are kept.
+    items			--	The number of items.
+    seed			--	The seed of the random numbers.
+    fulltext_words	--	The number of words of text of each attachment.
+
+    Returns:
+    The Zotero folder of the library, which is generated if it doesn't
+    exist yet.
+    """
+
+    path = os.path.join(data_path, u"zotero-%d-%d-%d" % (items, seed,
+                                                         fulltext_words))
+    if not os.path.exists(os.path.join(path, u"zotero.sqlite")):
+        print(u"generating %s" % path)
+        t = time.perf_counter()
+        generate(path + u".tmp", items, seed, fulltext_words)
+        os.replace(path + u".tmp", path)
+        print(u"generated in %.1fs" % (time.perf_counter() - t))
+    return path
+
+
+def metrics(result, path=()):
+
+    """
+    Lists the metrics for which smaller values are better. The 99th
+    percentile and maximum of query times depend on a few slow runs, and are
+    too noisy to compare.
+
+    Arguments:
+    result		--	The results of a library, or a part of them.
+
+    Keyword arguments:
+    path		--	The keys that lead to the part. (default=())
+
+    Returns:
+    A list of (path, unit, value) tuples.
+    """
+
+    found = []
+    for key, value in result.items():
+        if isinstance(value, dict):
+            found += metrics(value, path + (key,))
+        elif value is not None and key.endswith((u"_ms", u"_mb")) and \
+                key not in (u"start_rss_mb", u"p99_ms", u"max_ms"):
+            found.append((path + (key,), key.rsplit(u"_", 1)[1], value))
+    return found
+
+
+def compare(results, baseline, tolerance):
+
+    """
+    Compares results to a baseline.
+
+    Arguments:
+    results		--	The results of this run.
+    baseline	--	The results of an earlier run.
+    tolerance	--	The fraction by which a metric may grow.
+
+    Returns:
+    A list of (size, path, baseline value, value) tuples for the metrics that
+    have grown by more than the tolerance.
+    """
+
+    regressions = []
+    for size, result in results[u"libraries"].items():
+        old_result = baseline[u"libraries"].get(size)
+        if old_result is None:
+            continue
+        old_values = dict((path, value) for path, unit, value in
+                          metrics(old_result))
+        for path, unit, value in metrics(result):
+            old_value = old_values.get(path)
+            if old_value is None:
+                continue
+            if value > old_value * (1 + tolerance) and \
+                    value - old_value > min_delta[unit]:
+                regressions.append((size, path, old_value, value))
+    return regressions
+
+
+def summary(size, result):
+
+    """
+    Arguments:
+    size		--	The number of items that were generated.
+    result		--	The results of a library.
+
+    Returns:
+    A readable summary of the results.
+    """
+
+    lines = [u"%s items: build %.0f ms, snapshot %.0f ms, update %.0f ms, "
+             u"peak RSS %s MB" % (size, result[u"build_ms"],
+                                   result[u"snapshot_load_ms"],
+                                   result[u"incremental_update_ms"],
+                                   result[u"peak_rss_mb"])]
+    for query, timing in result[u"queries"].items():
+        lines.append(u"  %-28s %7d results  cold p50 %8.2f ms  p90 %8.2f ms"
+                     u"  warm p50 %6.2f ms" % (
+                         query, timing[u"results"], timing[u"cold"][u"p50_ms"],
+                         timing[u"cold"][u"p90_ms"],
+                         timing[u"warm"][u"p50_ms"]))
+    typing = result[u"typing"]
+    lines.append(u"  typing: p50 %.2f ms, p90 %.2f ms; %d hits, %d narrowed, "
+                 u"%d misses" % (typing[u"p50_ms"], typing[u"p90_ms"],
+                                 typing[u"hit"], typing[u"narrowed"],
+                                 typing[u"miss"]))
+    return u"\n".join(lines)
+
+
+def parse_size(size):
+
+    """
+    Arguments:
+    size		--	A number of items, such as "500" or "10k".
+
+    Returns:
+    The number as an int.
+    """
+
+    if size.lower().endswith(u"k"):
+        return int(float(size[:-1]) * 1000)
+    return int(size)
+
+
+def git_revision():
+
+    """
+    Returns:
+    The current git revision, or None if it can't be determined.
+    """
+
+    try:
+        return subprocess.run([u"git", u"rev-parse", u"HEAD"], cwd=root,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+
+    """
+    Keyword arguments:
+    argv		--	The command-line arguments, or None to use sys.argv.
+                    (default=None)
+
+    Returns:
+    The exit status.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog=u"python -m benchmarks.run",
+        description=u"Benchmarks indexing and searching synthetic Zotero "
+                    u"libraries.")
+    parser.add_argument(u"--sizes", default=u"1k,10k",
+                        help=u"comma-separated numbers of items, such as "
+                             u"1k,10k,100k,500k (default: 1k,10k)")
+    parser.add_argument(u"--seed", type=int, default=0,
+                        help=u"the seed of the generated libraries "
+                             u"(default: 0)")
+    parser.add_argument(u"--fulltext-words", type=int, default=0,
+                        help=u"the number of words of text of each "
+                             u"attachment, to also benchmark full-text "
+                             u"queries (default: 0)")
+    parser.add_argument(u"--repeat", type=int, default=20,
+                        help=u"how often each query is repeated "
+                             u"(default: 20)")
+    parser.add_argument(u"--data", default=os.path.join(
+                            tempfile.gettempdir(), u"qnotero-benchmarks"),
+                        help=u"the folder in which generated libraries are "
+                             u"kept (default: %(default)s)")
+    parser.add_argument(u"--output", help=u"write the results to this JSON "
+                                          u"file")
+    parser.add_argument(u"--baseline", help=u"compare the results to this "
+                                            u"JSON file")
+    parser.add_argument(u"--tolerance", type=float, default=.25,
+                        help=u"the fraction by which a metric may grow "
+                             u"compared to the baseline (default: 0.25)")
+    # Used to measure a single library in a separate process
+    parser.add_argument(u"--measure", help=argparse.SUPPRESS)
+    parser.add_argument(u"--result", help=argparse.SUPPRESS)
+    parser.add_argument(u"--fulltext", action=u"store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.measure is not None:
+        # LibZotero reports its progress on stdout
+        with open(os.devnull, u"w") as devnull, \
+                contextlib.redirect_stdout(devnull):
+            result = measure(args.measure, args.repeat, args.fulltext)
+        with open(args.result, u"w") as f:
+            json.dump(result, f)
+        return 0
+    results = {
+        u"revision": git_revision(),
+        u"date": time.strftime(u"%Y-%m-%dT%H:%M:%S"),
+        u"python": platform.python_version(),
+        u"sqlite": sqlite3.sqlite_version,
+        u"platform": platform.platform(),
+        u"seed": args.seed,
+        u"fulltext_words": args.fulltext_words,
+        u"repeat": args.repeat,
+        u"libraries": {},
+        }
+    for size in args.sizes.split(u","):
+        items = parse_size(size)
+        path = library(args.data, items, args.seed, args.fulltext_words)
+        result = run_measurement(path, args.repeat, args.fulltext_words > 0)
+        results[u"libraries"][str(items)] = result
+        print(summary(items, result))
+    if args.output is not None:
+        with open(args.output, u"w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for size, path, old_value, value in regressions:
+        print(u"regression: %s items, %s: %s -> %s" % (
+            size, u".".join(path), old_value, value))
+    if not regressions:
+        print(u"no regressions compared to %s" % args.baseline)
+    return 1 if regressions else 0
+
+
+# Phrase searches may start worker processes, which import this module again
+if __name__ == u"__main__":
+    sys.exit(main())
@@ -31,6 +31,7 @@ config = {
     u"updateUrl": u"",
     u"pos": u"Top right",
     u"zoteroPath": u"",
+    u"zoteroAccess": u"readonly",
     u"mdNoteproviderPath": u"",
     u'showAbstract': False,
     }
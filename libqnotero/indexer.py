@@ -0,0 +1,83 @@
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from threading import Thread, Event
+
+
+class Indexer(Thread):
+
+	"""Keeps the Zotero index up to date in the background"""
+
+	def __init__(self, qnotero):
+
+		"""
+		Constructor
+
+		Arguments:
+		qnotero -- a Qnotero instance
+		"""
+
+		Thread.__init__(self)
+		self.daemon = True
+		self.qnotero = qnotero
+		self.alive = True
+		self.force = False
+		self.requested = Event()
+
+	def update(self, force=False):
+
+		"""
+		Requests an update of the index. Requests that arrive while the index
+		is being updated are handled together, once the update is done.
+
+		Keyword arguments:
+		force -- indicates that the index should be rebuilt entirely
+				 (default=False)
+		"""
+
+		self.force = self.force or force
+		self.requested.set()
+
+	def stop(self):
+
+		"""Stops the indexer"""
+
+		self.alive = False
+		self.requested.set()
+
+	def run(self):
+
+		"""Updates the index whenever this is requested"""
+
+		while self.alive:
+			self.requested.wait()
+			self.requested.clear()
+			if not self.alive:
+				break
+			force = self.force
+			self.force = False
+			zotero = self.qnotero.zotero
+			index = zotero.index
+			try:
+				zotero.update(force)
+			except Exception as e:
+				print("indexer.run(): failed to update the index: %s" % e)
+				continue
+			if zotero.index is not index:
+				print("indexer.run(): index updated")
+				self.qnotero.indexUpdated.emit()
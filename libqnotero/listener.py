@@ -16,44 +16,471 @@
 
 #
 
+import errno
+import json
+import os
+import os.path
+import selectors
 import socket
+import struct
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from libqnotero.config import getConfig
 from threading import Thread
 
+# Every message is preceded by its length, as a 4-byte unsigned integer in
+# network byte order
+header = struct.Struct(u"!I")
+# Longer messages are not accepted
+max_message_size = 1024 ** 2
+
+
+def useUnixSocket():
+
+	"""
+	Returns:
+	True if a Unix domain socket is used, or False if a TCP socket on
+	localhost is used, because Unix domain sockets are not available
+	"""
+
+	return hasattr(socket, u"AF_UNIX") and os.name != u"nt"
+
+
+def socketPath():
+
+	"""
+	Returns:
+	The path of the Unix domain socket
+	"""
+
+	return os.path.join(os.path.expanduser(u"~"), u".qnotero.sock")
+
+
+def connect(timeout=5.):
+
+	"""
+	Connects to the running instance of Qnotero
+
+	Keyword arguments:
+	timeout -- the timeout in seconds (default=5.)
+
+	Returns:
+	A connected socket
+
+	Raises:
+	OSError if Qnotero is not running
+	"""
+
+	if useUnixSocket():
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		address = socketPath()
+	else:
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		address = u"localhost", getConfig(u"listenerPort")
+	sock.settimeout(timeout)
+	deadline = time.monotonic() + timeout
+	while True:
+		try:
+			sock.connect(address)
+		except BlockingIOError:
+			# The backlog of a Unix domain socket is full, until the running
+			# instance accepts the connections that are waiting
+			if time.monotonic() < deadline:
+				time.sleep(.01)
+				continue
+			sock.close()
+			raise
+		except OSError:
+			sock.close()
+			raise
+		return sock
+
+
+def receive(sock):
+
+	"""
+	Receives a single message from a blocking socket
+
+	Arguments:
+	sock -- a socket
+
+	Returns:
+	The message as bytes
+	"""
+
+	data = b""
+	while len(data) < header.size:
+		chunk = sock.recv(header.size - len(data))
+		if not chunk:
+			raise ConnectionError(u"connection closed")
+		data += chunk
+	size, = header.unpack(data)
+	chunks = []
+	while size > 0:
+		chunk = sock.recv(min(size, 65536))
+		if not chunk:
+			raise ConnectionError(u"connection closed")
+		chunks.append(chunk)
+		size -= len(chunk)
+	return b"".join(chunks)
+
+
+def send(command, timeout=5.):
+
+	"""
+	Sends a command to the running instance of Qnotero, and waits for the
+	reply. This only needs the standard library, so that it is fast.
+
+	Arguments:
+	command -- a command, such as u'activate' or u'search doe 2019'
+
+	Keyword arguments:
+	timeout -- the timeout in seconds (default=5.)
+
+	Returns:
+	The reply, which is a dict that contains an 'error' if the command failed
+
+	Raises:
+	OSError if Qnotero is not running
+	"""
+
+	data = command.encode(u"utf-8")
+	sock = connect(timeout)
+	try:
+		sock.sendall(header.pack(len(data)) + data)
+		reply = receive(sock)
+	finally:
+		sock.close()
+	return json.loads(reply.decode(u"utf-8"))
+
+
+class Connection(object):
+
+	"""The buffers of a client connection"""
+
+	def __init__(self, sock):
+
+		"""
+		Constructor
+
+		Arguments:
+		sock -- a connected socket
+		"""
+
+		self.sock = sock
+		self.received = bytearray()
+		self.pending = bytearray()
+		# The Futures of the replies that have not been sent yet, in the
+		# order in which the commands were received
+		self.replies = deque()
+		# Indicates that the client has closed its side of the connection
+		self.closing = False
+		self.closed = False
+
 
 class Listener(Thread):
 
-	"""Listens for commands"""
+	"""
+	Listens for commands from other processes, such as a second instance of
+	Qnotero, which sends an activate command, or a client that searches the
+	index of the running instance. Clients connect to a Unix domain socket,
+	or to a TCP socket on localhost where Unix domain sockets are not
+	available, and send messages as described in send().
+
+	The following commands are understood:
+	activate -- pops up the Qnotero window
+	search <query> -- returns the best results for a query
+	reindex -- updates the index
+	stats -- returns statistics about the index
+	"""
+
+	# The maximum number of results that are returned for a search
+	maxResults = 100
+	# The number of searches that can run at the same time
+	searchWorkers = 2
 
 	def __init__(self, qnotero=None):
-	
+
 		"""
 		Constructor
-		
-		Arguments:
-		qnotero -- a Qnotero instance
+
+		Keyword arguments:
+		qnotero -- a Qnotero instance (default=None)
+
+		Raises:
+		OSError if another instance of Qnotero is already listening
 		"""
-	
-		self.port = getConfig("listenerPort")
+
 		self.qnotero = qnotero
 		self.alive = True
+		# Searches can take a while, so they run in worker threads, and
+		# other clients are served in the meantime. The connections whose
+		# replies have become available are passed back through a queue.
+		self.searcher = ThreadPoolExecutor(max_workers=self.searchWorkers)
+		self.ready = deque()
 		Thread.__init__(self)
-		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-		self.sock.bind((u"localhost", self.port))
-		self.sock.settimeout(1.)
+		self.daemon = True
+		if useUnixSocket():
+			self.path = socketPath()
+			self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				self.sock.bind(self.path)
+			except OSError as e:
+				if e.errno != errno.EADDRINUSE:
+					raise
+				# The socket may have been left behind by an instance that
+				# crashed, in which case nobody accepts connections
+				try:
+					connect(timeout=1.).close()
+				except OSError:
+					print(u"listener.__init__(): removing stale socket %s"
+						% self.path)
+					os.remove(self.path)
+					self.sock.bind(self.path)
+				else:
+					self.sock.close()
+					raise
+			os.chmod(self.path, 0o600)
+		else:
+			self.path = None
+			self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.sock.bind((u"localhost", getConfig(u"listenerPort")))
+		self.sock.listen(socket.SOMAXCONN)
+		self.sock.setblocking(False)
+		# The selector also waits for a wakeup message, so that the thread
+		# can be stopped without polling
+		self.wakeup, self.wakeupWriter = socket.socketpair()
+		self.wakeup.setblocking(False)
+		self.selector = selectors.DefaultSelector()
+		self.selector.register(self.sock, selectors.EVENT_READ)
+		self.selector.register(self.wakeup, selectors.EVENT_READ)
+
+	def stop(self):
+
+		"""Stops listening"""
+
+		self.alive = False
+		try:
+			self.wakeupWriter.send(b"\0")
+		except OSError:
+			pass
 
 	def run(self):
 
-		"""Listen for activation signals and pops up the Qnotero window"""
-		
+		"""Handles connections and commands until the listener is stopped"""
+
 		while self.alive:
+			for key, events in self.selector.select():
+				if key.fileobj is self.sock:
+					self.accept()
+				elif key.fileobj is self.wakeup:
+					try:
+						self.wakeup.recv(64)
+					except OSError:
+						pass
+					while self.ready:
+						connection = self.ready.popleft()
+						if not connection.closed:
+							self.sendReplies(connection)
+				else:
+					connection = key.data
+					if events & selectors.EVENT_READ:
+						self.read(connection)
+					if events & selectors.EVENT_WRITE and not connection.closed:
+						self.write(connection)
+		self.searcher.shutdown(wait=False)
+		for key in list(self.selector.get_map().values()):
+			if isinstance(key.data, Connection):
+				self.close(key.data)
+		self.selector.close()
+		self.sock.close()
+		self.wakeup.close()
+		self.wakeupWriter.close()
+		if self.path is not None:
 			try:
-				s, comm_addr = self.sock.recvfrom(128)
-			except:
-				s = None
-			if s is not None:
-				print("listener.run(): received '%s'" % s)
-				if b"activate" == s[:8]:
-					print("listener.run(): activating")
-					self.qnotero.sysTray.listenerActivated.emit()
+				os.remove(self.path)
+			except OSError:
+				pass
+
+	def accept(self):
+
+		"""Accepts a new connection"""
+
+		try:
+			sock, address = self.sock.accept()
+		except OSError:
+			return
+		sock.setblocking(False)
+		self.selector.register(sock, selectors.EVENT_READ, Connection(sock))
+
+	def close(self, connection):
+
+		"""
+		Closes a connection
+
+		Arguments:
+		connection -- a Connection
+		"""
+
+		self.selector.unregister(connection.sock)
+		connection.sock.close()
+		connection.closed = True
+
+	def read(self, connection):
+
+		"""
+		Reads from a connection, and handles all commands that have been
+		received completely
+
+		Arguments:
+		connection -- a Connection
+		"""
+
+		try:
+			data = connection.sock.recv(65536)
+		except (BlockingIOError, InterruptedError):
+			return
+		except OSError:
+			data = b""
+		if not data:
+			connection.closing = True
+			if not connection.pending and not connection.replies:
+				self.close(connection)
+			return
+		connection.received += data
+		while len(connection.received) >= header.size:
+			size, = header.unpack_from(connection.received)
+			if size > max_message_size:
+				print(u"listener.read(): message too long")
+				self.close(connection)
+				return
+			if len(connection.received) < header.size + size:
+				break
+			message = bytes(connection.received[header.size:header.size + size])
+			del connection.received[:header.size + size]
+			future = self.dispatch(message.decode(u"utf-8", u"replace"))
+			connection.replies.append(future)
+			if not future.done():
+				future.add_done_callback(
+					lambda future, connection=connection:
+					self.replyReady(connection))
+		self.sendReplies(connection)
+
+	def dispatch(self, message):
+
+		"""
+		Starts executing a command. Searches run in a worker thread, and
+		other commands right away.
+
+		Arguments:
+		message -- the command, possibly followed by an argument
+
+		Returns:
+		A Future of the reply
+		"""
+
+		if message.strip().partition(u" ")[0] == u"search":
+			return self.searcher.submit(self.handle, message)
+		future = Future()
+		future.set_result(self.handle(message))
+		return future
+
+	def replyReady(self, connection):
+
+		"""
+		Is called in a worker thread when a reply has become available, and
+		wakes up the listener thread to send it
+
+		Arguments:
+		connection -- a Connection
+		"""
+
+		self.ready.append(connection)
+		try:
+			self.wakeupWriter.send(b"\0")
+		except OSError:
+			pass
+
+	def sendReplies(self, connection):
+
+		"""
+		Sends the replies that are available, in the order of the commands
+
+		Arguments:
+		connection -- a Connection
+		"""
+
+		while connection.replies and connection.replies[0].done():
+			future = connection.replies.popleft()
+			if future.exception() is not None:
+				reply = {u"error": str(future.exception())}
+			else:
+				reply = future.result()
+			reply = json.dumps(reply).encode(u"utf-8")
+			connection.pending += header.pack(len(reply)) + reply
+		if connection.pending:
+			self.write(connection)
+		elif connection.closing and not connection.replies:
+			self.close(connection)
+
+	def write(self, connection):
+
+		"""
+		Sends as much of the pending replies as possible
+
+		Arguments:
+		connection -- a Connection
+		"""
+
+		try:
+			sent = connection.sock.send(connection.pending)
+		except (BlockingIOError, InterruptedError):
+			sent = 0
+		except OSError:
+			self.close(connection)
+			return
+		del connection.pending[:sent]
+		if connection.pending:
+			self.selector.modify(connection.sock, selectors.EVENT_READ |
+				selectors.EVENT_WRITE, connection)
+		elif connection.closing and not connection.replies:
+			self.close(connection)
+		else:
+			self.selector.modify(connection.sock, selectors.EVENT_READ,
+				connection)
+
+	def handle(self, message):
+
+		"""
+		Executes a command
+
+		Arguments:
+		message -- the command, possibly followed by an argument
+
+		Returns:
+		A reply, which can be converted to JSON
+		"""
 
+		print(u"listener.handle(): received '%s'" % message)
+		command, _, argument = message.strip().partition(u" ")
+		if self.qnotero is None:
+			return {u"error": u"Qnotero is starting"}
+		try:
+			if command == u"activate":
+				self.qnotero.sysTray.listenerActivated.emit()
+				return {u"ok": True}
+			if command == u"search":
+				results = self.qnotero.zotero.search(argument,
+					limit=self.maxResults)
+				return {u"total": results.total,
+					u"results": [zoteroItem.as_dict() for zoteroItem in results]}
+			if command == u"reindex":
+				self.qnotero.indexer.update()
+				return {u"ok": True}
+			if command == u"stats":
+				return self.qnotero.zotero.stats()
+		except Exception as e:
+			print(u"listener.handle(): %s" % e)
+			return {u"error": str(e)}
+		return {u"error": u"unknown command '%s'" % command}
@@ -0,0 +1,134 @@
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+
+
+class NoteFetcher(object):
+
+	"""
+	Looks up the notes of results in background threads, so that the GUI
+	doesn't wait for the note provider
+	"""
+
+	def __init__(self, qnotero, workers=2):
+
+		"""
+		Constructor
+
+		Arguments:
+		qnotero -- a Qnotero instance
+
+		Keyword arguments:
+		workers -- the number of threads that look up notes (default=2)
+		"""
+
+		self.qnotero = qnotero
+		self.executor = ThreadPoolExecutor(max_workers=workers)
+		# The lookups that have not finished yet, by item id
+		self.pending = {}
+		# Cancelling a lookup calls done() in the same thread, so the lock
+		# needs to be reentrant
+		self.lock = RLock()
+
+	def note(self, zoteroItem):
+
+		"""
+		Retrieves the note of an item, if it is known already. Otherwise,
+		the note is looked up in the background, and noteFound is emitted
+		when it is known.
+
+		Arguments:
+		zoteroItem -- a zoteroItem
+
+		Returns:
+		A note, or None if the item has no note or if the note is not known
+		yet
+		"""
+
+		if zoteroItem.note != -1:
+			return zoteroItem.note
+		self.fetch([zoteroItem], cancel=False)
+		return None
+
+	def fetch(self, zoteroItems, cancel=True):
+
+		"""
+		Looks up the notes of items in the background.
+
+		Arguments:
+		zoteroItems -- a list of zoteroItems
+
+		Keyword arguments:
+		cancel -- indicates whether lookups for other items that have not
+				  started yet should be cancelled, e.g. because these items
+				  have been scrolled out of view (default=True)
+		"""
+
+		if self.qnotero.noteProvider is None:
+			return
+		itemIds = set(zoteroItem.id for zoteroItem in zoteroItems)
+		with self.lock:
+			for itemId, future in list(self.pending.items()):
+				if cancel and itemId not in itemIds:
+					future.cancel()
+			for zoteroItem in zoteroItems:
+				# Skip items whose note is known, or is being looked up
+				if zoteroItem.note != -1 or zoteroItem.id in self.pending:
+					continue
+				future = self.executor.submit(zoteroItem.get_note)
+				self.pending[zoteroItem.id] = future
+				future.add_done_callback(
+					lambda future, zoteroItem=zoteroItem:
+					self.done(zoteroItem, future))
+
+	def cancel(self):
+
+		"""Cancels all lookups that have not started yet"""
+
+		self.fetch([])
+
+	def done(self, zoteroItem, future):
+
+		"""
+		Is called when a lookup has finished or has been cancelled, in the
+		thread that did the lookup or cancelled it
+
+		Arguments:
+		zoteroItem -- the zoteroItem
+		future -- the Future of the lookup
+		"""
+
+		with self.lock:
+			if self.pending.get(zoteroItem.id) is future:
+				del self.pending[zoteroItem.id]
+		if future.cancelled():
+			return
+		if future.exception() is not None:
+			print(u"noteFetcher.done(): failed to look up note: %s"
+				% future.exception())
+			# Don't try again for this item
+			zoteroItem.note = None
+		self.qnotero.noteFound.emit(zoteroItem.id)
+
+	def stop(self):
+
+		"""Stops the note fetcher"""
+
+		self.cancel()
+		self.executor.shutdown(wait=False)
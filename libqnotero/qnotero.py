@@ -20,21 +20,30 @@
 
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
 from libqnotero.qt import QtGui, QtCore
 from libqnotero.qt.QtGui import QMainWindow, QDesktopWidget, QMessageBox, QMenu
-from libqnotero.qt.QtCore import QSettings, QCoreApplication, QObject, QEvent
+from libqnotero.qt.QtCore import QSettings, QCoreApplication, QObject, QEvent, \
+    pyqtSignal
 from libqnotero.sysTray import SysTray
 from libqnotero.config import saveConfig, restoreConfig, getConfig
 from libqnotero.qnoteroItemDelegate import QnoteroItemDelegate
-from libqnotero.qnoteroItem import QnoteroItem
+from libqnotero.qnoteroModel import QnoteroModel
 from libqnotero.uiloader import UiLoader
-from libzotero.libzotero import LibZotero
+from libqnotero.indexer import Indexer
+from libqnotero.noteFetcher import NoteFetcher
+from libqnotero.watcher import Watcher
+from libzotero.libzotero import LibZotero, searches_fulltext
 
 
 class Qnotero(QMainWindow, UiLoader):
     """The main class of the Qnotero GUI"""
 
     version = '2.3.0'
+    indexUpdated = pyqtSignal()
+    noteFound = pyqtSignal(int)
+    fulltextSearchFinished = pyqtSignal(str, object, bool)
 
     def __init__(self, app=None, systray=True, debug=False, reset=False, parent=None):
 
@@ -51,10 +60,27 @@ class Qnotero(QMainWindow, UiLoader):
         QMainWindow.__init__(self, parent)
         self.app = app
         self.loadUi('qnotero')
+        self.ui.listWidgetResults.setModel(QnoteroModel(self))
         if not reset:
             self.restoreState()
         self.debug = debug
+        # The number of results that is shown at once
+        self.pageSize = 50
+        self.indexer = Indexer(self)
+        self.watcher = Watcher(self)
+        self.indexUpdated.connect(self.refresh)
+        self.noteFetcher = NoteFetcher(self)
+        self.noteFound.connect(self.updateNoteHint)
+        # Full-text terms are looked up in the attachments, which can take a
+        # while, also if the database is locked by Zotero, so these searches
+        # run in the background. Only the latest one is of interest, and the
+        # others are cancelled.
+        self.fulltextSearcher = ThreadPoolExecutor(max_workers=1)
+        self.fulltextSearch = Event()
+        self.fulltextSearchFinished.connect(self.showResults)
+        self.zotero = None
         self.reInit()
+        self.indexer.start()
         self.noResults()
         if systray:
             self.sysTray = SysTray(self)
@@ -90,7 +116,12 @@ class Qnotero(QMainWindow, UiLoader):
         else:
             e.accept()
             if self.listener is not None:
-                self.listener.alive = False
+                self.listener.stop()
+            self.indexer.stop()
+            self.noteFetcher.stop()
+            self.fulltextSearch.set()
+            self.fulltextSearcher.shutdown(wait=True)
+            self.zotero.close()
             print(u'qnotero.closeEvent(): Exiting Qnotero, bye...')
             sys.exit()
 
@@ -200,9 +231,11 @@ class Qnotero(QMainWindow, UiLoader):
 
         self.setTheme()
         self.setupUi()
-        self.noteProvider = []
+        self.noteProvider = None
+        self.noteFetcher.cancel()
+        self.fulltextSearch.set()
         self.noResults()
-        self.ui.listWidgetResults.clear()
+        self.ui.listWidgetResults.model().clear()
         self.ui.textAbstract.setText(u'')
         self.ui.lineEditQuery.clear()
         self.ui.listWidgetResults.installEventFilter(self)
@@ -210,10 +243,35 @@ class Qnotero(QMainWindow, UiLoader):
             from libzotero._noteProvider.gnoteProvider import GnoteProvider
             print(u"qnotero.reInit(): using GnoteProvider")
             self.noteProvider = GnoteProvider(self)
-        self.zotero = LibZotero(getConfig(u"zoteroPath"), self.noteProvider)
+        elif getConfig(u'noteProvider') == u'markdown':
+            from libzotero._noteProvider.mdNoteProvider import MdNoteProvider
+            print(u"qnotero.reInit(): using MdNoteProvider")
+            self.noteProvider = MdNoteProvider(
+                getConfig(u"mdNoteproviderPath"))
+        if self.zotero is not None:
+            self.zotero.close()
+        # The index is loaded from a snapshot, and updated in the background
+        self.zotero = LibZotero(getConfig(u"zoteroPath"), self.noteProvider,
+                                auto_update=False,
+                                zotero_access=getConfig(u"zoteroAccess"))
+        self.watcher.setZoteroPath(getConfig(u"zoteroPath"))
+        self.indexer.update()
         if hasattr(self, u"sysTray"):
             self.sysTray.setIcon(self.theme.icon("qnotero", ".png"))
 
+    def refresh(self):
+
+        """Repeats the current search after the index has been updated"""
+
+        # Rows may have been rendered for items that have changed
+        self.ui.listWidgetResults.itemDelegate().clearCache()
+        if not self.isVisible() or not self.ui.listWidgetResults.isVisible():
+            return
+        if len(self.ui.lineEditQuery.text()) < getConfig(u"minQueryLength"):
+            return
+        print(u"qnotero.refresh(): refreshing results")
+        self.search()
+
     def restoreState(self):
 
         """Restore the settings"""
@@ -244,22 +302,79 @@ class Qnotero(QMainWindow, UiLoader):
 
         self.ui.labelNoteAvailable.hide()
         self.ui.listWidgetResults.show()
-        self.ui.listWidgetResults.clear()
+        self.ui.listWidgetResults.model().clear()
         self.ui.lineEditQuery.needUpdate = False
         self.ui.lineEditQuery.timer.stop()
+        # A full-text search that is still running is for an older query
+        self.fulltextSearch.set()
         query = self.ui.lineEditQuery.text()
         if len(query) < getConfig(u"minQueryLength"):
             self.noResults()
             return
-        zoteroItemList = self.zotero.search(query)
+        # Only the first page of results is shown, and the next pages are
+        # added when the user scrolls down
+        if not searches_fulltext(query):
+            zoteroItemList = self.zotero.search(query, limit=self.pageSize)
+            self.showResults(query, zoteroItemList, setFocus)
+            return
+        self.showResultMsg(u"Searching attachments for %s ..." % query)
+        self.fulltextSearch = cancel = Event()
+        zotero = self.zotero
+        future = self.fulltextSearcher.submit(zotero.search, query,
+                                            limit=self.pageSize,
+                                            cancel=cancel)
+        future.add_done_callback(
+            lambda future: self.fulltextSearchDone(query, future, cancel,
+                                                 setFocus))
+
+    def fulltextSearchDone(self, query, future, cancel, setFocus):
+
+        """
+		Is called in the background thread when a full-text search has
+		finished, and passes the results on to the GUI thread
+
+		Arguments:
+		query -- the query
+		future -- the Future of the search
+		cancel -- the Event that cancels the search
+		setFocus -- indicates whether the listWidgetResults needs to receive
+					focus
+		"""
+
+        if cancel.is_set() or future.cancelled():
+            return
+        if future.exception() is not None:
+            print(u"qnotero.fulltextSearchDone(): search failed: %s"
+                  % future.exception())
+            return
+        self.fulltextSearchFinished.emit(query, future.result(), setFocus)
+
+    def showResults(self, query, zoteroItemList, setFocus=False):
+
+        """
+		Shows the results of a search
+
+		Arguments:
+		query -- the query
+		zoteroItemList -- the SearchResults of the query
+
+		Keyword arguments:
+		setFocus -- indicates whether the listWidgetResults needs to receive
+					focus (default=False)
+		"""
+
+        # The query may have changed while the attachments were searched
+        if query != self.ui.lineEditQuery.text():
+            return
         if len(zoteroItemList) == 0:
+            if len(self.zotero.index) == 0:
+                self.showResultMsg(u"Indexing your Zotero library ...")
+                return
             self.noResults(query)
             return
-        self.showResultMsg(u"%d results for %s" % (len(zoteroItemList), query))
-        for zoteroItem in zoteroItemList:
-            qnoteroItem = QnoteroItem(self, zoteroItem,
-                                      self.ui.listWidgetResults)
-            self.ui.listWidgetResults.addItem(qnoteroItem)
+        self.showResultMsg(u"%d results for %s" % (zoteroItemList.total,
+                                                   query))
+        self.ui.listWidgetResults.model().setResults(query, zoteroItemList)
         if setFocus:
             self.ui.listWidgetResults.setFocus()
 
@@ -334,32 +449,44 @@ class Qnotero(QMainWindow, UiLoader):
             actCopyAbs = contextMenu.addAction(u"Copy abstract")
             actCopyRef = contextMenu.addAction(u"Copy Reference")
             action = contextMenu.exec_(self.mapToGlobal(e.pos()))
-            item = source.itemAt(e.pos())
-            if (action is None) or (item is None):
+            zoteroItem = source.model().zoteroItem(source.indexAt(e.pos()))
+            if (action is None) or (zoteroItem is None):
                 return True
             clipboard = QtGui.QApplication.clipboard()
             clipboard.clear(mode=clipboard.Clipboard)
             if action is actCopyAuthordate:
-                clipboard.setText(item.zoteroItem.author_date_format(), mode=clipboard.Clipboard)
+                clipboard.setText(zoteroItem.author_date_format(), mode=clipboard.Clipboard)
                 return True
             elif action is actCopyDOI:
-                if item.zoteroItem.doi is not None:
-                    clipboard.setText(item.zoteroItem.doi, mode=clipboard.Clipboard)
+                if zoteroItem.doi is not None:
+                    clipboard.setText(zoteroItem.doi, mode=clipboard.Clipboard)
                 return True
             elif action is actCopyTitle:
-                title = item.zoteroItem.format_title()
+                title = zoteroItem.format_title()
                 if title is not None:
                     clipboard.setText(title, mode=clipboard.Clipboard)
                 return True
             elif action is actCopyAbs:
-                if item.zoteroItem.abstract is not None:
-                    clipboard.setText(item.zoteroItem.abstract, mode=clipboard.Clipboard)
+                if zoteroItem.abstract is not None:
+                    clipboard.setText(zoteroItem.abstract, mode=clipboard.Clipboard)
                 return True
             elif action is actCopyRef:
-                clipboard.setText(item.zoteroItem.full_format(), mode=clipboard.Clipboard)
+                clipboard.setText(zoteroItem.full_format(), mode=clipboard.Clipboard)
                 return True
         return QMainWindow.eventFilter(self, source, e)
 
+    def updateNoteHint(self, itemId):
+
+        """
+		Repaints the results after a note has been looked up, so that the
+		note hint is shown if the mouse is over the item
+
+		Arguments:
+		itemId -- the id of the item whose note has been looked up
+		"""
+
+        self.ui.listWidgetResults.viewport().update()
+
     def updateCheck(self):
 
         """Checks for updates if update checking is on."""
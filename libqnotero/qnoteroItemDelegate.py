@@ -18,10 +18,12 @@
 
 #
 
+from collections import OrderedDict
 from libqnotero.qt.QtGui import QStyledItemDelegate, QStyle, QTextDocument
 from libqnotero.qt.QtGui import QFont, QFontMetrics, QAbstractTextDocumentLayout
-from libqnotero.qt.QtCore import Qt, QRect, QSize
-from libzotero.zotero_item import cache as zoteroCache
+from libqnotero.qt.QtGui import QPixmap, QPainter
+from libqnotero.qt.QtCore import Qt, QRect, QSize, QPoint
+from libqnotero.config import getConfig
 
 
 class QnoteroItemDelegate(QStyledItemDelegate):
@@ -59,6 +61,12 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 		self.notePixmap = self.qnotero.theme.pixmap(u"note")
 		self.pixmapSize = int(self.pdfPixmap.height()+self.dy/2)
 		self.roundness = self.qnotero.theme.roundness()
+		self.palette = self.qnotero.ui.listWidgetResults.palette()
+		self.themeName = getConfig(u"theme")
+		# Rendered rows, with their size in bytes, of which the least recently
+		# used ones are removed when the cache exceeds maxRowCacheSize
+		self.maxRowCacheSize = 32 * 1024 * 1024
+		self.clearCache()
 
 	def sizeHint(self, option, index):
 
@@ -75,10 +83,18 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 
 		return QSize(0, self.height)
 
+	def clearCache(self):
+
+		"""Forgets all rendered rows, e.g. because the items have changed"""
+
+		self.rowCache = OrderedDict()
+		self.rowCacheSize = 0
+
 	def paint(self, painter, option, index):
 
 		"""
-		Draws the widget
+		Draws the widget. Rows are rendered once into a pixmap, which is
+		reused until the items or the theme change.
 
 		Arguments:
 		painter -- a QPainter
@@ -87,28 +103,75 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 		"""
 
 		# Retrieve the data
-		model = index.model()
-		record = model.data(index)
-		text = record
-		zoteroItem = zoteroCache[text]
-
-		if zoteroItem.fulltext is None:
-			pixmap = self.noPdfPixmap
-		else:
-			pixmap = self.pdfPixmap
+		zoteroItem = index.model().zoteroItem(index)
+		if zoteroItem is None:
+			return
 
 		# Choose the colors
-		self.palette = self.qnotero.ui.listWidgetResults.palette()
 		if option.state & QStyle.State_MouseOver:
-			background = self.palette.Highlight
-			foreground = self.palette.HighlightedText
-			_note = zoteroItem.get_note()
+			state = u"hover"
+			# Notes are looked up in the background, and the row is painted
+			# again once the note is known
+			_note = self.qnotero.noteFetcher.note(zoteroItem)
 			if _note is not None:
 				self.qnotero.showNoteHint()
 			else:
 				self.qnotero.hideNoteHint()
-
 		elif option.state & QStyle.State_Selected:
+			state = u"selected"
+		else:
+			state = u"normal"
+
+		device = painter.device()
+		if hasattr(device, u"devicePixelRatioF"):
+			dpr = device.devicePixelRatioF()
+		else:
+			dpr = 1
+		size = option.rect.size()
+		key = zoteroItem.id, size.width(), size.height(), state, \
+			self.themeName, dpr
+		rowPixmap = self.rowCache.get(key)
+		if rowPixmap is not None:
+			self.rowCache.move_to_end(key)
+		else:
+			rowPixmap = QPixmap(size * dpr)
+			rowPixmap.setDevicePixelRatio(dpr)
+			rowPixmap.fill(Qt.transparent)
+			rowPainter = QPainter(rowPixmap)
+			rowPainter.setRenderHints(painter.renderHints())
+			rowPainter.setFont(painter.font())
+			self.drawRow(rowPainter, QRect(QPoint(0, 0), size), zoteroItem,
+				state)
+			rowPainter.end()
+			self.rowCache[key] = rowPixmap
+			self.rowCacheSize += rowPixmap.width() * rowPixmap.height() * 4
+			while self.rowCacheSize > self.maxRowCacheSize and \
+				len(self.rowCache) > 1:
+				_key, _pixmap = self.rowCache.popitem(last=False)
+				self.rowCacheSize -= _pixmap.width() * _pixmap.height() * 4
+		painter.drawPixmap(option.rect.topLeft(), rowPixmap)
+
+	def drawRow(self, painter, rect, zoteroItem, state):
+
+		"""
+		Draws a single row
+
+		Arguments:
+		painter -- a QPainter
+		rect -- the QRect of the row
+		zoteroItem -- the zoteroItem of the row
+		state -- "hover", "selected", or "normal"
+		"""
+
+		if zoteroItem.fulltext is None:
+			pixmap = self.noPdfPixmap
+		else:
+			pixmap = self.pdfPixmap
+
+		if state == u"hover":
+			background = self.palette.Highlight
+			foreground = self.palette.HighlightedText
+		elif state == u"selected":
 			background = self.palette.Dark
 			foreground = self.palette.WindowText
 		else:
@@ -116,20 +179,19 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 			foreground = self.palette.WindowText
 
 		# Draw the frame
-		_rect = option.rect.adjusted(self._margin, self._margin,
+		_rect = rect.adjusted(self._margin, self._margin,
 			- int(2*self._margin), -self._margin)
 		pen = painter.pen()
 		pen.setColor(self.palette.color(background))
 		painter.setPen(pen)
 		painter.setBrush(self.palette.brush(background))
 		painter.drawRoundedRect(_rect, self.roundness, self.roundness)
-		font = painter.font
 		pen = painter.pen()
 		pen.setColor(self.palette.color(foreground))
 		painter.setPen(pen)
 
 		# Draw icon
-		_rect = QRect(option.rect)
+		_rect = QRect(rect)
 		_rect.moveBottom(int(_rect.bottom() + self.dy/2))
 		_rect.moveLeft(int(_rect.left() + self.dy/2))
 		_rect.setHeight(self.pixmapSize)
@@ -138,17 +200,13 @@ class QnoteroItemDelegate(QStyledItemDelegate):
 
 		# Draw the text
 		painter.save()
-		_rect = option.rect.adjusted(int(self.pixmapSize+self.dy/2), int(self.dy/2),
+		_rect = rect.adjusted(int(self.pixmapSize+self.dy/2), int(self.dy/2),
 									 -self.dy, 0)
 
-		f = [self.tagFont, self.italicFont, self.regularFont,
-			 self.boldFont]
 		itemText = zoteroItem.full_formatHTML()
 		textRenderer = QTextDocument()
 		context = QAbstractTextDocumentLayout.PaintContext()
 		textRenderer.setHtml(itemText)
 		painter.translate(_rect.topLeft())
 		textRenderer.documentLayout().draw(painter, context)
-		_rect = _rect.adjusted(0, self.dy, 0, 0)
 		painter.restore()
-
@@ -0,0 +1,187 @@
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from array import array
+from libqnotero.qt.QtCore import Qt, QAbstractListModel, QModelIndex
+
+
+class QnoteroModel(QAbstractListModel):
+
+	"""
+	The results of the current search. Only the results that have been
+	retrieved are stored, and further pages of results are retrieved when the
+	view scrolls down to them. All pages are taken from the results of the
+	first search, so that they fit together also if the library is reindexed
+	while the view scrolls.
+	"""
+
+	# The role under which the zoteroItem of a row is available
+	ZoteroItemRole = Qt.UserRole
+
+	def __init__(self, qnotero):
+
+		"""
+		Constructor
+
+		Arguments:
+		qnotero -- a Qnotero instance
+		"""
+
+		QAbstractListModel.__init__(self, qnotero)
+		self.qnotero = qnotero
+		self.query = None
+		self.results = None
+		self.zoteroItems = {}
+		self.ids = array(u"i")
+		self.total = 0
+
+	def clear(self):
+
+		"""Removes all results"""
+
+		self.beginResetModel()
+		self.query = None
+		self.results = None
+		self.zoteroItems = {}
+		self.ids = array(u"i")
+		self.total = 0
+		self.endResetModel()
+
+	def setResults(self, query, zoteroItemList):
+
+		"""
+		Replaces the results
+
+		Arguments:
+		query -- the query for which the results were found
+		zoteroItemList -- the first page of results, as returned by
+						  LibZotero.search()
+		"""
+
+		self.beginResetModel()
+		self.query = query
+		self.results = zoteroItemList
+		self.zoteroItems = dict((zoteroItem.id, zoteroItem) for zoteroItem
+			in zoteroItemList)
+		self.ids = array(u"i", [zoteroItem.id for zoteroItem in
+			zoteroItemList])
+		self.total = zoteroItemList.total
+		self.endResetModel()
+
+	def zoteroItem(self, index):
+
+		"""
+		Arguments:
+		index -- a QModelIndex
+
+		Returns:
+		The zoteroItem of a row, or None if the index is invalid
+		"""
+
+		if not index.isValid() or index.row() >= len(self.ids):
+			return None
+		return self.zoteroItems.get(self.ids[index.row()])
+
+	def rowCount(self, parent=QModelIndex()):
+
+		"""
+		Arguments:
+		parent -- a QModelIndex
+
+		Returns:
+		The number of results that have been retrieved
+		"""
+
+		if parent.isValid():
+			return 0
+		return len(self.ids)
+
+	def data(self, index, role=Qt.DisplayRole):
+
+		"""
+		Arguments:
+		index -- a QModelIndex
+
+		Keyword arguments:
+		role -- a Qt.ItemDataRole (default=Qt.DisplayRole)
+
+		Returns:
+		The data of a row for the role
+		"""
+
+		zoteroItem = self.zoteroItem(index)
+		if zoteroItem is None:
+			return None
+		if role == Qt.DisplayRole:
+			return zoteroItem.simple_format()
+		if role == self.ZoteroItemRole:
+			return zoteroItem
+		return None
+
+	def flags(self, index):
+
+		"""
+		Arguments:
+		index -- a QModelIndex
+
+		Returns:
+		The Qt.ItemFlags of a row
+		"""
+
+		if not index.isValid():
+			return Qt.NoItemFlags
+		return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+	def canFetchMore(self, parent):
+
+		"""
+		Arguments:
+		parent -- a QModelIndex
+
+		Returns:
+		True if not all results have been retrieved yet
+		"""
+
+		return not parent.isValid() and self.query is not None and \
+			len(self.ids) < self.total
+
+	def fetchMore(self, parent):
+
+		"""
+		Retrieves the next page of results
+
+		Arguments:
+		parent -- a QModelIndex
+		"""
+
+		if not self.canFetchMore(parent):
+			return
+		# Searching again would skip or repeat results if the library has been
+		# reindexed in the meantime, and for full-text queries would block the
+		# GUI, so the next page is taken from the results of the first search
+		zoteroItemList = self.results.page(len(self.ids),
+			self.qnotero.pageSize)
+		if len(zoteroItemList) == 0:
+			self.total = len(self.ids)
+			return
+		for zoteroItem in zoteroItemList:
+			self.zoteroItems[zoteroItem.id] = zoteroItem
+		self.beginInsertRows(QModelIndex(), len(self.ids),
+			len(self.ids) + len(zoteroItemList) - 1)
+		self.ids.extend(zoteroItem.id for zoteroItem in zoteroItemList)
+		self.endInsertRows()
@@ -55,10 +55,10 @@ class QnoteroQuery(QLineEdit):
 		if e.key() == Qt.Key_Down:
 			if self.needUpdate:
 				self.qnotero.search(setFocus=True)
-			elif self.qnotero.ui.listWidgetResults.count() > 0:
+			elif self.qnotero.ui.listWidgetResults.model().rowCount() > 0:
 				self.qnotero.ui.listWidgetResults.setFocus()
-			self.qnotero.ui.listWidgetResults.setCurrentItem(
-				self.qnotero.ui.listWidgetResults.item(0))
+			self.qnotero.ui.listWidgetResults.setCurrentIndex(
+				self.qnotero.ui.listWidgetResults.model().index(0))
 			return
 
 		QLineEdit.keyPressEvent(self, e)
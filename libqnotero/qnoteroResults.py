@@ -16,14 +16,14 @@
 
 #
 
-from libqnotero.qt.QtGui import QListWidget, QInputDialog
-from libqnotero.qt.QtCore import Qt
+from libqnotero.qt.QtGui import QListView, QInputDialog
+from libqnotero.qt.QtCore import Qt, QTimer
 import subprocess
 import os
 import platform
 
 
-class QnoteroResults(QListWidget):
+class QnoteroResults(QListView):
     """The Qnotero result list"""
 
     def __init__(self, qnotero):
@@ -35,26 +35,77 @@ class QnoteroResults(QListWidget):
 		qnotero -- a Qnotero instance
 		"""
 
-        QListWidget.__init__(self, qnotero)
-        self.itemDoubleClicked.connect(self.DoubleClicked)
-        self.itemClicked.connect(self.Clicked)
+        QListView.__init__(self, qnotero)
+        # All rows have the same height, so the view doesn't need to measure
+        # every row
+        self.setUniformItemSizes(True)
+        self.doubleClicked.connect(self.DoubleClicked)
+        self.clicked.connect(self.Clicked)
         self.setMouseTracking(True)
+        # Notes are looked up for the visible rows, once the list has
+        # stopped changing for a moment
+        self.prefetchTimer = QTimer(self)
+        self.prefetchTimer.setSingleShot(True)
+        self.prefetchTimer.setInterval(100)
+        self.prefetchTimer.timeout.connect(self.prefetchNotes)
+        self.verticalScrollBar().valueChanged.connect(
+            self.prefetchTimer.start)
 
-    def DoubleClicked(self, item):
+    def setModel(self, model):
+
+        """
+		Sets the model, and looks up notes whenever its rows change
+
+		Arguments:
+		model -- a QnoteroModel
+		"""
+
+        QListView.setModel(self, model)
+        model.modelReset.connect(self.prefetchTimer.start)
+        model.rowsInserted.connect(self.prefetchTimer.start)
+
+    def prefetchNotes(self):
+
+        """Looks up the notes of the visible rows in the background"""
+
+        model = self.model()
+        rect = self.viewport().rect()
+        first = self.indexAt(rect.topLeft()).row()
+        if first < 0:
+            return
+        last = self.indexAt(rect.bottomLeft()).row()
+        if last < 0:
+            last = model.rowCount() - 1
+        zoteroItems = [model.zoteroItem(model.index(row))
+                       for row in range(first, last + 1)]
+        self.qnotero.noteFetcher.fetch([zoteroItem for zoteroItem in
+                                        zoteroItems if zoteroItem is not None])
+
+    def currentZoteroItem(self):
+
+        """
+		Returns:
+		The zoteroItem of the current row, or None if there is no current row
+		"""
+
+        return self.model().zoteroItem(self.currentIndex())
+
+    def DoubleClicked(self, index):
 
         """
 		Open file attachment or URL
 
 		Arguments:
-		item -- a qnoteroItem
+		index -- a QModelIndex
 		"""
 
-        if item is None or not hasattr(item, "zoteroItem"):
+        zoteroItem = self.model().zoteroItem(index)
+        if zoteroItem is None:
             return
-        zoteroItem = item.zoteroItem
         if zoteroItem.fulltext is None and zoteroItem.url is None:
             print('qnoteroResults.mousePressEvent(): no file attachment nor url')
             return
+        self.qnotero.zotero.item_opened(zoteroItem)
         # If there is no a fulltext item open the URL of the entry
         if len(zoteroItem.fulltext) == 0:
             path = zoteroItem.url
@@ -91,16 +142,19 @@ class QnoteroResults(QListWidget):
 		e -- a QKeyEvent
 		"""
 
-        if (e.key() == Qt.Key_Up and self.currentRow() == 0) \
+        if (e.key() == Qt.Key_Up and self.currentIndex().row() == 0) \
                 or (e.key() == Qt.Key_F and Qt.ControlModifier & e.modifiers()):
             self.qnotero.ui.lineEditQuery.selectAll()
             self.qnotero.ui.lineEditQuery.setFocus()
             return
         elif e.key() == Qt.Key_Return or e.key() == Qt.Key_Enter:
-            zoteroItem = self.qnotero.ui.listWidgetResults.currentItem().zoteroItem
+            zoteroItem = self.currentZoteroItem()
+            if zoteroItem is None:
+                return
             if zoteroItem.fulltext is None and zoteroItem.url is None:
                 print('qnoteroResults.mousePressEvent(): no file attachment nor url')
                 return
+            self.qnotero.zotero.item_opened(zoteroItem)
             # If there is no a fulltext item open the URL of the entry
             if len(zoteroItem.fulltext) == 0:
                 path = zoteroItem.url
@@ -128,10 +182,10 @@ class QnoteroResults(QListWidget):
             except Exception as exc:
                 print("qnoteroResults.keyPressEvent(): failed to open file or URL, sorry... %s" % exc)
 
-        QListWidget.keyPressEvent(self, e)
+        QListView.keyPressEvent(self, e)
 
-    def Clicked(self, item):
-        if item is None or not hasattr(item, "zoteroItem"):
+    def Clicked(self, index):
+        zoteroItem = self.model().zoteroItem(index)
+        if zoteroItem is None:
             return
-        zoteroItem = item.zoteroItem
         self.qnotero.ui.textAbstract.setText(zoteroItem.abstract)
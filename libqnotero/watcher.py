@@ -0,0 +1,123 @@
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import os
+import time
+from libqnotero.qt.QtCore import QFileSystemWatcher, QTimer
+
+
+class Watcher(QFileSystemWatcher):
+
+	"""
+	Watches the Zotero folder, and requests an update of the index when the
+	Zotero database changes
+	"""
+
+	# Wait until there have been no changes for this long (in milliseconds),
+	# so that a burst of changes, such as during a sync, leads to a single
+	# update. But don't postpone the update for longer than maxDelay.
+	delay = 1000
+	maxDelay = 10000
+
+	def __init__(self, qnotero):
+
+		"""
+		Constructor
+
+		Arguments:
+		qnotero -- a Qnotero instance
+		"""
+
+		QFileSystemWatcher.__init__(self, qnotero)
+		self.qnotero = qnotero
+		self.zoteroPath = None
+		self.burstStart = None
+		self.timer = QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.timeout.connect(self.update)
+		self.fileChanged.connect(self.changed)
+		self.directoryChanged.connect(self.changed)
+
+	def paths(self):
+
+		"""
+		Returns:
+		The paths that should be watched
+		"""
+
+		if self.zoteroPath is None:
+			return []
+		return [self.zoteroPath,
+			os.path.join(self.zoteroPath, u"zotero.sqlite"),
+			os.path.join(self.zoteroPath, u"zotero.sqlite-wal"),
+			os.path.join(self.zoteroPath, u"storage")]
+
+	def watch(self):
+
+		"""
+		Starts watching the paths that exist. Files that are replaced, rather
+		than modified, are no longer watched, so this needs to be repeated
+		after every change.
+		"""
+
+		watched = self.files() + self.directories()
+		for path in self.paths():
+			if path not in watched and os.path.exists(path):
+				self.addPath(path)
+
+	def setZoteroPath(self, zoteroPath):
+
+		"""
+		Watches another Zotero folder
+
+		Arguments:
+		zoteroPath -- the Zotero folder
+		"""
+
+		watched = self.files() + self.directories()
+		if watched:
+			self.removePaths(watched)
+		self.zoteroPath = zoteroPath
+		self.watch()
+
+	def changed(self, path):
+
+		"""
+		Schedules an update after a file or folder has changed
+
+		Arguments:
+		path -- the path that has changed
+		"""
+
+		self.watch()
+		now = time.time()
+		if self.burstStart is None:
+			self.burstStart = now
+		if 1000 * (now - self.burstStart) >= self.maxDelay:
+			self.update()
+			return
+		self.timer.start(self.delay)
+
+	def update(self):
+
+		"""Requests an update of the index"""
+
+		self.timer.stop()
+		self.burstStart = None
+		print(u"watcher.update(): the Zotero folder has changed")
+		self.qnotero.indexer.update()
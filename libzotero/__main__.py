@@ -0,0 +1,249 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# Searches a Zotero library from the command line, without Qt. Results are
+# written one per line, so that they can be piped into tools such as fzf,
+# rofi, or dmenu. For example:
+#
+#   python -m libzotero search "author:doe 2010"
+#   python -m libzotero search --format tsv neural | fzf
+#   python -m libzotero stats
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import os.path
+import sys
+
+from libzotero.libzotero import LibZotero, parse_query, valid_location
+
+# The columns of the tab-separated output
+tsv_columns = u"key", u"authors", u"date", u"title", u"publication", \
+    u"attachment"
+
+
+def tsv_line(item):
+
+    """
+    Arguments:
+    item		--	A zotero_item.
+
+    Returns:
+    The item as a line of tab-separated values.
+    """
+
+    values = [
+        item.key,
+        u", ".join(item.authors),
+        item.date,
+        item.title,
+        item.publication,
+        item.fulltext[0] if item.fulltext else None,
+        ]
+    return u"\t".join(u"" if value is None else u" ".join(str(value).split())
+                      for value in values)
+
+
+def json_line(item):
+
+    """
+    Arguments:
+    item		--	A zotero_item.
+
+    Returns:
+    The item as a line of JSON.
+    """
+
+    return json.dumps(item.as_dict(), ensure_ascii=False)
+
+
+def open_library(args):
+
+    """
+    Opens a Zotero library, and brings the index up to date. The index is
+    loaded from the snapshot that Qnotero also uses, so that usually only
+    the items that have changed need to be indexed. The snapshot is left to
+    Qnotero, and is not rewritten by one-off searches.
+
+    Arguments:
+    args		--	The parsed command-line arguments.
+
+    Returns:
+    A LibZotero object.
+    """
+
+    zotero = LibZotero(args.zotero_path, auto_update=False,
+                       zotero_access=args.access, update_snapshot=False)
+    zotero.update()
+    return zotero
+
+
+def search(zotero, args, out):
+
+    """
+    Writes the results of a search. A query that consists of a single phrase,
+    such as fulltext:"neural network", is streamed: every item is written as
+    soon as its attachment has been found to contain the phrase, and items
+    are not ordered by relevance. Other queries are ranked first, and then
+    written.
+
+    Arguments:
+    zotero		--	A LibZotero object.
+    args		--	The parsed command-line arguments.
+    out			--	The file to which results are written.
+
+    Returns:
+    The exit status, which is 1 if nothing was found.
+    """
+
+    format_item = tsv_line if args.format == u"tsv" else json_line
+    if args.format == u"tsv" and args.header:
+        out.write(u"\t".join(tsv_columns) + u"\n")
+    query = u" ".join(args.query)
+    terms = parse_query(query)
+    if len(terms) == 1 and terms[0][0] == u"fulltext" and u" " in terms[0][1]:
+        results = itertools.islice(zotero.search_phrase(terms[0][1]),
+                                   args.limit)
+    else:
+        results = zotero.search(query, limit=args.limit)
+    found = False
+    for item in results:
+        found = True
+        out.write(format_item(item) + u"\n")
+        # Lines are passed on right away, so that a tool that reads them
+        # can start showing results
+        out.flush()
+    return 0 if found else 1
+
+
+def stats(zotero, args, out):
+
+    """
+    Writes statistics about the index.
+
+    Arguments:
+    zotero		--	A LibZotero object.
+    args		--	The parsed command-line arguments.
+    out			--	The file to which the statistics are written.
+
+    Returns:
+    The exit status.
+    """
+
+    out.write(json.dumps(zotero.stats()) + u"\n")
+    return 0
+
+
+def parse_args(argv=None):
+
+    """
+    Keyword arguments:
+    argv		--	The command-line arguments, or None to use sys.argv.
+                    (default=None)
+
+    Returns:
+    The parsed command-line arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog=u"python -m libzotero",
+        description=u"Searches a Zotero library.")
+    parser.add_argument(
+        u"--zotero-path",
+        default=os.path.join(os.path.expanduser(u"~"), u"Zotero"),
+        help=u"the Zotero folder, which contains zotero.sqlite "
+             u"(default: ~/Zotero)")
+    parser.add_argument(
+        u"--access", choices=(u"readonly", u"immutable", u"copy"),
+        default=u"readonly",
+        help=u"how the database is opened (default: readonly)")
+    parser.add_argument(
+        u"--verbose", action=u"store_true",
+        help=u"write diagnostic messages to stderr")
+    # add_subparsers() only accepts required=True as of Python 3.7
+    commands = parser.add_subparsers(dest=u"command")
+    parser_search = commands.add_parser(
+        u"search", help=u"search the library, and write one result per line")
+    parser_search.add_argument(
+        u"query", nargs=u"+",
+        help=u'a query, such as author:doe 2010 or fulltext:"neural network"')
+    parser_search.add_argument(
+        u"--format", choices=(u"json", u"tsv"), default=u"json",
+        help=u"write JSON lines, or tab-separated values (default: json)")
+    parser_search.add_argument(
+        u"--header", action=u"store_true",
+        help=u"start tab-separated output with the column names")
+    parser_search.add_argument(
+        u"--limit", type=int, default=None,
+        help=u"the maximum number of results (default: all)")
+    parser_search.set_defaults(handler=search)
+    parser_stats = commands.add_parser(
+        u"stats", help=u"write statistics about the index as JSON")
+    parser_stats.set_defaults(handler=stats)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error(u"a command is required")
+    if not valid_location(args.zotero_path):
+        parser.error(u"%s does not contain zotero.sqlite" % args.zotero_path)
+    return args
+
+
+def main(argv=None):
+
+    """
+    Runs a command.
+
+    Keyword arguments:
+    argv		--	The command-line arguments, or None to use sys.argv.
+                    (default=None)
+
+    Returns:
+    The exit status.
+    """
+
+    args = parse_args(argv)
+    out = sys.stdout
+    # LibZotero reports its progress on stdout, which is reserved for the
+    # results here
+    if args.verbose:
+        log = sys.stderr
+    else:
+        log = open(os.devnull, u"w")
+    try:
+        with contextlib.redirect_stdout(log):
+            zotero = open_library(args)
+            try:
+                return args.handler(zotero, args, out)
+            finally:
+                zotero.close()
+    except BrokenPipeError:
+        # The reader, such as head, has stopped reading. Further output is
+        # discarded, so that Python doesn't complain when it exits.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        if log is not sys.stderr:
+            log.close()
+
+
+# Phrase searches may start worker processes, which import this module again
+if __name__ == u"__main__":
+    sys.exit(main())
@@ -22,6 +22,9 @@ import os
 import os.path
 import re
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 try:
 	import Levenshtein
 except:
@@ -34,8 +37,27 @@ class GnoteProvider(object):
 	for the deprecated gnote.py module
 	"""
 
+	# Headings are bold lines, which start with the name of the first author
+	# and contain the year between parentheses, e.g.
+	# <bold>Doe et al. (2019)</bold>
+	heading = re.compile(r"<bold>([^\n]*)")
+	parenthesized = re.compile(r"\(([^()\n]*)\)")
+	strip_p = re.compile(r"<.*?>")
+	# The number of characters of the author's name by which headings are
+	# indexed
+	key_length = 3
+	# How often the notes folder is checked for changes (in seconds)
+	rescan_interval = 5
+
 	def __init__(self, qnotero):
 
+		# The headings of all notes, by the first characters of the author and
+		# by year, and the (mtime, size, headings) of each note file
+		self.index = {}
+		self.notes = {}
+		self.last_scan = None
+		self.lock = threading.Lock()
+
 		if os.name != "posix":
 			self.path = None
 			return
@@ -55,60 +77,131 @@ class GnoteProvider(object):
 			print("libgnote.__init__(): failed to locate Gnote")
 			self.path = None
 
-	def search(self, item):
+	def parse(self, note_path):
 
 		"""
-		Search gnote for a note matching an author and a year
+		Extracts the headings of a note
+
+		Arguments:
+		note_path -- the path of a note file
+
+		Returns:
+		A list of (key, heading, year offset, preview) tuples, in the order
+		in which they occur in the note
 		"""
 
-		if self.path == None:
-			return None
+		try:
+			with open(note_path, "r", encoding="utf-8", errors="replace") as f:
+				s = f.read()
+		except OSError as e:
+			print("libgnote.parse(): failed to read %s: %s" % (note_path, e))
+			return []
+		headings = []
+		for m in self.heading.finditer(s):
+			heading = m.group(1).lower()
+			content = s[m.start():]
+			content = content[:content.find("</note-content>")]
+			years = set()
+			for y in self.parenthesized.finditer(heading):
+				year = y.group(1)
+				# Only the first occurrence of a year is relevant
+				if year in years:
+					continue
+				years.add(year)
+				# The preview runs until the next heading
+				end = content.find("<bold>", y.end() + 6)
+				if end < 0:
+					pango = s[m.start():]
+				else:
+					pango = content[:end + 6]
+				pango = self.strip_p.sub("", pango)[:1024].strip()
+				headings.append(((heading[:self.key_length], year), heading,
+					y.start(), pango))
+		return headings
+
+	def rescan(self):
 
-		# Compile some regexps to search for the note,
-		# extract the note and remove xml tags
-		p = re.compile(r"<bold>%s.*\(%s\)" % (item.authors[0], item.date), re.IGNORECASE)
-		get_note = re.compile(r"<bold>%s.*?\(%s\).*?<bold>" % (item.authors[0], item.date), re.IGNORECASE and re.DOTALL)
-		strip_p = re.compile('<.*?>')
-		matches = []
+		"""
+		Updates the index with the notes that have been added, changed, or
+		removed since the last scan. Only changed notes are read again.
+		"""
 
-		# Walk through all notes
-		for fnote in os.listdir(self.path):
+		if self.last_scan is not None and \
+			time.time() - self.last_scan < self.rescan_interval:
+			return
+		self.last_scan = time.time()
+		notes = {}
+		changed = []
+		try:
+			entries = list(os.scandir(self.path))
+		except OSError as e:
+			print("libgnote.rescan(): %s" % e)
+			return
+		for entry in entries:
+			if os.path.splitext(entry.name)[1] != ".note":
+				continue
+			try:
+				st = entry.stat()
+			except OSError:
+				continue
+			note = self.notes.get(entry.path)
+			if note is not None and note[0] == st.st_mtime and \
+				note[1] == st.st_size:
+				notes[entry.path] = note
+			else:
+				changed.append((entry.path, st.st_mtime, st.st_size))
+		if not changed and len(notes) == len(self.notes):
+			return
+		# Notes are mostly waiting for the disk, so they are read in parallel
+		with ThreadPoolExecutor(max_workers=4) as executor:
+			for (note_path, mtime, size), headings in zip(changed,
+				executor.map(self.parse, [c[0] for c in changed])):
+				notes[note_path] = mtime, size, headings
+		index = {}
+		for note_path in sorted(notes):
+			for key, heading, year_offset, pango in notes[note_path][2]:
+				index.setdefault(key, []).append(
+					(note_path, heading, year_offset, pango))
+		self.notes = notes
+		self.index = index
+		print("libgnote.rescan(): %d of %d notes read" % (len(changed),
+			len(notes)))
 
-			if os.path.splitext(fnote)[1] == ".note":
+	def search(self, item):
 
-				note_path = os.path.join(self.path, fnote)
+		"""
+		Search gnote for a note matching an author and a year
+		"""
 
-				# Read the contents of the note
-				f = open(note_path, "r")
-				s = f.read()
+		if self.path == None or not item.authors or item.date is None:
+			return None
+
+		with self.lock:
+			self.rescan()
+			index = self.index
 
-				# Search the note according to the regular expression
-				m = p.search(s)
-
-				# If a contains a match
-				if m != None:
-
-					# Extract the matching content
-					s = s[m.span()[0]:]
-					m = get_note.search(s[:s.find("</note-content>")])
-					if m != None:
-						start, end = m.span()
-					else:
-						start = 0
-						end = len(s)
-					pango = s[start:end]
-
-					# Remove tags, strip whitespaces and highlight the
-					# search terms
-					pango = strip_p.sub("", pango)[:1024].strip()
-					for s in (item.authors[0], item.date):
-						try:
-							pango = pango.replace("%s" % s, "<b>%s</b>" % s)
-						except:
-							pass
-
-					# Add this result to the list
-					matches.append(GnoteNote(pango, "gnote --open-note=%s" % note_path))
+		author = item.authors[0].lower()
+		date = item.date.lower()
+		if len(author) >= self.key_length:
+			candidates = index.get((author[:self.key_length], date), [])
+		else:
+			candidates = [heading for key, headings in index.items()
+				if key[1] == date and key[0].startswith(author)
+				for heading in headings]
+		matches = []
+		found = set()
+		for note_path, heading, year_offset, pango in candidates:
+			# The heading should start with the author, and the year should
+			# follow the author. Only the first matching heading of each note
+			# is used.
+			if note_path in found or not heading.startswith(author) or \
+				year_offset < len(author):
+				continue
+			found.add(note_path)
+			# Highlight the search terms
+			for s in (item.authors[0], item.date):
+				pango = pango.replace("%s" % s, "<b>%s</b>" % s)
+			matches.append(GnoteNote(pango, "gnote --open-note=%s" % note_path))
 
 		if len(matches) == 0:
 			return None
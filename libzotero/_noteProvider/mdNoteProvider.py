@@ -0,0 +1,355 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import html
+import json
+import os
+import os.path
+import platform
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from libzotero.zotero_item import normalize
+
+
+class MdNoteProvider(object):
+
+	"""
+	Finds notes in a folder of Markdown or plain-text files. A note belongs
+	to an item if it contains the Zotero key or the DOI of the item, if its
+	citation key (from the front matter or the file name) is the author and
+	year of the item, e.g. doe2019, or if one of its headings starts with
+	the author and contains the year.
+
+	The notes are indexed once, and the index is stored, so that later only
+	the files that have changed need to be read again.
+	"""
+
+	extensions = u".md", u".markdown", u".txt"
+	# How often the notes folder is checked for changes (in seconds)
+	rescan_interval = 10
+	# The maximum length of a note preview
+	preview_length = 1024
+	# Increase this whenever the information that is indexed changes
+	index_version = 1
+
+	front_matter = re.compile(r"\A---[ \t]*\n(.*?)\n(?:---|\.\.\.)[ \t]*(?:\n|\Z)",
+		re.DOTALL)
+	front_matter_field = re.compile(r"^([\w-]+)[ \t]*:[ \t]*(.*?)[ \t]*$",
+		re.MULTILINE)
+	heading = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+	year = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+	word = re.compile(r"\w+")
+	doi = re.compile(r"\b10\.\d{4,9}/[^\s\"'<>\]\)]+")
+	zotero_link = re.compile(
+		r"zotero://select/(?:(?:library|groups/\d+)/)?items/(?:\d+_)?([A-Z0-9]{8})")
+	zotero_key = re.compile(r"^[A-Z0-9]{8}$")
+	cite_fields = u"citekey", u"citation-key", u"citationkey", u"id"
+	key_fields = u"zotero", u"zotero-key", u"zoterokey", u"itemkey", u"key"
+
+	def __init__(self, path, index_path=None):
+
+		"""
+		Constructor.
+
+		Arguments:
+		path		--	The folder that contains the notes.
+
+		Keyword arguments:
+		index_path	--	The file in which the index is stored, or None to
+						use ~/.qnotero.mdindex. (default=None)
+		"""
+
+		if path:
+			self.path = os.path.abspath(os.path.expanduser(path))
+		else:
+			self.path = None
+		if index_path is None:
+			index_path = os.path.join(os.path.expanduser(u"~"),
+				u".qnotero.mdindex")
+		self.index_path = index_path
+		# The (mtime, size, entries) of each note file, by path relative to
+		# the notes folder, and the entries of all notes by key
+		self.notes = None
+		self.index = {}
+		self.last_scan = None
+		# Indicates whether the notes folder has been scanned at least once
+		self.scanned = False
+		self.lock = threading.Lock()
+		print(u"mdNoteProvider.__init__(): notes path is %s" % self.path)
+
+	def parse(self, rel_path):
+
+		"""
+		Extracts the keys by which a note can be found.
+
+		Arguments:
+		rel_path	--	The path of the note, relative to the notes folder.
+
+		Returns:
+		A list of [key, start, end] entries, where key is a string such as
+		"doi:10.1000/xyz", and start and end delimit the part of the note that
+		is shown as preview.
+		"""
+
+		try:
+			with open(os.path.join(self.path, rel_path), u"r",
+				encoding=u"utf-8", errors=u"replace") as f:
+				s = f.read()
+		except OSError as e:
+			print(u"mdNoteProvider.parse(): failed to read %s: %s"
+				% (rel_path, e))
+			return []
+		keys = set()
+		start = 0
+		m = self.front_matter.match(s)
+		if m is not None:
+			start = m.end()
+			for name, value in self.front_matter_field.findall(m.group(1)):
+				name = name.lower()
+				value = value.strip(u"\"'[]@ ")
+				if name in self.cite_fields and value:
+					keys.add(u"cite:" + value.lower())
+				elif name == u"doi" and value:
+					keys.add(u"doi:" + value.lower())
+				elif name in self.key_fields and \
+					self.zotero_key.match(value):
+					keys.add(u"key:" + value)
+		# A file name such as @doe2019.md is taken as a citation key
+		stem = os.path.splitext(os.path.basename(rel_path))[0].lstrip(u"@")
+		keys.add(u"cite:" + stem.lower())
+		for doi in self.doi.findall(s):
+			keys.add(u"doi:" + doi.rstrip(u".,;:").lower())
+		for key in self.zotero_link.findall(s):
+			keys.add(u"key:" + key)
+		entries = [[key, start, len(s)] for key in sorted(keys)]
+		# A heading covers everything until the next heading of the same or a
+		# higher level
+		headings = list(self.heading.finditer(s))
+		for i, h in enumerate(headings):
+			words = self.word.findall(normalize(h.group(2)))
+			if not words:
+				continue
+			end = len(s)
+			for following in headings[i + 1:]:
+				if len(following.group(1)) <= len(h.group(1)):
+					end = following.start()
+					break
+			for year in sorted(set(self.year.findall(h.group(2)))):
+				entries.append([u"heading:%s:%s" % (words[0], year),
+					h.start(), end])
+		return entries
+
+	def load(self):
+
+		"""Reads the stored index, if it belongs to the notes folder"""
+
+		self.notes = {}
+		try:
+			with open(self.index_path, u"r", encoding=u"utf-8") as f:
+				stored = json.load(f)
+		except (OSError, ValueError):
+			return
+		if stored.get(u"version") != self.index_version or \
+			stored.get(u"path") != self.path:
+			return
+		self.notes = dict((rel_path, tuple(note)) for rel_path, note in
+			stored[u"notes"].items())
+
+	def save(self):
+
+		"""
+		Stores the index. The file is replaced atomically, and every process
+		writes its own temporary file, so that two processes that store the
+		index at the same time don't write to the same file.
+		"""
+
+		tmp_path = None
+		try:
+			fd, tmp_path = tempfile.mkstemp(
+				prefix=os.path.basename(self.index_path) + u".",
+				suffix=u".tmp", dir=os.path.dirname(self.index_path))
+			with os.fdopen(fd, u"w", encoding=u"utf-8") as f:
+				json.dump({u"version": self.index_version, u"path": self.path,
+					u"notes": self.notes}, f)
+			os.replace(tmp_path, self.index_path)
+		except OSError as e:
+			print(u"mdNoteProvider.save(): %s" % e)
+			if tmp_path is not None and os.path.exists(tmp_path):
+				os.remove(tmp_path)
+
+	def rescan(self):
+
+		"""
+		Updates the index with the notes that have been added, changed, or
+		removed since the last scan. Only changed notes are read again.
+
+		Only one thread scans the notes folder at a time. Once the folder has
+		been scanned, other threads keep using the current index in the
+		meantime, instead of waiting for the scan.
+		"""
+
+		if self.last_scan is not None and \
+			time.time() - self.last_scan < self.rescan_interval:
+			return
+		if not self.lock.acquire(not self.scanned):
+			return
+		try:
+			if self.last_scan is None or \
+				time.time() - self.last_scan >= self.rescan_interval:
+				self.last_scan = time.time()
+				self.scan()
+				self.scanned = True
+		finally:
+			self.lock.release()
+
+	def scan(self):
+
+		"""Scans the notes folder, and updates the index"""
+
+		if self.notes is None:
+			self.load()
+		notes = {}
+		changed = 0
+		for dirpath, dirnames, filenames in os.walk(self.path):
+			# Skip hidden folders, such as .git and .obsidian
+			dirnames[:] = [d for d in dirnames if not d.startswith(u".")]
+			for filename in filenames:
+				if os.path.splitext(filename)[1].lower() not in \
+					self.extensions:
+					continue
+				path = os.path.join(dirpath, filename)
+				rel_path = os.path.relpath(path, self.path)
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				note = self.notes.get(rel_path)
+				if note is None or note[0] != st.st_mtime or \
+					note[1] != st.st_size:
+					note = st.st_mtime, st.st_size, self.parse(rel_path)
+					changed += 1
+				notes[rel_path] = note
+		if not changed and len(notes) == len(self.notes) and self.index:
+			return
+		index = {}
+		for rel_path in sorted(notes):
+			for key, start, end in notes[rel_path][2]:
+				index.setdefault(key, (rel_path, start, end))
+		self.notes = notes
+		self.index = index
+		print(u"mdNoteProvider.scan(): %d of %d notes read"
+			% (changed, len(notes)))
+		self.save()
+
+	def search(self, item):
+
+		"""
+		Searches for the note of an item.
+
+		Arguments:
+		item		--	A zotero_item.
+
+		Returns:
+		An MdNote, or None if the item has no note.
+		"""
+
+		if self.path is None or not os.path.isdir(self.path):
+			return None
+		self.rescan()
+		index = self.index
+		keys = []
+		if item.key is not None:
+			keys.append(u"key:" + item.key)
+		if item.doi is not None:
+			keys.append(u"doi:" + item.doi.strip().lower())
+		if item.authors and item.date is not None:
+			words = self.word.findall(normalize(item.authors[0]))
+			if words:
+				keys.append(u"cite:%s%s" % (u"".join(words), item.date))
+				keys.append(u"heading:%s:%s" % (words[0], item.date))
+		for key in keys:
+			note = index.get(key)
+			if note is not None:
+				rel_path, start, end = note
+				return MdNote(os.path.join(self.path, rel_path), start, end,
+					item)
+		return None
+
+
+class MdNote(object):
+
+	"""A Markdown or plain-text note"""
+
+	def __init__(self, path, start, end, item):
+
+		"""
+		Constructor.
+
+		Arguments:
+		path		--	The path of the note file.
+		start		--	The start of the part of the note that is previewed.
+		end			--	The end of the part of the note that is previewed.
+		item		--	The zotero_item to which the note belongs.
+		"""
+
+		self.path = path
+		self.start = start
+		self.end = end
+		self.item = item
+		self._preview = None
+
+	@property
+	def preview(self):
+
+		"""
+		Returns:
+		The beginning of the note, with the author and the year of the item
+		highlighted. The note is only read when the preview is needed.
+		"""
+
+		if self._preview is None:
+			try:
+				with open(self.path, u"r", encoding=u"utf-8",
+					errors=u"replace") as f:
+					s = f.read()
+			except OSError as e:
+				print(u"mdNote.preview(): %s" % e)
+				return u""
+			s = s[self.start:self.end][:MdNoteProvider.preview_length].strip()
+			s = html.escape(s, quote=False)
+			for term in self.item.authors[:1] + [self.item.date]:
+				if term:
+					s = s.replace(term, u"<b>%s</b>" % term)
+			self._preview = s.replace(u"\n", u"<br/>")
+		return self._preview
+
+	def open(self):
+
+		"""Opens the note in the default application"""
+
+		if platform.system() == u"Darwin":
+			subprocess.call((u"open", self.path))
+		elif platform.system() == u"Windows":
+			os.startfile(os.path.normpath(self.path))
+		else:
+			subprocess.call((u"xdg-open", self.path))
@@ -0,0 +1,241 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+class FulltextIndex(object):
+
+    """
+    Finds items by the words in the full text of their attachments. Zotero
+    already splits the text of attachments into words, and stores which
+    attachments contain which words in the fulltextWords and
+    fulltextItemWords tables. These tables are only queried when a full-text
+    search is done.
+    """
+
+    # The key of an attachment is the name of the folder in the storage
+    # folder in which it is stored
+    attachment_query = u"""
+        select itemAttachments.itemID, itemAttachments.parentItemID, items.key
+        from itemAttachments, items
+        where items.itemID = itemAttachments.itemID
+            and itemAttachments.parentItemID is not null
+        order by itemAttachments.itemID
+        """
+
+    # Words that start with a term. Zotero stores words in lower case.
+    word_query = u"""
+        select distinct fulltextItemWords.itemID
+        from fulltextWords, fulltextItemWords
+        where fulltextWords.word >= ? and fulltextWords.word < ?
+            and fulltextItemWords.wordID = fulltextWords.wordID
+        """
+
+    def __init__(self, connect, max_terms=64):
+
+        """
+        Constructor.
+
+        Arguments:
+        connect		--	A function that opens the Zotero database.
+
+        Keyword arguments:
+        max_terms	--	The number of terms for which the matching items are
+                        remembered. (default=64)
+        """
+
+        self.connect = connect
+        self.max_terms = max_terms
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+
+        """
+        Forgets everything that has been read from the database, because the
+        database has changed.
+        """
+
+        with self.lock:
+            # The ids of all attachments in ascending order, and the ids of
+            # their parent items and their keys
+            self.attachment_ids = None
+            self.parent_ids = None
+            self.attachment_keys = None
+            self.cache = OrderedDict()
+
+    def load_attachments(self, conn):
+
+        """
+        Reads which attachments belong to which items.
+
+        Arguments:
+        conn		--	An sqlite3 connection.
+        """
+
+        attachment_ids = array(u"i")
+        parent_ids = array(u"i")
+        attachment_keys = []
+        for attachment_id, parent_id, key in conn.execute(
+                self.attachment_query):
+            attachment_ids.append(attachment_id)
+            parent_ids.append(parent_id)
+            attachment_keys.append(key)
+        self.attachment_ids = attachment_ids
+        self.parent_ids = parent_ids
+        self.attachment_keys = attachment_keys
+
+    def position(self, attachment_id):
+
+        """
+        Arguments:
+        attachment_id	--	The id of an attachment.
+
+        Returns:
+        The position of the attachment in attachment_ids, or None for
+        standalone attachments.
+        """
+
+        i = bisect_left(self.attachment_ids, attachment_id)
+        if i < len(self.attachment_ids) and \
+                self.attachment_ids[i] == attachment_id:
+            return i
+        return None
+
+    def lookup(self, term):
+
+        """
+        Finds the attachments that contain a word that starts with a term.
+
+        Arguments:
+        term		--	A search term.
+
+        Returns:
+        An (attachment_ids, item_ids) tuple of sorted arrays, with the ids of
+        the attachments and the ids of the items to which they belong.
+        """
+
+        with self.lock:
+            result = self.cache.get(term)
+            if result is not None:
+                self.cache.move_to_end(term)
+                return result
+            try:
+                conn = self.connect()
+            except Exception as e:
+                print(u"libzotero.fulltext.lookup(): %s" % e)
+                return array(u"i"), array(u"i")
+            try:
+                if self.attachment_ids is None:
+                    self.load_attachments(conn)
+                attachment_ids = []
+                item_ids = set()
+                for attachment_id, in conn.execute(
+                        self.word_query, (term, term + u"\U0010ffff")):
+                    i = self.position(attachment_id)
+                    if i is not None:
+                        attachment_ids.append(attachment_id)
+                        item_ids.add(self.parent_ids[i])
+            finally:
+                conn.close()
+            result = array(u"i", sorted(attachment_ids)), \
+                array(u"i", sorted(item_ids))
+            self.cache[term] = result
+            if len(self.cache) > self.max_terms:
+                self.cache.popitem(last=False)
+            return result
+
+    def search(self, terms):
+
+        """
+        Finds the items that match all full-text terms.
+
+        Arguments:
+        terms		--	A list of full-text search terms.
+
+        Returns:
+        A set of item ids.
+        """
+
+        results = None
+        for term in terms:
+            item_ids = self.lookup(term)[1]
+            if results is None:
+                results = set(item_ids)
+            else:
+                results.intersection_update(item_ids)
+            if not results:
+                break
+        if results is None:
+            return set()
+        return results
+
+    def attachments(self, terms, item_ids=None):
+
+        """
+        Finds the attachments that contain words that start with each of the
+        terms, for example to find the attachments that may contain a phrase.
+        Terms that no attachment contains are ignored, because Zotero may have
+        split the text into words differently.
+
+        Arguments:
+        terms		--	A list of full-text search terms.
+
+        Keyword arguments:
+        item_ids	--	A set of item ids, to only find the attachments of
+                        these items, or None to find the attachments of all
+                        items. (default=None)
+
+        Returns:
+        A list of (item_id, key) tuples.
+        """
+
+        attachment_ids = None
+        for term in terms:
+            term_attachment_ids = self.lookup(term)[0]
+            if not term_attachment_ids:
+                continue
+            if attachment_ids is None:
+                attachment_ids = set(term_attachment_ids)
+            else:
+                attachment_ids.intersection_update(term_attachment_ids)
+        with self.lock:
+            if self.attachment_ids is None:
+                try:
+                    conn = self.connect()
+                except Exception as e:
+                    print(u"libzotero.fulltext.attachments(): %s" % e)
+                    return []
+                try:
+                    self.load_attachments(conn)
+                finally:
+                    conn.close()
+            if attachment_ids is None:
+                positions = range(len(self.attachment_ids))
+            else:
+                positions = [self.position(attachment_id) for attachment_id
+                             in sorted(attachment_ids)]
+            return [(self.parent_ids[i], self.attachment_keys[i])
+                    for i in positions if i is not None and
+                    (item_ids is None or self.parent_ids[i] in item_ids)]
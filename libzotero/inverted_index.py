@@ -0,0 +1,369 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from array import array
+from bisect import bisect_left, insort
+
+from libzotero.suffix_array import SuffixArray
+from libzotero.trigram_index import TrigramIndex, max_distance
+from libzotero.zotero_item import fields, term_fields, fuzzy_fields, \
+    fuzzy_term
+
+
+def item_fields(item):
+
+    """
+    Retrieves the searchable text of an item.
+
+    Arguments:
+    item		--	A zotero_item.
+
+    Returns:
+    A list of (field, text) tuples, with the text in the same form in which
+    zotero_item.match() compares it to search terms.
+    """
+
+    return item.get_search_keys()
+
+
+def item_tokens(item):
+
+    """
+    Splits the searchable text of an item into tokens.
+
+    Arguments:
+    item		--	A zotero_item.
+
+    Returns:
+    A dict with a set of tokens for each field that the item has text for.
+    """
+
+    tokens = {}
+    for field, text in item_fields(item):
+        tokens.setdefault(field, set()).update(text.split())
+    return tokens
+
+
+class InvertedIndex(object):
+
+    """
+    Maps tokens to the ids of the items that contain them, separately for each
+    field.
+
+    Search terms never contain whitespace, so every place where a term occurs
+    in a text lies within a single whitespace-separated token of that text.
+    An item therefore matches a term if and only if one of its tokens
+    contains the term, which gives exactly the same results as
+    zotero_item.match(), without looking at the items themselves.
+    """
+
+    # The number of tokens that can be added after the suffix array has been
+    # built, before it is rebuilt
+    max_new_tokens = 10000
+
+    def __init__(self, items=()):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        items		--	An iterable of zotero_items to index. (default=())
+        """
+
+        postings = dict((field, {}) for field in fields)
+        for item in items:
+            for field, tokens in item_tokens(item).items():
+                field_postings = postings[field]
+                for token in tokens:
+                    if token in field_postings:
+                        field_postings[token].append(item.id)
+                    else:
+                        field_postings[token] = [item.id]
+        self.postings = {}
+        vocabulary = set()
+        for field, field_postings in postings.items():
+            self.postings[field] = dict(
+                (token, array(u"i", item_ids))
+                for token, item_ids in field_postings.items())
+            vocabulary.update(field_postings)
+        # All tokens in sorted order, so that tokens that start with a term
+        # are adjacent.
+        self.vocabulary = sorted(vocabulary)
+        # Remembers which tokens contain recently searched terms. When a term
+        # is extended while typing, only the tokens that contained the
+        # shorter term need to be considered.
+        self.token_cache = {}
+        # The postings that this index doesn't share with other indices, and
+        # that can therefore be modified in place
+        self.owned = None
+        # The words of the fuzzy fields, for fuzzy searches. This index is
+        # only built when it is first needed.
+        self.trigrams = None
+        # A suffix array of the vocabulary, which finds the tokens that
+        # contain a term without scanning the vocabulary. It is built by
+        # prepare(), and until then the vocabulary is scanned.
+        self.suffix_array = None
+
+    def copy(self):
+
+        """
+        Creates a copy of the index, which can be modified without affecting
+        the original. Postings are shared until they are modified.
+
+        Returns:
+        An InvertedIndex.
+        """
+
+        index = InvertedIndex()
+        index.postings = dict((field, dict(field_postings))
+                              for field, field_postings in
+                              self.postings.items())
+        index.vocabulary = list(self.vocabulary)
+        index.owned = set()
+        # Words are only ever added to a trigram index, so it can be shared
+        index.trigrams = self.trigrams
+        if self.suffix_array is not None:
+            index.suffix_array = self.suffix_array.copy()
+        return index
+
+    def _own(self, field, token):
+
+        """
+        Makes sure that the postings for a token are not shared with another
+        index.
+
+        Arguments:
+        field		--	A field.
+        token		--	A token.
+
+        Returns:
+        An array of item ids, or None if the token doesn't occur in the field.
+        """
+
+        item_ids = self.postings[field].get(token)
+        if item_ids is not None and self.owned is not None and \
+                (field, token) not in self.owned:
+            item_ids = self.postings[field][token] = array(u"i", item_ids)
+            self.owned.add((field, token))
+        return item_ids
+
+    def add(self, item):
+
+        """
+        Adds an item to the index.
+
+        Arguments:
+        item		--	A zotero_item.
+        """
+
+        for field, tokens in item_tokens(item).items():
+            field_postings = self.postings[field]
+            if self.trigrams is not None and field in fuzzy_fields:
+                for token in tokens:
+                    self.trigrams.add(token)
+            for token in tokens:
+                item_ids = self._own(field, token)
+                if item_ids is not None:
+                    item_ids.append(item.id)
+                else:
+                    field_postings[token] = array(u"i", [item.id])
+                    if self.owned is not None:
+                        self.owned.add((field, token))
+                    i = bisect_left(self.vocabulary, token)
+                    if i == len(self.vocabulary) or \
+                            self.vocabulary[i] != token:
+                        insort(self.vocabulary, token)
+                        if self.suffix_array is not None:
+                            self.suffix_array.add(token)
+                        self.token_cache = {}
+
+    def remove(self, item):
+
+        """
+        Removes an item from the index. The item should still have the
+        information with which it was added.
+
+        Arguments:
+        item		--	A zotero_item.
+        """
+
+        for field, tokens in item_tokens(item).items():
+            field_postings = self.postings[field]
+            for token in tokens:
+                item_ids = field_postings.get(token)
+                if item_ids is None or item.id not in item_ids:
+                    continue
+                item_ids = self._own(field, token)
+                item_ids.remove(item.id)
+                if len(item_ids) == 0:
+                    del field_postings[token]
+
+    def matching_tokens(self, term):
+
+        """
+        Finds all tokens that contain a term.
+
+        Arguments:
+        term		--	A search term.
+
+        Returns:
+        A list of tokens.
+        """
+
+        tokens = self.token_cache.get(term)
+        if tokens is not None:
+            return tokens
+        if self.suffix_array is not None:
+            tokens = self.suffix_array.find(term)
+            if len(self.token_cache) >= 64:
+                self.token_cache = {}
+            self.token_cache[term] = tokens
+            return tokens
+        # Tokens that start with the term are found by bisection
+        i = bisect_left(self.vocabulary, term)
+        j = i
+        while j < len(self.vocabulary) and \
+                self.vocabulary[j].startswith(term):
+            j += 1
+        prefix_tokens = self.vocabulary[i:j]
+        # Tokens that contain the term elsewhere are found by scanning the
+        # vocabulary, or only the tokens of a shorter term that the term
+        # contains.
+        candidates = self.vocabulary
+        for cached_term, cached_tokens in self.token_cache.items():
+            if cached_term in term and len(cached_tokens) < len(candidates):
+                candidates = cached_tokens
+        tokens = prefix_tokens + [token for token in candidates
+                                  if term in token
+                                  and not token.startswith(term)]
+        if len(self.token_cache) >= 64:
+            self.token_cache = {}
+        self.token_cache[term] = tokens
+        return tokens
+
+    def lookup(self, term_type, term):
+
+        """
+        Finds all items that match a single search term.
+
+        Arguments:
+        term_type	--	The field to search, or None to search all fields.
+        term		--	A search term.
+
+        Returns:
+        A set of item ids.
+        """
+
+        fuzzy = fuzzy_term(term)
+        if fuzzy is not None:
+            return self.fuzzy_lookup(term_type, fuzzy)
+        item_ids = set()
+        tokens = self.matching_tokens(term)
+        for field in term_fields[term_type]:
+            field_postings = self.postings[field]
+            for token in tokens:
+                if token in field_postings:
+                    item_ids.update(field_postings[token])
+        return item_ids
+
+    def prepare(self):
+
+        """
+        Builds the suffix array and the trigram index, which make later
+        searches faster, but take a while to build. The suffix array is
+        rebuilt if many tokens have been added since it was last built.
+        """
+
+        if self.suffix_array is None or len(self.suffix_array.new_words) > \
+                self.max_new_tokens:
+            self.suffix_array = SuffixArray(self.vocabulary)
+            self.token_cache = {}
+        self.trigram_index()
+
+    def trigram_index(self):
+
+        """
+        Retrieves the trigram index of the words in the fuzzy fields, and
+        builds it if it doesn't exist yet.
+
+        Returns:
+        A TrigramIndex.
+        """
+
+        if self.trigrams is None:
+            words = set()
+            for field in fuzzy_fields:
+                words.update(self.postings[field])
+            self.trigrams = TrigramIndex(sorted(words))
+        return self.trigrams
+
+    def fuzzy_lookup(self, term_type, term):
+
+        """
+        Finds all items that match a single fuzzy search term, in the same
+        way as zotero_item.match().
+
+        Arguments:
+        term_type	--	The field to search, or None to search all fields.
+        term		--	A fuzzy search term without the "~".
+
+        Returns:
+        A set of item ids.
+        """
+
+        item_ids = self.lookup(term_type, term)
+        k = max_distance(term)
+        search_fields = [field for field in term_fields[term_type]
+                         if field in fuzzy_fields]
+        if k == 0 or not search_fields:
+            return item_ids
+        for word, distance in self.trigram_index().similar(term, k):
+            for field in search_fields:
+                postings = self.postings[field].get(word)
+                if postings is not None:
+                    item_ids.update(postings)
+        return item_ids
+
+    def search(self, terms):
+
+        """
+        Finds all items that match all search terms.
+
+        Arguments:
+        terms		--	A list of (term_type, term) tuples.
+
+        Returns:
+        A set of item ids.
+        """
+
+        results = None
+        # Start with the longest terms, because these usually match the
+        # fewest items.
+        for term_type, term in sorted(terms, key=lambda t: -len(t[1])):
+            item_ids = self.lookup(term_type, term)
+            if results is None:
+                results = item_ids
+            else:
+                results &= item_ids
+            if not results:
+                break
+        if results is None:
+            return set()
+        return results
@@ -18,18 +18,30 @@
 
 #
 
+import heapq
 import sqlite3
 import os
 import os.path
+import re
 import shutil
 import sys
+import threading
 import time
-from libqnotero.config import getConfig
-from libzotero.zotero_item import zoteroItem as zotero_item
+from libzotero.zotero_item import zoteroItem as zotero_item, normalize
+from libzotero.inverted_index import InvertedIndex, fields as index_fields
+from libzotero.fulltext import FulltextIndex
+from libzotero.phrase_search import PhraseSearch
+from libzotero.search_cache import SearchCache, cache_key
+from libzotero.snapshot import read_snapshot, write_snapshot, \
+    restore_items, restore_postings
 
 term_index = {u"collection", u"tag", u"author", u"editor",
               u"date", u"year", u"publication", u"journal",
-              u"title", u"doi", u'abs'}
+              u"title", u"doi", u'abs', u"fulltext"}
+
+# A full-text term between quotes, such as fulltext:"neural networks", is
+# searched as a phrase
+phrase_term = re.compile(r'fulltext:"([^"]*)"', re.IGNORECASE)
 
 
 def parse_query(query):
@@ -42,7 +54,10 @@ def parse_query(query):
     query		--	A search query.
 
     Returns:
-    A list of tuples.
+    A list of tuples, where the terms have been normalized in the same way as
+    the searchable text of zotero_items. Full-text terms are only converted
+    to lower case, because Zotero stores the words of attachments with their
+    accents.
     """
 
     # To search in a specific field now the syntax is  author:doe
@@ -52,9 +67,22 @@ def parse_query(query):
     # colon. E.g., author: doe
     while u": " in query:
         query = query.replace(u": ", u":")
-    # Parse the terms into a suitable format
+    query = query.strip()
+    # Parse the terms into a suitable format. Phrases are full-text terms
+    # that contain spaces.
     items = []
-    for item in query.strip().lower().split():
+    for phrase in phrase_term.findall(query):
+        phrase = u" ".join(phrase.lower().split())
+        if phrase != u"":
+            items.append((u"fulltext", phrase))
+    query = phrase_term.sub(u" ", query)
+    terms = []
+    for term in query.split():
+        if term.lower().startswith(u"fulltext:") and term.count(u":") == 1:
+            terms.append(term.lower())
+        else:
+            terms += normalize(term).split()
+    for item in terms:
         s = item.split(u":")
         # Check if the criterium is type-specified
         if len(s) == 2 and s[0].lower() in term_index:
@@ -73,6 +101,99 @@ def parse_query(query):
     return items
 
 
+def searches_fulltext(query):
+
+    """
+    Checks whether a query searches the full text of attachments, which can
+    take a while.
+
+    Argument:
+    query		--	A search query.
+
+    Returns:
+    True if the query contains a full-text term, False otherwise.
+    """
+
+    return any(term_type == u"fulltext"
+               for term_type, term in parse_query(query))
+
+
+def intern(value):
+
+    """
+    Interns a value from the database. Values such as journal titles, names,
+    tags, and years occur many times, and interning makes sure that all
+    items share a single copy of each.
+
+    Arguments:
+    value		--	A value from the database, which can also be a number.
+
+    Returns:
+    An interned string.
+    """
+
+    return sys.intern(str(value))
+
+
+class SearchResults(list):
+
+    """
+    The results of a search, which may only be a part of all items that
+    match the search.
+    """
+
+    def __init__(self, items=(), total=0, matches=None, scores=None):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        items		--	The zotero_items that have been retrieved. (default=())
+        total		--	The number of items that match the search.
+                        (default=0)
+        matches		--	All zotero_items that match the search, or None.
+                        (default=None)
+        scores		--	The relevance of each of the matches, or None.
+                        (default=None)
+        """
+
+        list.__init__(self, items)
+        self.total = total
+        self.matches = matches
+        self.scores = scores
+
+    def page(self, offset=0, limit=None):
+
+        """
+        Retrieves results of the same search, from the items that matched
+        when the search ran. Further pages are therefore found without
+        searching again, and continue where the previous page stopped, also
+        if the library has been reindexed in the meantime.
+
+        Keyword arguments:
+        offset		--	The number of results to skip. (default=0)
+        limit		--	The maximum number of results, or None to return all
+                        results. (default=None)
+
+        Returns:
+        A SearchResults list of zotero_items, ordered by relevance.
+        """
+
+        if self.matches is None:
+            return SearchResults()
+        # Only the requested results need to be ranked in order, which a
+        # heap does without sorting all matches. Both give the same order,
+        # also for items with the same score, so that pages fit together.
+        if limit is None:
+            ranking = sorted(range(len(self.matches)),
+                             key=self.scores.__getitem__, reverse=True)
+        else:
+            ranking = heapq.nlargest(offset + limit, range(len(self.matches)),
+                                     key=self.scores.__getitem__)
+        return SearchResults([self.matches[i] for i in ranking[offset:]],
+                             len(self.matches), self.matches, self.scores)
+
+
 def valid_location(path):
     """
 	Checks if a given path is a valid Zotero folder, i.e., if it it contains
@@ -97,9 +218,12 @@ class LibZotero(object):
 	"""
 
     attachment_query = u"""
-		select items.itemID, itemAttachments.path, itemAttachments.itemID
-		from items, itemAttachments
+		select items.itemID, itemAttachments.path, attachments.key,
+			itemAttachments.contentType, itemAttachments.linkMode
+		from items, itemAttachments, items as attachments
 		where items.itemID = itemAttachments.parentItemID
+			and attachments.itemID = itemAttachments.itemID
+			%(filter)s
 		"""
 
     info_query = u"""
@@ -126,6 +250,7 @@ class LibZotero(object):
     				or fields.fieldName = "DOI"
     				or fields.fieldName = "volume"
     				or fields.fieldName = "issue")
+    			%(filter)s
     		"""
 
     author_query = u"""
@@ -136,6 +261,7 @@ class LibZotero(object):
 			and itemCreators.creatorID = creators.creatorID
 			and itemCreators.creatorTypeID = creatorTypes.creatorTypeID
 			and creatorTypes.creatorType = "author"
+			%(filter)s
 		order by itemCreators.orderIndex
 		"""
 
@@ -147,6 +273,7 @@ class LibZotero(object):
     			and itemCreators.creatorID = creators.creatorID
     			and itemCreators.creatorTypeID = creatorTypes.creatorTypeID
     			and creatorTypes.creatorType = "editor"
+    			%(filter)s
     		order by itemCreators.orderIndex
     		"""
 
@@ -156,6 +283,7 @@ class LibZotero(object):
 		where
 			items.itemID = collectionItems.itemID
 			and collections.collectionID = collectionItems.collectionID
+			%(filter)s
 		order by collections.collectionName != "To Read",
 			collections.collectionName
 		"""
@@ -166,8 +294,12 @@ class LibZotero(object):
 		where
 			items.itemID = itemTags.itemID
 			and tags.tagID = itemTags.tagID
+			%(filter)s
 		"""
 
+    # The linkMode of attachments that are links to web pages
+    link_mode_linked_url = 3
+
     deleted_query = u"select itemID from deletedItems"
 
     retracted_query = u"select itemID from retractedItems"
@@ -176,7 +308,41 @@ class LibZotero(object):
                              where itemTypes.typeName = "attachment"
                              """
 
-    def __init__(self, zotero_path, noteProvider=None):
+    # Items that were modified after a given timestamp. Changes to an
+    # attachment are reported as a change to its parent item, because the
+    # attachment is indexed as part of the parent.
+    modified_query = u"""
+		select items.itemID
+		from items
+		where items.clientDateModified > :watermark
+			or items.dateModified > :watermark
+		union
+		select itemAttachments.parentItemID
+		from items, itemAttachments
+		where
+			items.itemID = itemAttachments.itemID
+			and itemAttachments.parentItemID is not null
+			and (items.clientDateModified > :watermark
+				or items.dateModified > :watermark)
+		"""
+
+    watermark_query = u"""
+		select max(items.clientDateModified), max(items.dateModified),
+			(select max(clientDateModified) from collections), count(*),
+			max(items.itemID)
+		from items
+		"""
+
+    erased_query = u"select count(*) from items where itemID <= ?"
+
+    schema_query = u'select version from version where schema = "userdata"'
+
+    collection_modified_query = u"""
+		select count(*) from collections where clientDateModified > ?
+		"""
+
+    def __init__(self, zotero_path, noteProvider=None, auto_update=True,
+                 zotero_access=u"readonly", update_snapshot=True):
 
         """
 		Intialize libzotero.
@@ -186,6 +352,16 @@ class LibZotero(object):
 
 		Keyword arguments:
 		noteProvider	--	A noteProvider object. (default=None)
+		auto_update		--	Indicates whether the index should be built right
+							away, and be updated before every search. If not,
+							only a snapshot of the index is loaded.
+							(default=True)
+		zotero_access	--	How the database is opened: "readonly",
+							"immutable", or "copy". See connect().
+							(default="readonly")
+		update_snapshot	--	Indicates whether updates of the index are saved
+							to the snapshot. If not, the snapshot is only
+							read. (default=True)
 		"""
 
         assert (isinstance(zotero_path, str))
@@ -196,6 +372,7 @@ class LibZotero(object):
         self.storage_path = os.path.join(self.zotero_path, u"storage")
         self.zotero_database = os.path.join(self.zotero_path, u"zotero.sqlite")
         self.noteProvider = noteProvider
+        self.zotero_access = zotero_access
         if os.name == u"nt":
             home_folder = os.environ[u"USERPROFILE"]
         elif os.name == u"posix":
@@ -204,21 +381,87 @@ class LibZotero(object):
             print(u"libzotero.__init__(): you appear to be running an unsupported OS")
 
         self.gnotero_database = os.path.join(home_folder, u".gnotero.sqlite")
-        # Remember search results so results speed up over time
-        self.search_cache = {}
+        # A snapshot of the index, which is loaded at startup
+        self.snapshot_path = os.path.join(home_folder, u".qnotero.index")
+        # How long to wait for Zotero to release a lock on the database (in
+        # seconds), and how often to try
+        self.busy_timeout = .2
+        self.busy_retries = 3
+        # The number of rows that are fetched from the database at once
+        self.batch_size = 1000
+        self.rows_processed = 0
+        # Indicates that the database was locked the last time, in which case
+        # it is likely still locked, and trying only once is enough
+        self.locked = False
+        # Remember recent search results, so that repeated searches, and
+        # searches that narrow a previous search while typing, are fast
+        self.search_cache = SearchCache()
+        # Full-text terms are looked up in Zotero's word tables when needed
+        self.fulltext_index = FulltextIndex(self.fulltext_connection)
+        # Phrases are looked up in the text files that Zotero extracts from
+        # attachments
+        self.phrase_search = PhraseSearch(self.fulltext_index,
+                                          self.storage_path)
+        # Results are ranked by the fields that match, and are moved up if
+        # they are recent, or if they have been opened before
+        self.current_year = time.localtime().tm_year
+        self.recency_years = 20
+        self.recency_boost = 1.
+        self.opened_items = {}
+        self.opened_boost = 2.
+        self.scores = None
         # Check whether verbosity is turned on
         self.verbose = "-v" in sys.argv
         # These dates are treated as special and are not parsed into a year
         # representation
         self.special_dates = u"in press", u"submitted", u"in preparation", \
                              u"unpublished"
-        # These extensions are recognized as fulltext attachments
-        self.attachment_ext = u".pdf", u"epub", u'djvu', u'html'
+        # These extensions and content types are recognized as fulltext
+        # attachments
+        self.attachment_ext = {u".pdf", u"epub", u'djvu', u'html'}
+        self.attachment_types = {u"application/pdf", u"application/epub+zip",
+                                 u"image/vnd.djvu", u"text/html"}
 
         self.index = {}
-        self.collection_index = []
-        self.tag_index = []
+        self.search_index = InvertedIndex()
+        self.collection_index = set()
+        self.tag_index = set()
         self.last_update = None
+        # The state of the database at the last indexing run, which allows
+        # later runs to only reindex the items that have changed since.
+        self.watermark = None
+        self.item_count = 0
+        self.max_item_id = 0
+        self.schema_version = None
+        self.deleted_items = set()
+        self.retracted_items = set()
+        # If more than this fraction of the index has changed, a full rebuild
+        # is faster than patching the index item by item
+        self.max_delta_fraction = .25
+        # Rewriting the snapshot after every small update would take longer
+        # than the update itself. A full rebuild is saved right away, but
+        # other updates at most once in this many seconds, and otherwise
+        # when the library is closed.
+        self.snapshot_interval = 300
+        self.update_snapshot = update_snapshot
+        self.snapshot_time = 0
+        self.unsaved_state = None
+        # The index is replaced while holding this lock, so that searches
+        # always see a consistent index, even while it is being updated in
+        # another thread. Only one update can run at a time.
+        self.lock = threading.Lock()
+        self.update_lock = threading.Lock()
+        self.search_lock = threading.Lock()
+        # Indicates whether searches should first update the index. If not,
+        # update() needs to be called explicitly, for example from a
+        # background thread.
+        self.auto_update = auto_update
+
+        self.load_snapshot()
+
+        self.error = False
+        if not auto_update:
+            return
 
         # The notry parameter can be used to show errors which would
         # otherwise be obscured by the try clause
@@ -236,164 +479,563 @@ class LibZotero(object):
     def update(self, force=False):
 
         """
-		Checks if the local copy of the zotero database is up to date. If not,
-		the data is also indexed.
+		Checks if the index is up to date with the zotero database. If not,
+		the data is indexed again. If possible, only the items that have been
+		modified since the last update are reindexed.
 
 		Arguments:
 		force		--	Indicates that the data should also be indexed, even
-						if the local copy is up to date. (default=False)
+						if the index is up to date. A forced update
+						always rebuilds the entire index. (default=False)
 		"""
 
         try:
-            stats = os.stat(self.zotero_database)
+            state = self.database_state()
         except Exception as e:
             print(u"libzotero.update(): %s" % e)
             return False
 
         # Only update if necessary
-        if force or self.last_update is None or stats[8] > self.last_update:
-            t = time.time()
-            self.last_update = stats[8]
-            self.index = {}
-            self.collection_index = []
-            self.search_cache = {}
-            # Copy the zotero database to the gnotero copy
-            shutil.copyfile(self.zotero_database, self.gnotero_database)
-            self.conn = sqlite3.connect(self.gnotero_database)
-            self.cur = self.conn.cursor()
-            # First create a list of deleted items, so we can ignore those later
-            deleted = []
-            self.cur.execute(self.deleted_query)
-            for item in self.cur.fetchall():
-                deleted.append(item[0])
-            # Then create a list of retracted item to ignore them too
-            retracted = []
-            self.cur.execute(self.retracted_query)
-            for item in self.cur.fetchall():
-                retracted.append(item[0])
-            # Retrieve the attachment ID
-            self.cur.execute(self.attachmentid_query)
-            item = self.cur.fetchone()
-            attachmentid = item[0]
-            # Retrieve information about date, publication, volume, issue, DOI,
-            # title, and abstract.
-            self.cur.execute(self.info_query)
-            for item in self.cur.fetchall():
-                # If the item is marked as attachment just continue to the next one
-                if item[1] == attachmentid:
-                    continue
-                item_id = item[0]
-                key = item[4]
-                if item_id not in deleted and item_id not in retracted:
-                    item_name = item[2]
-                    # Parse date fields, because we only want a year or a
-                    # 'special' date
-                    if item_name == u"date":
-                        item_value = None
-                        for sd in self.special_dates:
-                            if sd in item[3].lower():
-                                item_value = sd
-                                break
-                        item_value = item[3][0:4]
-                    else:
-                        item_value = item[3]
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id,
-                                                          noteProvider=self.noteProvider)
-                        self.index[item_id].key = key
-                    # Not all items have the publicationTitle field
-                    if item_name == u"publicationTitle" or item_name == u"bookTitle"\
-                            or item_name == u"blogTitle" or item_name == u"encyclopediaTitle"\
-                            or item_name == u"proceedingsTitle" or item_name == u"programTitle"\
-                            or item_name == u"dictionaryTitle":
-                        self.index[item_id].publication = str(item_value)
-                    elif item_name == u"date":
-                        self.index[item_id].date = item_value
-                    elif item_name == u"volume":
-                        self.index[item_id].volume = item_value
-                    elif item_name == u"issue":
-                        self.index[item_id].issue = item_value
-                    elif item_name == u"DOI":
-                        self.index[item_id].doi = item_value
-                        # subject corresponds to the email title
-                    elif item_name == u"title" or item_name == u"subject":
-                        self.index[item_id].title = str(item_value)
-                    elif item_name == u'url':
-                        self.index[item_id].url = item_value
-                    elif item_name == u'abstractNote':
-                        self.index[item_id].abstract = item_value
-            # Retrieve author information
-            self.cur.execute(self.author_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    item_author = item[1].title()
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id)
-                    self.index[item_id].authors.append(item_author)
-            # Retrieve editor information
-            self.cur.execute(self.editor_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    item_editor = item[1].title()
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id)
-                    self.index[item_id].editors.append(item_editor)
-            # Retrieve collection information
-            self.cur.execute(self.collection_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    item_collection = item[1]
-                    if item_id not in self.index:
-                        self.index[item_id] = zotero_item(item_id)
-                    self.index[item_id].collections.append(item_collection)
-                    if item_collection not in self.collection_index:
-                        self.collection_index.append(item_collection)
-            # Retrieve tag information
-            self.cur.execute(self.tag_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                # Only add tags for existing entries in the index
-                if item_id in self.index:
-                    item_tag = item[1]
-                    self.index[item_id].tags.append(item_tag)
-                    if item_tag not in self.tag_index:
-                        self.tag_index.append(item_tag)
-            # Retrieve attachments
-            self.cur.execute(self.attachment_query)
-            for item in self.cur.fetchall():
-                item_id = item[0]
-                if item_id not in deleted and item_id not in retracted:
-                    if item[1] is not None:
-                        att = item[1]
-                        # If the attachment is stored in the Zotero folder, it is preceded
-                        # by "storage:"
-                        if att[:8] == u"storage:":
-                            item_attachment = att[8:]
-                            attachment_id = item[2]
-                            if item_attachment[-4:].lower() in \
-                                    self.attachment_ext:
-                                if item_id not in self.index:
-                                    self.index[item_id] = zotero_item(item_id)
-                                self.cur.execute(
-                                    u"select items.key from items where itemID = %d"
-                                    % attachment_id)
-                                key = self.cur.fetchone()[0]
-                                self.index[item_id].fulltext.append(os.path.join(
-                                    self.storage_path, key, item_attachment))
-                        # If the attachment is linked, it is simply the full
-                        # path to the attachment
-                        else:
-                            self.index[item_id].fulltext.append(att)
+        with self.update_lock:
+            if force or self.last_update is None or \
+                    state[0] > self.last_update:
+                self.reindex(state, force)
+            elif not self.auto_update and \
+                    self.search_index.suffix_array is None:
+                # The index that was loaded from the snapshot is prepared
+                # as a copy, because other threads may be searching in it
+                search_index = self.search_index.copy()
+                search_index.prepare()
+                with self.lock:
+                    self.search_index = search_index
+        return True
+
+    def database_state(self):
+
+        """
+		Determines when the Zotero database was last modified. Changes that
+		have not yet been moved from the write-ahead log into the database
+		itself are taken into account as well.
+
+		Returns:
+		A (modification time, size) tuple.
+		"""
+
+        stats = os.stat(self.zotero_database)
+        mtime = stats.st_mtime
+        try:
+            mtime = max(mtime, os.stat(self.zotero_database + u"-wal").st_mtime)
+        except OSError:
+            pass
+        return mtime, stats.st_size
+
+    def reindex(self, state, force=False):
+
+        """
+		Indexes the zotero database, and replaces the current index by the
+		new one once indexing is done.
+
+		Arguments:
+		state		--	The result of database_state().
+
+		Keyword arguments:
+		force		--	Indicates that the entire index should be rebuilt.
+						(default=False)
+		"""
+
+        t = time.time()
+        self.rows_processed = 0
+        self.last_update = state[0]
+        self.conn = self.connect()
+        self.cur = self.conn.cursor()
+        try:
+            schema_version = self.read_schema_version()
+            changed = None
+            if not force and schema_version == self.schema_version:
+                changed = self.changed_items()
+            self.schema_version = schema_version
+            if changed is None:
+                index = {}
+                self.collection_index = set()
+                self.tag_index = set()
+                self.index_items(index)
+                search_index = InvertedIndex(index.values())
+                search_cache = SearchCache()
+                print(u"libzotero.update(): indexing completed in %.3fs"
+                      % (time.time() - t))
+                print(u"%s entries processed" % len(index))
+            else:
+                index, search_index, search_cache = \
+                    self.reindex_items(changed)
+                print(u"libzotero.update(): reindexed %d modified entries "
+                      u"in %.3fs" % (len(changed), time.time() - t))
+            self.cur.execute(self.watermark_query)
+            client_modified, modified, collection_modified, \
+                self.item_count, self.max_item_id = self.cur.fetchone()
+            self.watermark = max(client_modified or u"", modified or u"",
+                                 collection_modified or u"")
+            # Zotero stamps changes with a resolution of one second, so
+            # items that are changed later in the second in which the
+            # database was read get the same timestamp as the last items that
+            # were indexed. The watermark is therefore kept before that
+            # second, so that the items of that second are read again by the
+            # next update.
+            first_unsafe = time.strftime(u"%Y-%m-%d %H:%M:%S",
+                                         time.gmtime(t))
+            if self.watermark >= first_unsafe:
+                self.watermark = time.strftime(u"%Y-%m-%d %H:%M:%S",
+                                               time.gmtime(t - 1))
+        finally:
+            # Release the lock on the database as soon as possible, also if
+            # indexing fails, so that Zotero is not blocked
             self.cur.close()
-            print(u"libzotero.update(): indexing completed in %.3fs"
+            self.conn.close()
+        dt = time.time() - t
+        print(u"libzotero.update(): %d rows processed (%.0f rows/s)"
+              % (self.rows_processed, self.rows_processed / max(dt, 1e-6)))
+        # When updates run in the background, the indices that speed up
+        # searches are built there as well, before the index is used
+        if not self.auto_update:
+            search_index.prepare()
+        with self.lock:
+            self.index = index
+            self.search_index = search_index
+            self.search_cache = search_cache
+        # Attachments may have been added, or their text indexed
+        self.fulltext_index.reset()
+        if changed is None or \
+                time.time() - self.snapshot_time >= self.snapshot_interval:
+            self.save_snapshot(state)
+        else:
+            self.unsaved_state = state
+
+    def connect(self):
+
+        """
+		Opens the Zotero database. Depending on the zotero_access option, the
+		database is opened read-only ("readonly"), read-only without any
+		locking, which is only safe if Zotero is not writing to it
+		("immutable"), or a copy of the database is opened ("copy"). If the
+		database remains locked by Zotero, a copy is opened instead.
+
+		All queries on the returned connection are part of a single read
+		transaction, so that they see a consistent state of the database,
+		also if it is in WAL mode.
+
+		Returns:
+		An sqlite3 connection.
+		"""
+
+        access = self.zotero_access
+        if access != u"copy":
+            # pathlib is only imported here, because importing it is slow
+            import pathlib
+            uri = pathlib.Path(os.path.abspath(self.zotero_database)).as_uri()
+            uri += u"?mode=ro"
+            if access == u"immutable":
+                uri += u"&immutable=1"
+            retries = 1 if self.locked else self.busy_retries
+            for attempt in range(retries):
+                conn = None
+                try:
+                    conn = sqlite3.connect(uri, uri=True,
+                                           timeout=self.busy_timeout,
+                                           isolation_level=None)
+                    conn.execute(u"begin")
+                    conn.execute(u"select count(*) from sqlite_master")
+                    self.locked = False
+                    return conn
+                except sqlite3.OperationalError as e:
+                    if conn is not None:
+                        conn.close()
+                    print(u"libzotero.connect(): %s" % e)
+                    if u"locked" not in str(e) and u"busy" not in str(e):
+                        break
+                    self.locked = True
+                    if attempt < retries - 1:
+                        time.sleep(self.busy_timeout * (attempt + 1))
+            print(u"libzotero.connect(): falling back to a copy of the "
+                  u"database")
+        # Copy the zotero database to the gnotero copy
+        shutil.copyfile(self.zotero_database, self.gnotero_database)
+        return sqlite3.connect(self.gnotero_database)
+
+    def fulltext_connection(self):
+
+        """
+		Opens the database for full-text searches. In "copy" mode, and while
+		the database is locked by Zotero, the copy that was made by the last
+		update is used, so that the database is not copied again for every
+		search.
+
+		Returns:
+		An sqlite3 connection.
+		"""
+
+        if (self.zotero_access == u"copy" or self.locked) and \
+                os.path.exists(self.gnotero_database):
+            return sqlite3.connect(self.gnotero_database)
+        return self.connect()
+
+    def rows(self, query, parameters=()):
+
+        """
+		Executes a query, and fetches the resulting rows in batches, so that
+		the entire result is never held in memory.
+
+		Arguments:
+		query		--	An SQL query.
+
+		Keyword arguments:
+		parameters	--	The parameters for the query. (default=())
+
+		Returns:
+		An iterator over the rows.
+		"""
+
+        cur = self.conn.cursor()
+        cur.execute(query, parameters)
+        while True:
+            rows = cur.fetchmany(self.batch_size)
+            if not rows:
+                break
+            self.rows_processed += len(rows)
+            for row in rows:
+                yield row
+        cur.close()
+
+    def read_schema_version(self):
+
+        """
+		Returns:
+		The version of the schema of the Zotero database, or None if it is
+		unknown.
+		"""
+
+        try:
+            self.cur.execute(self.schema_query)
+            return self.cur.fetchone()[0]
+        except Exception as e:
+            print(u"libzotero.read_schema_version(): %s" % e)
+            return None
+
+    def save_snapshot(self, state):
+
+        """
+		Saves a snapshot of the index to disk.
+
+		Arguments:
+		state		--	The result of database_state() for the database from
+						which the index was built.
+		"""
+
+        if not self.update_snapshot:
+            return
+        t = time.time()
+        meta = {
+            u"zotero_database": self.zotero_database,
+            u"mtime": state[0],
+            u"size": state[1],
+            u"schema_version": self.schema_version,
+            u"watermark": self.watermark,
+            u"item_count": self.item_count,
+            u"max_item_id": self.max_item_id,
+            u"deleted_items": self.deleted_items,
+            u"retracted_items": self.retracted_items,
+            u"collection_index": self.collection_index,
+            u"tag_index": self.tag_index,
+            }
+        # A snapshot that cannot be written is not tried again right away
+        self.snapshot_time = time.time()
+        self.unsaved_state = None
+        if write_snapshot(self.snapshot_path, meta, self.index,
+                          self.search_index):
+            print(u"libzotero.save_snapshot(): snapshot saved in %.3fs"
                   % (time.time() - t))
-            print(u"%s entries processed" % len(self.index))
+
+    def load_snapshot(self):
+
+        """
+		Loads the index from a snapshot on disk. If the Zotero database has
+		changed since the snapshot was saved, the snapshot is still used, but
+		the next update reindexes the items that have changed.
+
+		Returns:
+		True if a snapshot was loaded, False otherwise.
+		"""
+
+        t = time.time()
+        snapshot = read_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return False
+        header, strings, sections = snapshot
+        if header.get(u"zotero_database") != self.zotero_database:
+            return False
+        try:
+            state = self.database_state()
+        except Exception as e:
+            print(u"libzotero.load_snapshot(): %s" % e)
+            return False
+        # Nothing is replaced until the entire snapshot has been read, so
+        # that a damaged snapshot leaves the index as it was
+        try:
+            index = restore_items(
+                strings, sections,
+                lambda item_id: zotero_item(item_id,
+                                            noteProvider=self.noteProvider))
+            search_index = InvertedIndex()
+            search_index.postings, search_index.vocabulary = \
+                restore_postings(strings, sections, index_fields)
+            collection_index = set(strings[n] for n in
+                                   sections[u"collection_index"])
+            tag_index = set(strings[n] for n in sections[u"tag_index"])
+            deleted_items = set(sections[u"deleted_items"])
+            retracted_items = set(sections[u"retracted_items"])
+            schema_version = header[u"schema_version"]
+            watermark = header[u"watermark"]
+            item_count = header[u"item_count"]
+            max_item_id = header[u"max_item_id"]
+            mtime = header[u"mtime"]
+            size = header[u"size"]
+        except (KeyError, IndexError, TypeError) as e:
+            print(u"libzotero.load_snapshot(): damaged snapshot: %s" % e)
+            return False
+        self.index = index
+        self.search_index = search_index
+        self.collection_index = collection_index
+        self.tag_index = tag_index
+        self.deleted_items = deleted_items
+        self.retracted_items = retracted_items
+        self.schema_version = schema_version
+        self.watermark = watermark
+        self.item_count = item_count
+        self.max_item_id = max_item_id
+        self.search_cache = SearchCache()
+        self.snapshot_time = time.time()
+        if state[0] == mtime and state[1] == size:
+            self.last_update = state[0]
+            print(u"libzotero.load_snapshot(): snapshot loaded in %.3fs"
+                  % (time.time() - t))
+        else:
+            self.last_update = None
+            print(u"libzotero.load_snapshot(): stale snapshot loaded in "
+                  u"%.3fs" % (time.time() - t))
         return True
 
-    def search(self, query):
+    def changed_items(self):
+
+        """
+		Determines which items have changed since the last time that the index
+		was built, based on the modification dates of the items and on the
+		deleted and retracted items.
+
+		Returns:
+		A set of item ids, or None if the index needs to be rebuilt entirely.
+		"""
+
+        if self.watermark is None:
+            return None
+        # A renamed collection affects all items in it
+        self.cur.execute(self.collection_modified_query, (self.watermark,))
+        if self.cur.fetchone()[0] > 0:
+            print(u"libzotero.changed_items(): collections have changed")
+            return None
+        # Erased items (e.g. after emptying the trash) leave no trace, and
+        # may have been attachments of other items
+        self.cur.execute(self.erased_query, (self.max_item_id,))
+        if self.cur.fetchone()[0] < self.item_count:
+            print(u"libzotero.changed_items(): items have been erased")
+            return None
+        changed = set(item[0] for item in self.rows(
+            self.modified_query, {u"watermark": self.watermark}))
+        # Items that have been moved into or out of the trash, or that have
+        # been (un)retracted
+        deleted = set(item[0] for item in self.rows(self.deleted_query))
+        retracted = set(item[0] for item in self.rows(self.retracted_query))
+        changed |= deleted ^ self.deleted_items
+        changed |= retracted ^ self.retracted_items
+        if len(changed) > self.max_delta_fraction * len(self.index):
+            print(u"libzotero.changed_items(): %d items have changed"
+                  % len(changed))
+            return None
+        return changed
+
+    def reindex_items(self, changed):
+
+        """
+		Reindexes a set of items. The current index is left untouched, so that
+		it can still be searched in the meantime. Instead, the changed items
+		are replaced by new items in a copy of the index.
+
+		Arguments:
+		changed		--	A set of item ids.
+
+		Returns:
+		An (index, search_index, search_cache) tuple, where search_cache only
+		contains the search results that are not affected by the changed
+		items.
+		"""
+
+        index = dict(self.index)
+        search_index = self.search_index.copy()
+        for item_id in changed:
+            item = index.pop(item_id, None)
+            if item is not None:
+                search_index.remove(item)
+        self.index_items(index, changed)
+        updated = [index[item_id] for item_id in changed
+                   if item_id in index]
+        for item in updated:
+            search_index.add(item)
+        # Only forget the search results that contain one of the changed
+        # items, or that one of the changed items would now be part of.
+        # Searches add to the cache while this happens, so it is filtered
+        # under the search lock.
+        with self.search_lock:
+            search_cache = self.search_cache.filtered(
+                lambda terms, results:
+                not any(item.id in changed for item in results)
+                and not any(item.match(terms) for item in updated))
+        return index, search_index, search_cache
+
+    def get_item(self, index, item_id):
+
+        """
+		Retrieves an item from an index, and adds it if it doesn't exist yet.
+
+		Arguments:
+		index		--	A dict with item ids as keys.
+		item_id		--	An item id.
+
+		Returns:
+		A zotero_item.
+		"""
+
+        item = index.get(item_id)
+        if item is None:
+            item = index[item_id] = zotero_item(
+                item_id, noteProvider=self.noteProvider)
+        return item
+
+    def index_items(self, index, item_ids=None):
+
+        """
+		Reads items from the database into an index.
+
+		Arguments:
+		index		--	A dict to which the items are added.
+
+		Keyword arguments:
+		item_ids	--	A set of item ids to index, or None to index all items.
+						(default=None)
+		"""
+
+        # Deleted and retracted items are ignored
+        query_filter = u"""
+			and items.itemID not in (select itemID from deletedItems)
+			and items.itemID not in (select itemID from retractedItems)
+			"""
+        if item_ids is not None:
+            query_filter += u"and items.itemID in (%s)" \
+                % u",".join(str(item_id) for item_id in item_ids)
+        query_filter = {u"filter": query_filter}
+        # Remember the deleted and retracted items, so that we can find out
+        # which ones change
+        self.deleted_items = set(item[0] for item in
+                                 self.rows(self.deleted_query))
+        self.retracted_items = set(item[0] for item in
+                                   self.rows(self.retracted_query))
+        # Retrieve the attachment ID
+        self.cur.execute(self.attachmentid_query)
+        item = self.cur.fetchone()
+        attachmentid = item[0]
+        # Retrieve information about date, publication, volume, issue, DOI,
+        # title, and abstract.
+        for item in self.rows(self.info_query % query_filter):
+            # If the item is marked as attachment just continue to the next one
+            if item[1] == attachmentid:
+                continue
+            item_id = item[0]
+            key = item[4]
+            item_name = item[2]
+            # Parse date fields, because we only want a year or a
+            # 'special' date
+            if item_name == u"date":
+                item_value = None
+                for sd in self.special_dates:
+                    if sd in item[3].lower():
+                        item_value = sd
+                        break
+                item_value = item[3][0:4]
+            else:
+                item_value = item[3]
+            if item_id not in index:
+                self.get_item(index, item_id).key = key
+            # Not all items have the publicationTitle field
+            if item_name == u"publicationTitle" or item_name == u"bookTitle"\
+                    or item_name == u"blogTitle" or item_name == u"encyclopediaTitle"\
+                    or item_name == u"proceedingsTitle" or item_name == u"programTitle"\
+                    or item_name == u"dictionaryTitle":
+                index[item_id].publication = intern(item_value)
+            elif item_name == u"date":
+                index[item_id].date = intern(item_value)
+            elif item_name == u"volume":
+                index[item_id].volume = intern(item_value)
+            elif item_name == u"issue":
+                index[item_id].issue = intern(item_value)
+            elif item_name == u"DOI":
+                index[item_id].doi = str(item_value)
+                # subject corresponds to the email title
+            elif item_name == u"title" or item_name == u"subject":
+                index[item_id].title = str(item_value)
+            elif item_name == u'url':
+                index[item_id].url = str(item_value)
+            elif item_name == u'abstractNote':
+                index[item_id].abstract = str(item_value)
+        # Retrieve author information
+        for item in self.rows(self.author_query % query_filter):
+            item_author = intern(item[1].title())
+            self.get_item(index, item[0]).authors.append(item_author)
+        # Retrieve editor information
+        for item in self.rows(self.editor_query % query_filter):
+            item_editor = intern(item[1].title())
+            self.get_item(index, item[0]).editors.append(item_editor)
+        # Retrieve collection information
+        for item in self.rows(self.collection_query % query_filter):
+            item_collection = intern(item[1])
+            self.get_item(index, item[0]).collections.append(item_collection)
+            self.collection_index.add(item_collection)
+        # Retrieve tag information
+        for item in self.rows(self.tag_query % query_filter):
+            item_id = item[0]
+            # Only add tags for existing entries in the index
+            if item_id in index:
+                item_tag = intern(item[1])
+                index[item_id].tags.append(item_tag)
+                self.tag_index.add(item_tag)
+        # Retrieve attachments, together with the key of the attachment,
+        # which is the name of the folder in which it is stored
+        for item in self.rows(self.attachment_query % query_filter):
+            item_id = item[0]
+            att = item[1]
+            # Linked URLs don't have a path
+            if att is None or item[4] == self.link_mode_linked_url:
+                continue
+            # If the attachment is stored in the Zotero folder, it is preceded
+            # by "storage:"
+            if att[:8] == u"storage:":
+                item_attachment = att[8:]
+                if item_attachment[-4:].lower() in self.attachment_ext or \
+                        item[3] in self.attachment_types:
+                    self.get_item(index, item_id).fulltext.append(
+                        os.path.join(self.storage_path, item[2],
+                                     item_attachment))
+            # If the attachment is linked, it is simply the full
+            # path to the attachment
+            else:
+                self.get_item(index, item_id).fulltext.append(att)
+
+    def search(self, query, limit=None, offset=0, cancel=None):
 
         """
 		Searches the zotero database.
@@ -401,26 +1043,219 @@ class LibZotero(object):
 		Argument:
 		query		--	A search query.
 
+		Keyword arguments:
+		limit		--	The maximum number of results, or None to return all
+						results. (default=None)
+		offset		--	The number of results to skip, e.g. because they
+						have already been shown. (default=0)
+		cancel		--	A threading.Event that stops a search in the full
+						text of attachments when it is set, or None.
+						(default=None)
+
 		Returns:
-		A list of zotero_items.
+		A SearchResults list of zotero_items, ordered by relevance. A search
+		that is cancelled has no results.
 		"""
 
-        if not self.update():
-            return []
-        if query in self.search_cache:
-            print(u"libzotero.search(): retrieving results for '%s' from cache"
-                  % query)
-            return self.search_cache[query]
-        t = time.time()
+        if self.auto_update and not self.update():
+            return SearchResults()
+        # The index may be replaced by another thread at any time, so search
+        # in the index as it is now
+        with self.lock:
+            index = self.index
+            search_index = self.search_index
+            search_cache = self.search_cache
         terms = parse_query(query)
         if len(terms) == 0:
-            return []
-        results = []
-        for item_id, item in self.index.items():
-            if item.match(terms):
-                results.append(item)
-        self.search_cache[query] = results
+            return SearchResults()
+        key = cache_key(terms)
+        t = time.time()
+        # Full-text terms are not part of the index. They are looked up
+        # separately, and combined with the results for the other terms.
+        fulltext_terms = [term for term_type, term in key
+                          if term_type == u"fulltext"]
+        key = tuple(term for term in key if term[0] != u"fulltext")
+        # Searches may come from several threads, for example from the GUI
+        # and from the listener, and share the search cache
+        if key:
+            with self.search_lock:
+                matches = search_cache.get(key)
+                if matches is not None:
+                    print(u"libzotero.search(): retrieving results for '%s' "
+                          u"from cache" % query)
+                else:
+                    # If the query narrows a previous query, as happens
+                    # while typing, only the results of that query need to
+                    # be checked
+                    matches = search_cache.narrowest(key)
+                    if matches is not None:
+                        matches = [item for item in matches
+                                   if item.match(key)]
+                    else:
+                        matches = [index[item_id] for item_id in
+                                   sorted(search_index.search(key))]
+                    search_cache.add(key, matches)
+        # Searching the text of attachments can take a while, so other
+        # searches are not blocked in the meantime
+        if fulltext_terms and key:
+            # Only the items that match the other terms need to be searched
+            item_ids = self.fulltext_search(
+                fulltext_terms, set(item.id for item in matches), cancel)
+            matches = [item for item in matches if item.id in item_ids]
+        elif fulltext_terms:
+            matches = [index[item_id] for item_id in
+                       sorted(self.fulltext_search(fulltext_terms,
+                                                   cancel=cancel))
+                       if item_id in index]
+        if cancel is not None and cancel.is_set():
+            return SearchResults()
+        with self.search_lock:
+            # The scores are remembered, so that the next pages of the same
+            # search don't need to be scored again
+            if self.scores is not None and self.scores[0] is matches:
+                scores = self.scores[1]
+            else:
+                scores = [self.relevance(item, key) for item in matches]
+                self.scores = matches, scores
+        results = SearchResults((), len(matches), matches, scores) \
+            .page(offset, limit)
         print(u"libzotero.search(): search for '%s' completed in %.3fs" %
               (query, time.time() - t))
         return results
 
+    def fulltext_search(self, terms, item_ids=None, cancel=None):
+
+        """
+		Searches the full text of attachments.
+
+		Arguments:
+		terms		--	A list of full-text terms, which are phrases if they
+						contain spaces.
+
+		Keyword arguments:
+		item_ids	--	A set of item ids, to only search these items, or None
+						to search all items. (default=None)
+		cancel		--	A threading.Event that stops searching for phrases
+						when it is set, or None. (default=None)
+
+		Returns:
+		A set with the ids of the items that match all terms.
+		"""
+
+        words = [term for term in terms if u" " not in term]
+        phrases = [term for term in terms if u" " in term]
+        if words:
+            results = self.fulltext_index.search(words)
+            if item_ids is not None:
+                results &= item_ids
+            item_ids = results
+        # Each phrase only needs to be searched for in the items that match
+        # the previous terms
+        for phrase in phrases:
+            if item_ids is not None and not item_ids:
+                break
+            item_ids = set(self.phrase_search.search(phrase, item_ids,
+                                                     cancel))
+        return item_ids
+
+    def search_phrase(self, phrase, cancel=None):
+
+        """
+		Searches the full text of attachments for a phrase, and yields the
+		items that contain it as they are found. This is useful to show the
+		first results of a long search right away.
+
+		Arguments:
+		phrase		--	A phrase.
+
+		Keyword arguments:
+		cancel		--	A threading.Event that stops the search when it is
+						set, or None. (default=None)
+
+		Returns:
+		A generator of zotero_items.
+		"""
+
+        if self.auto_update and not self.update():
+            return
+        with self.lock:
+            index = self.index
+        phrase = u" ".join(phrase.lower().split())
+        if phrase == u"":
+            return
+        for item_id in self.phrase_search.search(phrase, cancel=cancel):
+            item = index.get(item_id)
+            if item is not None:
+                yield item
+
+    def stats(self):
+
+        """
+		Returns:
+		A dict with statistics about the index, which can be converted to
+		JSON.
+		"""
+
+        with self.lock:
+            index = self.index
+            search_index = self.search_index
+            search_cache = self.search_cache
+        return {
+            u"items": len(index),
+            u"tokens": len(search_index.vocabulary),
+            u"cached_searches": len(search_cache),
+            u"cached_results": search_cache.size,
+            u"last_update": self.last_update,
+            u"schema_version": self.schema_version,
+            }
+
+    def close(self):
+
+        """
+		Saves the changes to the index that have not been saved yet, and
+		stops the worker processes of phrase searches.
+		"""
+
+        with self.update_lock:
+            if self.unsaved_state is not None:
+                self.save_snapshot(self.unsaved_state)
+        self.phrase_search.close()
+
+    def relevance(self, item, terms):
+
+        """
+		Determines how relevant an item is for a search. Besides on the fields
+		that match, this depends on how recent the item is, and on how often
+		it has been opened.
+
+		Arguments:
+		item		--	A zotero_item that matches the search.
+		terms		--	A list of (term_type, term) tuples.
+
+		Returns:
+		A relevance score.
+		"""
+
+        score = item.score(terms)
+        if item.date is not None and item.date.isdigit():
+            age = max(self.current_year - int(item.date), 0)
+            score += self.recency_boost * \
+                max(1. - age / self.recency_years, 0.)
+        opened = self.opened_items.get(item.id)
+        if opened is not None:
+            score += self.opened_boost * opened / (opened + 1.)
+        return score
+
+    def item_opened(self, item):
+
+        """
+		Registers that an item has been opened, so that it is ranked higher
+		in later searches.
+
+		Arguments:
+		item		--	A zotero_item.
+		"""
+
+        self.opened_items[item.id] = self.opened_items.get(item.id, 0) + 1
+        self.scores = None
+
@@ -0,0 +1,368 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+import mmap
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from libzotero.zotero_item import normalize
+
+# The file in which Zotero stores the text of an attachment, in the folder
+# of the attachment
+cache_file = u".zotero-ft-cache"
+
+word = re.compile(r"\w+")
+
+non_ascii = re.compile(rb"[\x80-\xff]+")
+
+whitespace = re.compile(r"\s")
+
+
+def phrase_pattern(phrase):
+
+    """
+    Creates the regular expressions that find a phrase. The words of the
+    phrase may be separated by any whitespace, including line breaks, and the
+    last word may be incomplete. Accents and case are ignored.
+
+    Arguments:
+    phrase		--	A phrase.
+
+    Returns:
+    A (bytes pattern, text pattern) tuple. The bytes pattern is matched
+    case-insensitively against the raw text, which is fast, but is only
+    possible if the normalized phrase only consists of ASCII characters;
+    otherwise it is None. The text pattern is matched against the decoded
+    and normalized text.
+    """
+
+    phrase = normalize(phrase)
+    pattern = r"\s+".join(re.escape(part) for part in phrase.split())
+    if word.match(phrase):
+        pattern = r"\b" + pattern
+    try:
+        return pattern.encode(u"ascii"), pattern
+    except UnicodeEncodeError:
+        return None, pattern
+
+
+def scan_file(path, patterns):
+
+    """
+    Checks whether a file contains a phrase. The file is memory mapped, so
+    that it is not read into memory as a whole.
+
+    Arguments:
+    path		--	The path of the file.
+    patterns	--	The patterns as returned by phrase_pattern().
+
+    Returns:
+    True if the file contains the phrase, False otherwise.
+    """
+
+    bytes_pattern, text_pattern = patterns
+    try:
+        with open(path, u"rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                if bytes_pattern is not None and \
+                        re.search(bytes_pattern, m, re.IGNORECASE) is not None:
+                    return True
+                return scan_windows(m, text_pattern)
+    except (OSError, ValueError) as e:
+        print(u"libzotero.phrase_search.scan_file(): %s" % e)
+        return False
+
+
+def scan_windows(m, text_pattern):
+
+    """
+    Checks whether the text around characters that are not ASCII contains a
+    phrase, once it has been decoded and normalized. Elsewhere, the text
+    is ASCII, and only the bytes pattern can match. Most files only contain
+    a few such characters, such as quotes and ligatures, so that only small
+    parts of them need to be decoded.
+
+    Arguments:
+    m			--	The contents of a file.
+    text_pattern	--	The text pattern as returned by phrase_pattern().
+
+    Returns:
+    True if the text contains the phrase, False otherwise.
+    """
+
+    # The number of bytes around a character that may belong to the same
+    # occurrence of the phrase. Characters take up to four bytes, and
+    # accents are stored as separate characters if the text is decomposed.
+    margin = 8 * len(text_pattern) + 64
+    start = end = None
+    for match in non_ascii.finditer(m):
+        if end is not None and match.start() - margin <= end:
+            end = match.end() + margin
+            continue
+        if end is not None and scan_window(m, start, end, text_pattern):
+            return True
+        start = max(match.start() - margin, 0)
+        end = match.end() + margin
+    return end is not None and scan_window(m, start, end, text_pattern)
+
+
+def scan_window(m, start, end, text_pattern):
+
+    """
+    Checks whether a part of a file contains a phrase.
+
+    Arguments:
+    m			--	The contents of a file.
+    start		--	The first byte of the part.
+    end			--	The end of the part.
+    text_pattern	--	The text pattern as returned by phrase_pattern().
+
+    Returns:
+    True if the part contains the phrase, False otherwise.
+    """
+
+    text = normalize(m[start:end].decode(u"utf-8", u"replace"))
+    # The part may start in the middle of a word, which the phrase should
+    # not be found in
+    if start > 0:
+        match = whitespace.search(text)
+        if match is None:
+            return False
+        text = text[match.start():]
+    return re.search(text_pattern, text) is not None
+
+
+def scan_files(paths, patterns):
+
+    """
+    Checks whether files contain a phrase. This runs in a worker process.
+
+    Arguments:
+    paths		--	A list of file paths.
+    patterns	--	The patterns as returned by phrase_pattern().
+
+    Returns:
+    A list with True for each file that contains the phrase, and False
+    otherwise.
+    """
+
+    return [scan_file(path, patterns) for path in paths]
+
+
+class PhraseSearch(object):
+
+    """
+    Finds exact phrases in the text of attachments, which Zotero stores in a
+    .zotero-ft-cache file in the folder of each attachment. Zotero's word
+    tables are used first to find the attachments that contain all words of
+    a phrase, so that usually only a few files need to be scanned. Large
+    numbers of files are scanned in parallel by a pool of processes.
+
+    Which files contain a phrase is remembered for recent phrases, so that
+    files are only scanned again if they have changed.
+    """
+
+    def __init__(self, fulltext_index, storage_path, max_workers=None,
+                 batch_size=32, parallel_size=8 * 1024 ** 2, max_phrases=8):
+
+        """
+        Constructor.
+
+        Arguments:
+        fulltext_index	--	A FulltextIndex.
+        storage_path	--	The storage folder of the Zotero library.
+
+        Keyword arguments:
+        max_workers		--	The number of worker processes, or None to use
+                            one process per CPU. (default=None)
+        batch_size		--	The number of files that a worker process scans
+                            at once. (default=32)
+        parallel_size	--	The number of bytes from which on files are
+                            scanned by worker processes, instead of in the
+                            calling thread. (default=8MB)
+        max_phrases		--	The number of phrases for which the scanned files
+                            are remembered. (default=8)
+        """
+
+        self.fulltext_index = fulltext_index
+        self.storage_path = storage_path
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        # Before Python 3.7, a ProcessPoolExecutor always forks its workers,
+        # which is unsafe in a process with threads, so files are scanned in
+        # this process instead
+        if sys.version_info < (3, 7):
+            max_workers = 1
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.parallel_size = parallel_size
+        self.max_phrases = max_phrases
+        # The (mtime, size, found) of each file that has been scanned, by
+        # attachment key, for each recent phrase
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def close(self):
+
+        """Stops the worker processes."""
+
+        with self.lock:
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def get_executor(self):
+
+        """
+        Returns:
+        The pool of worker processes, which is started when it is first
+        needed. Processes are spawned, instead of forked, because forking a
+        process in which other threads are running is unsafe.
+        """
+
+        # The pool is rarely needed, and importing it is slow
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    self.max_workers,
+                    mp_context=multiprocessing.get_context(u"spawn"))
+            return self.executor
+
+    def scanned_files(self, phrase):
+
+        """
+        Arguments:
+        phrase		--	A phrase in lower case.
+
+        Returns:
+        A dict with the (mtime, size, found) of the files that have been
+        scanned for the phrase, by attachment key.
+        """
+
+        with self.lock:
+            scanned = self.cache.get(phrase)
+            if scanned is None:
+                scanned = self.cache[phrase] = {}
+                if len(self.cache) > self.max_phrases:
+                    self.cache.popitem(last=False)
+            else:
+                self.cache.move_to_end(phrase)
+            return scanned
+
+    def search(self, phrase, item_ids=None, cancel=None):
+
+        """
+        Finds the items that have an attachment that contains a phrase. This
+        is a generator that yields items as they are found.
+
+        Arguments:
+        phrase		--	A phrase in lower case.
+
+        Keyword arguments:
+        item_ids	--	A set of item ids, to only search the attachments of
+                        these items, or None to search all attachments.
+                        (default=None)
+        cancel		--	A threading.Event that stops the search when it is
+                        set, or None. (default=None)
+
+        Returns:
+        A generator of item ids. An item id is yielded only once.
+        """
+
+        words = [w for w in word.findall(phrase) if len(w) > 2]
+        attachments = self.fulltext_index.attachments(words, item_ids)
+        patterns = phrase_pattern(phrase)
+        scanned = self.scanned_files(phrase)
+        found = set()
+        # Files that have not changed since they were last scanned don't
+        # need to be scanned again
+        todo = []
+        size = 0
+        for item_id, key in attachments:
+            path = os.path.join(self.storage_path, key, cache_file)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result = scanned.get(key)
+            if result is not None and result[:2] == (st.st_mtime_ns,
+                                                     st.st_size):
+                if result[2] and item_id not in found:
+                    found.add(item_id)
+                    yield item_id
+                continue
+            todo.append((item_id, key, path, st))
+            size += st.st_size
+        if not todo:
+            return
+        if self.max_workers < 2 or size < self.parallel_size:
+            for item_id, key, path, st in todo:
+                if cancel is not None and cancel.is_set():
+                    return
+                match = scan_file(path, patterns)
+                scanned[key] = st.st_mtime_ns, st.st_size, match
+                if match and item_id not in found:
+                    found.add(item_id)
+                    yield item_id
+            return
+        from concurrent.futures import as_completed
+        from concurrent.futures.process import BrokenProcessPool
+        executor = self.get_executor()
+        futures = {}
+        for i in range(0, len(todo), self.batch_size):
+            batch = todo[i:i + self.batch_size]
+            future = executor.submit(scan_files,
+                                     [path for _, _, path, _ in batch],
+                                     patterns)
+            futures[future] = batch
+        try:
+            for future in as_completed(futures):
+                if cancel is not None and cancel.is_set():
+                    return
+                batch = futures[future]
+                try:
+                    matches = future.result()
+                except BrokenProcessPool as e:
+                    # Worker processes can't be started in some environments,
+                    # so from now on files are scanned in this process
+                    print(u"libzotero.phrase_search.search(): %s" % e)
+                    self.max_workers = 1
+                    self.close()
+                    matches = scan_files([path for _, _, path, _ in batch],
+                                         patterns)
+                for (item_id, key, path, st), match in zip(batch, matches):
+                    scanned[key] = st.st_mtime_ns, st.st_size, match
+                    if match and item_id not in found:
+                        found.add(item_id)
+                        yield item_id
+        finally:
+            # Files that have not been scanned yet when the search is
+            # cancelled, or when it is not iterated any further, are skipped
+            for future in futures:
+                future.cancel()
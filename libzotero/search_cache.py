@@ -0,0 +1,182 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from collections import OrderedDict
+
+from libzotero.zotero_item import term_fields, fuzzy_term
+
+
+def cache_key(terms):
+
+    """
+    Creates a key that is the same for all queries with the same terms,
+    regardless of the order of the terms, duplicate terms, or whitespace.
+
+    Arguments:
+    terms		--	A list of (term_type, term) tuples.
+
+    Returns:
+    A tuple of (term_type, term) tuples.
+    """
+
+    return tuple(sorted(set(terms), key=lambda t: (t[0] or u"", t[1])))
+
+
+def narrows(terms, cached_terms):
+
+    """
+    Checks whether a query can only match items that another query matches
+    as well. This is the case if every term of the other query is contained
+    in a term of the query that searches the same fields or fewer, e.g.
+    "smit" is narrowed by "smith" and "author:smith".
+
+    Arguments:
+    terms			--	The terms of a query.
+    cached_terms	--	The terms of another query.
+
+    Returns:
+    True if the query narrows the other query, False otherwise.
+    """
+
+    for cached_type, cached_term in cached_terms:
+        cached_fields = term_fields[cached_type]
+        for term_type, term in terms:
+            # Words with typos that match a fuzzy term don't necessarily
+            # contain a shorter term, so fuzzy terms only narrow themselves
+            if fuzzy_term(term) is not None or \
+                    fuzzy_term(cached_term) is not None:
+                if term != cached_term:
+                    continue
+            elif cached_term not in term:
+                continue
+            if all(field in cached_fields
+                   for field in term_fields[term_type]):
+                break
+        else:
+            return False
+    return True
+
+
+class SearchCache(object):
+
+    """
+    Remembers the results of recent searches. The least recently used results
+    are forgotten when there are more than max_entries searches, or when the
+    searches together hold more than max_results items.
+    """
+
+    def __init__(self, max_entries=128, max_results=100000):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        max_entries	--	The maximum number of searches. (default=128)
+        max_results	--	The maximum total number of results. (default=100000)
+        """
+
+        self.max_entries = max_entries
+        self.max_results = max_results
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def __len__(self):
+
+        return len(self.entries)
+
+    def get(self, key):
+
+        """
+        Retrieves the results of a search.
+
+        Arguments:
+        key		--	A key as returned by cache_key().
+
+        Returns:
+        A list of zotero_items, or None if the search is not in the cache.
+        """
+
+        results = self.entries.get(key)
+        if results is not None:
+            self.entries.move_to_end(key)
+        return results
+
+    def narrowest(self, key):
+
+        """
+        Finds the smallest results of a cached search that a search narrows.
+        While typing, this is usually the search for the previous keystroke.
+
+        Arguments:
+        key		--	A key as returned by cache_key().
+
+        Returns:
+        A list of zotero_items that contains all results of the search, or
+        None if no cached search is narrowed by the search.
+        """
+
+        best = None
+        for cached_key, results in self.entries.items():
+            if (best is None or len(results) < len(best)) and \
+                    narrows(key, cached_key):
+                best = results
+        return best
+
+    def add(self, key, results):
+
+        """
+        Adds the results of a search.
+
+        Arguments:
+        key		--	A key as returned by cache_key().
+        results	--	A list of zotero_items.
+        """
+
+        if len(results) > self.max_results:
+            return
+        old_results = self.entries.pop(key, None)
+        if old_results is not None:
+            self.size -= len(old_results)
+        self.entries[key] = results
+        self.size += len(results)
+        while len(self.entries) > self.max_entries or \
+                self.size > self.max_results:
+            key, results = self.entries.popitem(last=False)
+            self.size -= len(results)
+
+    def filtered(self, keep):
+
+        """
+        Creates a copy of the cache that only contains some of the searches.
+
+        Arguments:
+        keep	--	A function that takes a key and a list of results, and
+                    returns True if the search should be kept.
+
+        Returns:
+        A SearchCache.
+        """
+
+        cache = SearchCache(self.max_entries, self.max_results)
+        for key, results in self.entries.items():
+            if keep(key, results):
+                cache.entries[key] = results
+                cache.size += len(results)
+        return cache
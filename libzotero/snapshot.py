@@ -0,0 +1,280 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+# Snapshots of the index, so that Qnotero can start without reading the
+# Zotero database.
+#
+# A snapshot file starts with a magic string and the length of a JSON header.
+# The header describes the Zotero database that the snapshot was built from
+# and lists the sections that follow it. Every section is a raw array of
+# integers. All strings are stored once, in a single UTF-8 encoded string
+# table in which they are separated by NUL characters, and are referred to by
+# their position in that table.
+
+import json
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+magic = b"QNOTERO\0"
+# Increase this whenever the layout of the snapshot changes
+format_version = 2
+
+# The scalar and list attributes of zotero_items that are stored
+scalar_fields = u"title", u"publication", u"date", u"volume", u"issue", \
+    u"doi", u"url", u"abstract", u"key"
+list_fields = u"authors", u"editors", u"tags", u"collections", u"fulltext"
+
+_prefix = struct.Struct(u"<8sI")
+
+
+class StringTable(object):
+
+    """Assigns a number to each distinct string."""
+
+    def __init__(self):
+
+        self.numbers = {}
+        self.strings = []
+
+    def number(self, s):
+
+        """
+        Arguments:
+        s		--	A string or None.
+
+        Returns:
+        The number of the string, or -1 for None.
+        """
+
+        if s is None:
+            return -1
+        n = self.numbers.get(s)
+        if n is None:
+            n = self.numbers[s] = len(self.strings)
+            self.strings.append(s)
+        return n
+
+    def numbers_of(self, strings):
+
+        """
+        Arguments:
+        strings	--	An iterable of strings.
+
+        Returns:
+        An array with the numbers of the strings.
+        """
+
+        return array(u"i", [self.number(s) for s in strings])
+
+
+def write_snapshot(path, meta, items, search_index):
+
+    """
+    Writes a snapshot file. The file is replaced atomically, so that a
+    snapshot is never read while it is being written.
+
+    Arguments:
+    path			--	The path of the snapshot file.
+    meta			--	A dict with information about the Zotero database.
+                        The values should be JSON serializable.
+    items			--	A dict with zotero_items as values.
+    search_index	--	An InvertedIndex.
+
+    Returns:
+    True if the snapshot was written, False otherwise.
+    """
+
+    meta = dict(meta)
+    strings = StringTable()
+    sections = []
+    items = list(items.values())
+    sections.append((u"id", array(u"i", [item.id for item in items])))
+    for field in scalar_fields:
+        sections.append((field, strings.numbers_of(
+            getattr(item, field) for item in items)))
+    for field in list_fields:
+        sections.append((field + u".count", array(u"i", [
+            len(getattr(item, field)) for item in items])))
+        values = array(u"i")
+        for item in items:
+            values.extend(strings.numbers_of(getattr(item, field)))
+        sections.append((field, values))
+    sections.append((u"vocabulary",
+                     strings.numbers_of(search_index.vocabulary)))
+    for field, field_postings in sorted(search_index.postings.items()):
+        sections.append((u"postings.%s.token" % field,
+                         strings.numbers_of(field_postings.keys())))
+        sections.append((u"postings.%s.count" % field, array(u"i", [
+            len(item_ids) for item_ids in field_postings.values()])))
+        item_ids = array(u"i")
+        for ids in field_postings.values():
+            item_ids.extend(ids)
+        sections.append((u"postings.%s" % field, item_ids))
+    for key in u"deleted_items", u"retracted_items":
+        sections.append((key, array(u"i", sorted(meta.pop(key)))))
+    for key in u"collection_index", u"tag_index":
+        sections.append((key, strings.numbers_of(meta.pop(key))))
+    string_table = u"\0".join(strings.strings)
+    if string_table.count(u"\0") != max(len(strings.strings) - 1, 0):
+        print(u"libzotero.snapshot.write_snapshot(): cannot store strings "
+              u"that contain NUL characters")
+        return False
+    string_table = string_table.encode(u"utf-8")
+    header = dict(meta)
+    header[u"format"] = format_version
+    header[u"byteorder"] = sys.byteorder
+    header[u"itemsize"] = array(u"i").itemsize
+    header[u"strings"] = len(string_table)
+    header[u"sections"] = [(name, len(values)) for name, values in sections]
+    header = json.dumps(header).encode(u"utf-8")
+    # Every writer gets its own temporary file, so that two processes that
+    # save a snapshot at the same time don't write to the same file
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=os.path.basename(path) + u".", suffix=u".tmp",
+            dir=os.path.dirname(path))
+        with os.fdopen(fd, u"wb") as fd:
+            fd.write(_prefix.pack(magic, len(header)))
+            fd.write(header)
+            fd.write(string_table)
+            for name, values in sections:
+                fd.write(values.tobytes())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(u"libzotero.snapshot.write_snapshot(): %s" % e)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+def read_snapshot(path):
+
+    """
+    Reads a snapshot file.
+
+    Arguments:
+    path		--	The path of the snapshot file.
+
+    Returns:
+    A (header, strings, sections) tuple, where header is a dict, strings a
+    list, and sections a dict of arrays. None if the file does not exist, or
+    if it was written by an incompatible version or on another platform.
+    """
+
+    try:
+        with open(path, u"rb") as fd:
+            data = fd.read()
+    except Exception:
+        return None
+    if len(data) < _prefix.size:
+        return None
+    # A damaged snapshot is treated as a missing one, and the index is then
+    # rebuilt from the database
+    try:
+        file_magic, header_size = _prefix.unpack_from(data)
+        if file_magic != magic:
+            return None
+        offset = _prefix.size
+        header = json.loads(data[offset:offset + header_size].decode(u"utf-8"))
+        if header.get(u"format") != format_version \
+                or header.get(u"byteorder") != sys.byteorder \
+                or header.get(u"itemsize") != array(u"i").itemsize:
+            return None
+        offset += header_size
+        strings = data[offset:offset + header[u"strings"]].decode(u"utf-8") \
+            .split(u"\0")
+        offset += header[u"strings"]
+        sections = {}
+        itemsize = header[u"itemsize"]
+        for name, length in header[u"sections"]:
+            values = array(u"i")
+            values.frombytes(data[offset:offset + length * itemsize])
+            sections[name] = values
+            offset += length * itemsize
+        if offset != len(data):
+            return None
+    except (ValueError, KeyError, TypeError, AttributeError,
+            struct.error) as e:
+        print(u"libzotero.snapshot.read_snapshot(): damaged snapshot: %s" % e)
+        return None
+    return header, strings, sections
+
+
+def restore_items(strings, sections, make_item):
+
+    """
+    Recreates the items that are stored in a snapshot.
+
+    Arguments:
+    strings		--	The string table of the snapshot.
+    sections	--	The sections of the snapshot.
+    make_item	--	A function that takes an item id and returns an empty
+                    zotero_item.
+
+    Returns:
+    A dict with item ids as keys and zotero_items as values.
+    """
+
+    index = {}
+    items = [make_item(item_id) for item_id in sections[u"id"]]
+    for field in scalar_fields:
+        for item, n in zip(items, sections[field]):
+            setattr(item, field, None if n < 0 else strings[n])
+    for field in list_fields:
+        values = sections[field]
+        i = 0
+        for item, count in zip(items, sections[field + u".count"]):
+            setattr(item, field, [strings[n] for n in values[i:i + count]])
+            i += count
+    for item in items:
+        index[item.id] = item
+    return index
+
+
+def restore_postings(strings, sections, fields):
+
+    """
+    Recreates the postings of an InvertedIndex that are stored in a snapshot.
+
+    Arguments:
+    strings		--	The string table of the snapshot.
+    sections	--	The sections of the snapshot.
+    fields		--	The indexed fields.
+
+    Returns:
+    A (postings, vocabulary) tuple.
+    """
+
+    postings = {}
+    for field in fields:
+        field_postings = postings[field] = {}
+        item_ids = sections[u"postings.%s" % field]
+        i = 0
+        for n, count in zip(sections[u"postings.%s.token" % field],
+                            sections[u"postings.%s.count" % field]):
+            field_postings[strings[n]] = item_ids[i:i + count]
+            i += count
+    vocabulary = [strings[n] for n in sections[u"vocabulary"]]
+    return postings, vocabulary
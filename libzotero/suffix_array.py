@@ -0,0 +1,151 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from array import array
+
+# Separates the words in the text of a suffix array. It sorts before all
+# other characters, so that a word sorts before the words that it is a
+# prefix of.
+separator = u"\x00"
+
+
+class SuffixArray(object):
+
+    """
+    Finds the words that contain a term anywhere, and not only at the start.
+    All words are concatenated into a single text, and the start of every
+    suffix of every word is stored in sorted order. The suffixes that start
+    with a term are adjacent, and are found by binary search, in time that
+    depends on the length of the term and the logarithm of the number of
+    suffixes, instead of on the number of words.
+
+    Words that are added later are kept in a list that is searched one by
+    one, until the suffix array is rebuilt.
+    """
+
+    def __init__(self, words=()):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        words		--	A list of words without whitespace. (default=())
+        """
+
+        self.words = list(words)
+        self.text = separator.join(self.words) + separator
+        # The number of the word to which each character of the text belongs
+        self.word_numbers = array(u"i")
+        for n, word in enumerate(self.words):
+            self.word_numbers.extend([n] * (len(word) + 1))
+        # Sorting all suffixes at once would create all of them as strings,
+        # so they are first divided by their first two characters, which
+        # already puts them in the right order relative to each other.
+        buckets = {}
+        start = 0
+        for word in self.words:
+            for i in range(len(word)):
+                bucket = buckets.get(word[i:i + 2])
+                if bucket is None:
+                    bucket = buckets[word[i:i + 2]] = array(u"i")
+                bucket.append(start + i)
+            start += len(word) + 1
+        text = self.text
+        self.suffixes = array(u"i")
+        for prefix in sorted(buckets):
+            self.suffixes.extend(sorted(
+                buckets[prefix],
+                key=lambda i: text[i:text.index(separator, i)]))
+        self.new_words = []
+
+    def copy(self):
+
+        """
+        Creates a copy to which words can be added without affecting the
+        original. The suffix array itself is shared.
+
+        Returns:
+        A SuffixArray.
+        """
+
+        suffix_array = SuffixArray()
+        suffix_array.words = self.words
+        suffix_array.text = self.text
+        suffix_array.word_numbers = self.word_numbers
+        suffix_array.suffixes = self.suffixes
+        suffix_array.new_words = list(self.new_words)
+        return suffix_array
+
+    def add(self, word):
+
+        """
+        Adds a word.
+
+        Arguments:
+        word		--	A word that has not been added before.
+        """
+
+        self.new_words.append(word)
+
+    def bound(self, term, upper):
+
+        """
+        Finds where the suffixes that start with a term begin or end.
+
+        Arguments:
+        term		--	A search term.
+        upper		--	Indicates whether the end should be found.
+
+        Returns:
+        The position in the suffix array of the first suffix that starts
+        with the term, or of the first suffix after them if upper is True.
+        """
+
+        text = self.text
+        suffixes = self.suffixes
+        m = len(term)
+        lo = 0
+        hi = len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            prefix = text[suffixes[mid]:suffixes[mid] + m]
+            if prefix < term or (upper and prefix == term):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, term):
+
+        """
+        Finds all words that contain a term.
+
+        Arguments:
+        term		--	A search term.
+
+        Returns:
+        A list of words.
+        """
+
+        i = self.bound(term, False)
+        j = self.bound(term, True)
+        numbers = set(map(self.word_numbers.__getitem__, self.suffixes[i:j]))
+        return [self.words[n] for n in numbers] + \
+            [word for word in self.new_words if term in word]
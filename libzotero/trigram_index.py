@@ -0,0 +1,173 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+
+from array import array
+from collections import Counter
+
+
+def max_distance(term):
+
+    """
+    Determines how many typos a fuzzy term may contain. Short terms would
+    match too many unrelated words if they were allowed to contain typos.
+
+    Arguments:
+    term		--	A search term.
+
+    Returns:
+    The maximum edit distance between the term and a matching word.
+    """
+
+    if len(term) < 4:
+        return 0
+    if len(term) < 8:
+        return 1
+    return 2
+
+
+def edit_distance(a, b, k):
+
+    """
+    Computes the Levenshtein distance between two words, but stops as soon as
+    the distance is known to be larger than k.
+
+    Arguments:
+    a			--	A word.
+    b			--	A word.
+    k			--	The maximum distance of interest.
+
+    Returns:
+    The distance, or k + 1 if the distance is larger than k.
+    """
+
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if min(current) > k:
+            return k + 1
+        previous = current
+    return min(previous[-1], k + 1)
+
+
+def trigrams(word):
+
+    """
+    Arguments:
+    word		--	A word.
+
+    Returns:
+    The set of three-letter sequences of the word, including sequences that
+    mark the start and end of the word.
+    """
+
+    word = u"\x02" + word + u"\x03"
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+class TrigramIndex(object):
+
+    """
+    Finds words that are similar to a search term. Words are indexed by their
+    trigrams. A word that differs from a term by k edits still shares all but
+    3k of the trigrams of the term, so only words that share enough trigrams
+    need to be compared to the term.
+
+    Words are only ever added, so that an index can be shared by several
+    InvertedIndex copies. Words that no longer occur in an InvertedIndex
+    simply have no postings there.
+    """
+
+    def __init__(self, words=()):
+
+        """
+        Constructor.
+
+        Keyword arguments:
+        words		--	An iterable of words to index. (default=())
+        """
+
+        self.words = []
+        self.numbers = {}
+        self.grams = {}
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+
+        return len(self.words)
+
+    def add(self, word):
+
+        """
+        Adds a word, if it has not been added before.
+
+        Arguments:
+        word		--	A word.
+        """
+
+        if word in self.numbers:
+            return
+        n = len(self.words)
+        self.numbers[word] = n
+        self.words.append(word)
+        for gram in trigrams(word):
+            numbers = self.grams.get(gram)
+            if numbers is None:
+                self.grams[gram] = array(u"i", [n])
+            else:
+                numbers.append(n)
+
+    def similar(self, term, k):
+
+        """
+        Finds the words that differ from a term by at most k edits.
+
+        Arguments:
+        term		--	A search term.
+        k			--	The maximum edit distance.
+
+        Returns:
+        A list of (word, distance) tuples.
+        """
+
+        grams = trigrams(term)
+        threshold = len(grams) - 3 * k
+        if threshold > 0:
+            counts = Counter()
+            for gram in grams:
+                numbers = self.grams.get(gram)
+                if numbers is not None:
+                    counts.update(numbers)
+            candidates = [self.words[n] for n, count in counts.items()
+                          if count >= threshold]
+        else:
+            candidates = self.words
+        results = []
+        for word in candidates:
+            if abs(len(word) - len(term)) <= k:
+                distance = edit_distance(term, word, k)
+                if distance <= k:
+                    results.append((word, distance))
+        return results
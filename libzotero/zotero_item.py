@@ -18,23 +18,133 @@
 
 #
 
-term_collection = None, u"collection"
-term_tag = None, u"tag"
-term_author = None, u"author"
-term_editor = None, u"editor"
-term_date = None, u"date", u"year"
-term_publication = None, u"publication", u"journal"
-term_title = None, u"title"
-term_doi = None, u"doi"
-term_abstract = None, u'abs'
-
-cache = {}
+import sys
+import unicodedata
+
+from libzotero.trigram_index import edit_distance, max_distance
+
+# The searchable fields, and the fields that are searched for each type of
+# search term
+fields = u"tag", u"collection", u"author", u"editor", u"date", u"title", \
+    u"publication", u"doi", u"abs"
+
+term_fields = {
+    None: fields,
+    u"tag": (u"tag",),
+    u"collection": (u"collection",),
+    u"author": (u"author",),
+    u"editor": (u"editor",),
+    u"date": (u"date",),
+    u"year": (u"date",),
+    u"publication": (u"publication",),
+    u"journal": (u"publication",),
+    u"title": (u"title",),
+    u"doi": (u"doi",),
+    u"abs": (u"abs",),
+    # Full-text terms are looked up in Zotero's full-text index instead
+    u"fulltext": (),
+    }
+
+# The fields in which fuzzy terms, such as "kahnemann~", also match words
+# that contain typos
+fuzzy_fields = u"author", u"title"
+
+# How much a match in each field contributes to the relevance of an item
+field_weights = {
+    u"tag": 3,
+    u"collection": 2,
+    u"author": 4,
+    u"editor": 2,
+    u"date": 2,
+    u"title": 4,
+    u"publication": 2,
+    u"doi": 3,
+    u"abs": 1,
+    }
+
+
+def normalize(text):
+
+    """
+    Brings a text into the form in which it is searched: case is folded,
+    compatibility characters are decomposed, and accents are removed, so that
+    for example "muller" matches "Müller".
+
+    Arguments:
+    text	--	A text.
+
+    Returns:
+    The normalized text.
+    """
+
+    # str.isascii() would be faster, but requires Python 3.7
+    try:
+        text.encode(u"ascii")
+    except UnicodeEncodeError:
+        pass
+    else:
+        return text.lower()
+    text = unicodedata.normalize(u"NFKD", text.casefold())
+    return u"".join(c for c in text if not unicodedata.combining(c))
+
+
+def fuzzy_term(term):
+
+    """
+    Checks whether a search term is fuzzy, i.e. whether it ends with a "~".
+
+    Arguments:
+    term	--	A search term.
+
+    Returns:
+    The term without the "~", or None if the term is not fuzzy.
+    """
+
+    if len(term) > 1 and term.endswith(u"~"):
+        return term[:-1]
+    return None
+
+
+def search_key(text, shared=False):
+
+    """
+    Normalizes a field of an item.
+
+    Arguments:
+    text		--	A text.
+
+    Keyword arguments:
+    shared		--	Indicates whether the text occurs in many items, like
+                    names and tags, in which case all items share a single
+                    copy of the normalized text. (default=False)
+
+    Returns:
+    The normalized text, which is the text itself if normalizing doesn't
+    change it.
+    """
+
+    key = normalize(text)
+    if key == text:
+        return text
+    if shared:
+        return sys.intern(key)
+    return key
 
 
 class zoteroItem(object):
 
     """Represents a single zotero item."""
 
+    # Large libraries contain many items, so don't give each of them a
+    # __dict__
+    __slots__ = u"id", u"title", u"collections", u"publication", u"authors", \
+        u"editors", u"tags", u"issue", u"volume", u"fulltext", u"date", \
+        u"key", u"doi", u"abstract", u"url", u"noteProvider", u"note", \
+        u"search_keys", u"gnotero_format_str", u"html_format_str", \
+        u"simple_format_str", u"filename_format_str"
+
+    collection_color = u"#000000"
+
     def __init__(self, item=None, noteProvider=None):
 
         """
@@ -50,9 +160,9 @@ class zoteroItem(object):
         self.html_format_str = None
         self.simple_format_str = None
         self.filename_format_str = None
-        self.collection_color = u"#000000"
         self.noteProvider = noteProvider
         self.note = -1
+        self.search_keys = None
         if isinstance(item, dict):
             # TODO: Add the information like bookTitle, programTitle, etc. It seems that this code is not used
             # anywhere
@@ -117,83 +227,176 @@ class zoteroItem(object):
             else:
                 self.abstract = item[u'abstractNote']
         else:
-            self.title = None
-            self.collections = []
-            self.publication = None
-            self.authors = []
-            self.editors = []
-            self.tags = []
-            self.issue = None
-            self.volume = None
-            self.fulltext = []
-            self.date = None
-            self.key = None
-            self.doi = None
-            self.abstract = None
-            self.url = None
+            self.reset()
             if isinstance(item, int):
                 self.id = item
             else:
                 self.id = None
 
+    def reset(self):
+
+        """
+        Clears all bibliographic information and cached representations, so
+        that the item can be filled again from the database. The item id is
+        left untouched.
+        """
+
+        self.title = None
+        self.collections = []
+        self.publication = None
+        self.authors = []
+        self.editors = []
+        self.tags = []
+        self.issue = None
+        self.volume = None
+        self.fulltext = []
+        self.date = None
+        self.key = None
+        self.doi = None
+        self.abstract = None
+        self.url = None
+        self.search_keys = None
+        self.gnotero_format_str = None
+        self.html_format_str = None
+        self.simple_format_str = None
+        self.filename_format_str = None
+        self.note = -1
+
+    def get_search_keys(self):
+
+        """
+        Retrieves the searchable text of the item. The text is normalized only
+        once, and is then reused for all searches.
+
+        Returns:
+        A tuple of (field, text) tuples, where the text has been normalized in
+        the same way as search terms.
+        """
+
+        if self.search_keys is None:
+            keys = [(u"tag", search_key(tag, True)) for tag in self.tags]
+            keys += [(u"collection", search_key(collection, True))
+                     for collection in self.collections]
+            keys += [(u"author", search_key(author, True))
+                     for author in self.authors]
+            keys += [(u"editor", search_key(editor, True))
+                     for editor in self.editors]
+            if self.date is not None:
+                keys.append((u"date", search_key(self.date, True)))
+            if self.title is not None:
+                keys.append((u"title", search_key(self.title)))
+            if self.publication is not None:
+                keys.append((u"publication",
+                             search_key(self.publication, True)))
+            if self.doi is not None:
+                keys.append((u"doi", search_key(self.doi)))
+            if self.abstract is not None:
+                keys.append((u"abs", search_key(self.abstract)))
+            self.search_keys = tuple(keys)
+        return self.search_keys
+
     def match(self, terms):
 
         """
         Matches the current item against a term.
 
         Arguments:
-        terms	--	A list of (term_type, term) tuples.
+        terms	--	A list of (term_type, term) tuples, where the terms have
+                    been normalized.
 
         Returns:
         True if the current item matches the terms, False otherwise.
         """
 
-        global term_collection, term_author, term_title, term_date, \
-            term_publication, term_tag
         # Nothing to search
         if len(terms) == 0:
             return False
-        # Walk through all search terms
+        keys = self.get_search_keys()
+        # Walk through all search terms, and return False as soon as one of
+        # them doesn't match any of the fields
         for term_type, term in terms:
-            match = False
-            # Do at least one criteria match?
-            if term_type in term_tag:
-                for tag in self.tags:
-                    if term in tag.lower():
-                        match = True
-            if term_type in term_collection:
-                for collection in self.collections:
-                    if term in collection.lower():
-                        match = True
-            if not match and term_type in term_author:
-                for author in self.authors:
-                    if term in author.lower():
-                        match = True
-            if not match and term_type in term_editor:
-                for editor in self.editors:
-                    if term in editor.lower():
-                        match = True
-            if not match and self.date is not None and term_type in term_date:
-                if term in self.date:
-                    match = True
-            if not match and self.title is not None and term_type in \
-                    term_title and term in self.title.lower():
-                match = True
-            if not match and self.publication is not None and term_type in \
-                    term_publication and term in self.publication.lower():
-                match = True
-            if not match and self.doi is not None and term_type in \
-                    term_doi and term in self.doi.lower():
-                match = True
-            if not match and self.abstract is not None and term_type in \
-                    term_abstract and term in self.abstract.lower():
-                match = True
-            # If not return false, otherwise continue
-            if not match:
+            fields = term_fields[term_type]
+            fuzzy = fuzzy_term(term)
+            if fuzzy is not None:
+                if not self.fuzzy_score(fuzzy, fields):
+                    return False
+                continue
+            for field, text in keys:
+                if field in fields and term in text:
+                    break
+            else:
                 return False
         # If we reach this code, all the criteria matched
         return True
 
+    def score(self, terms):
+
+        """
+        Rates how well the current item matches the terms, based on the
+        fields in which they occur.
+
+        Arguments:
+        terms	--	A list of (term_type, term) tuples, which the item matches.
+
+        Returns:
+        The sum of the highest weight of a matching field for each term.
+        """
+
+        # Full-text terms are not searched in the fields of the item, so the
+        # fields don't need to be normalized for them
+        if not terms:
+            return 0
+        keys = self.get_search_keys()
+        score = 0
+        for term_type, term in terms:
+            fields = term_fields[term_type]
+            fuzzy = fuzzy_term(term)
+            if fuzzy is not None:
+                score += self.fuzzy_score(fuzzy, fields)
+                continue
+            best = 0
+            for field, text in keys:
+                if field in fields and field_weights[field] > best and \
+                        term in text:
+                    best = field_weights[field]
+            score += best
+        return score
+
+    def fuzzy_score(self, term, fields):
+
+        """
+        Rates how well a fuzzy term matches the current item. The term
+        matches if it occurs in one of the fields, or if a word in one of the
+        fuzzy fields differs from it only by a few typos. Matches with typos
+        count for half.
+
+        Arguments:
+        term	--	A fuzzy term without the "~".
+        fields	--	The fields that are searched.
+
+        Returns:
+        The highest weight of a matching field, or 0 if the term doesn't
+        match.
+        """
+
+        keys = self.get_search_keys()
+        best = 0
+        for field, text in keys:
+            if field in fields and field_weights[field] > best and \
+                    term in text:
+                best = field_weights[field]
+        k = max_distance(term)
+        if k == 0:
+            return best
+        for field, text in keys:
+            if field in fields and field in fuzzy_fields and \
+                    field_weights[field] / 2. > best:
+                for word in text.split():
+                    if edit_distance(term, word, k) <= k:
+                        best = field_weights[field] / 2.
+                        break
+        return best
+
     def get_note(self):
 
         """
@@ -212,6 +415,32 @@ class zoteroItem(object):
         else:
             return None
 
+    def as_dict(self):
+
+        """
+        Returns:
+        A dict with the bibliographic information of the item, which can be
+        converted to JSON.
+        """
+
+        return {
+            u"id": self.id,
+            u"key": self.key,
+            u"authors": list(self.authors),
+            u"editors": list(self.editors or ()),
+            u"date": self.date,
+            u"title": self.title,
+            u"publication": self.publication,
+            u"volume": self.volume,
+            u"issue": self.issue,
+            u"doi": self.doi,
+            u"url": self.url,
+            u"abstract": self.abstract,
+            u"tags": list(self.tags),
+            u"collections": list(self.collections),
+            u"attachments": list(self.fulltext),
+            }
+
     def format_author(self):
 
         """
@@ -373,15 +602,3 @@ class zoteroItem(object):
             self.filename_format_str = self.format_author() + u" " + \
                 self.format_date().replace(u"\\", u"")
         return self.filename_format_str
-
-    def hashKey(self):
-
-        """
-        Returns:
-        A hash representation of the current object.
-        """
-
-        global cache
-        hashKey = str(self)
-        cache[hashKey] = self
-        return hashKey
@@ -0,0 +1,223 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero import __main__ as cli
+from libzotero.libzotero import LibZotero
+from libzotero.phrase_search import cache_file
+
+
+@pytest.fixture(scope=u"module")
+def original(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"zotero"))
+    generate(path, 200, fulltext_words=100)
+    return path
+
+
+@pytest.fixture
+def library(original, tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    monkeypatch.setenv(u"USERPROFILE", str(tmp_path))
+    path = str(tmp_path / u"zotero")
+    shutil.copytree(original, path)
+    return path
+
+
+def run(library, capsys, *argv):
+
+    """
+    Returns:
+    An (exit status, list of output lines) tuple.
+    """
+
+    # Only the output of the command itself is kept
+    capsys.readouterr()
+    status = cli.main([u"--zotero-path", library] + list(argv))
+    return status, capsys.readouterr().out.splitlines()
+
+
+def open_library(library):
+
+    zotero = LibZotero(library, auto_update=False, update_snapshot=False)
+    zotero.update()
+    return zotero
+
+
+def ranked(library, query, limit=None):
+
+    zotero = open_library(library)
+    results = list(zotero.search(query, limit=limit))
+    zotero.close()
+    return results
+
+
+def some_phrase(library):
+
+    for key in sorted(os.listdir(os.path.join(library, u"storage"))):
+        path = os.path.join(library, u"storage", key, cache_file)
+        if os.path.exists(path):
+            with open(path, encoding=u"utf-8") as f:
+                return u" ".join(f.read().split()[10:12]).lower()
+
+
+def test_json(library, capsys):
+
+    status, lines = run(library, capsys, u"search", u"neural")
+    assert status == 0
+    assert [json.loads(line) for line in lines] == \
+        [item.as_dict() for item in ranked(library, u"neural")]
+    status, lines = run(library, capsys, u"search", u"--limit", u"3",
+                        u"author:", u"doe")
+    assert status == 0
+    assert [json.loads(line)[u"key"] for line in lines] == \
+        [item.key for item in ranked(library, u"author:doe", 3)]
+
+
+@pytest.mark.parametrize(u"header", [False, True])
+def test_tsv(library, capsys, header):
+
+    argv = [u"search", u"--format", u"tsv", u"memory"]
+    if header:
+        argv.insert(1, u"--header")
+    status, lines = run(library, capsys, *argv)
+    assert status == 0
+    if header:
+        assert lines.pop(0) == u"\t".join(cli.tsv_columns)
+    rows = [line.split(u"\t") for line in lines]
+    items = ranked(library, u"memory")
+    assert [row[0] for row in rows] == [item.key for item in items]
+    assert all(len(row) == len(cli.tsv_columns) for row in rows)
+    assert rows[0][3] == u" ".join(items[0].title.split())
+
+
+def test_exit_status(library, capsys):
+
+    assert run(library, capsys, u"search", u"zzqx") == (1, [])
+    # Only the header is written if nothing is found
+    assert run(library, capsys, u"search", u"--format", u"tsv", u"--header",
+               u"zzqx") == (1, [u"\t".join(cli.tsv_columns)])
+    status, lines = run(library, capsys, u"stats")
+    assert status == 0
+    zotero = open_library(library)
+    assert json.loads(lines[0])[u"items"] == len(zotero.index) > 0
+    zotero.close()
+    for argv in [[], [u"search"], [u"search", u"--limit", u"x", u"doe"],
+                 [u"find", u"doe"]]:
+        with pytest.raises(SystemExit) as e:
+            cli.main([u"--zotero-path", library] + argv)
+        assert e.value.code == 2
+    with pytest.raises(SystemExit) as e:
+        cli.main([u"--zotero-path", os.path.dirname(library), u"stats"])
+    assert e.value.code == 2
+
+
+def test_phrase(library, capsys):
+
+    phrase = some_phrase(library)
+    status, lines = run(library, capsys, u"search",
+                        u'fulltext:"%s"' % phrase)
+    assert status == 0
+    zotero = open_library(library)
+    expected = [item.key for item in zotero.search_phrase(phrase)]
+    zotero.close()
+    assert len(expected) > 0
+    assert sorted(json.loads(line)[u"key"] for line in lines) == \
+        sorted(expected)
+    status, lines = run(library, capsys, u"search", u"--limit", u"1",
+                        u'fulltext:"%s"' % phrase)
+    assert len(lines) == 1
+
+
+def test_phrase_streaming(library):
+
+    # Each item is written and flushed as soon as it is found, before the
+    # next item is looked for
+    class Out(object):
+
+        def __init__(self):
+
+            self.lines = []
+            self.flushed = 0
+
+        def write(self, s):
+
+            self.lines.append(s)
+
+        def flush(self):
+
+            self.flushed = len(self.lines)
+
+    out = Out()
+    zotero = open_library(library)
+    items = list(zotero.index.values())[:3]
+
+    def search_phrase(phrase):
+
+        assert phrase == u"neural network"
+        for i, item in enumerate(items):
+            assert out.flushed == i
+            yield item
+
+    zotero.search_phrase = search_phrase
+    args = argparse.Namespace(format=u"json", header=False, limit=None,
+                              query=[u'fulltext:"Neural', u'network"'])
+    assert cli.search(zotero, args, out) == 0
+    assert out.flushed == 3
+    zotero.close()
+
+
+def test_snapshot_is_not_written(library, capsys):
+
+    # Without a snapshot, the library is indexed, but no snapshot is saved
+    snapshot_path = os.path.join(os.environ[u"HOME"], u".qnotero.index")
+    status, lines = run(library, capsys, u"search", u"neural")
+    assert status == 0
+    assert [json.loads(line)[u"key"] for line in lines] == \
+        [item.key for item in ranked(library, u"neural")]
+    assert not os.path.exists(snapshot_path)
+    # Items that have changed since the snapshot was saved are found, but
+    # the snapshot is left as it is
+    zotero = LibZotero(library)
+    zotero.close()
+    with open(snapshot_path, u"rb") as fd:
+        snapshot = fd.read()
+    conn = sqlite3.connect(os.path.join(library, u"zotero.sqlite"))
+    item_id = conn.execute(u"select min(itemID) from itemData "
+                           u"where fieldID = 1").fetchone()[0]
+    conn.execute(u"insert into itemDataValues (value) values (?)",
+                 (u"Quixotic renamed title",))
+    conn.execute(u"""update itemData set valueID = last_insert_rowid()
+        where itemID = ? and fieldID = 1""", (item_id,))
+    conn.execute(u"""update items set clientDateModified =
+        datetime('now') where itemID = ?""", (item_id,))
+    conn.commit()
+    conn.close()
+    status, lines = run(library, capsys, u"search", u"quixotic")
+    assert status == 0 and len(lines) == 1
+    with open(snapshot_path, u"rb") as fd:
+        assert fd.read() == snapshot
@@ -0,0 +1,74 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+import os.path
+import sqlite3
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero.libzotero import LibZotero, parse_query
+
+# The parents of the attachments that contain a word that starts with a term
+word_query = u"""
+    select distinct itemAttachments.parentItemID
+    from fulltextWords, fulltextItemWords, itemAttachments
+    where fulltextWords.word >= ? and fulltextWords.word < ?
+        and fulltextItemWords.wordID = fulltextWords.wordID
+        and itemAttachments.itemID = fulltextItemWords.itemID
+    """
+
+
+@pytest.fixture(scope=u"module")
+def library(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"zotero"))
+    generate(path, 200, fulltext_words=300)
+    return path
+
+
+@pytest.fixture
+def zotero(library, tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    monkeypatch.setenv(u"USERPROFILE", str(tmp_path))
+    zotero = LibZotero(library)
+    yield zotero
+    zotero.close()
+
+
+def test_fulltext_terms_keep_accents():
+
+    assert parse_query(u"Müller fulltext:Müller") == \
+        [(None, u"muller"), (u"fulltext", u"müller")]
+
+
+@pytest.mark.parametrize(u"query, word", [
+    (u"fulltext:café", u"café"),
+    (u"fulltext:Café", u"café"),
+    (u"fulltext:ærø", u"ærø"),
+    (u"fulltext:neural", u"neural"),
+    ])
+def test_fulltext_words(library, zotero, query, word):
+
+    conn = sqlite3.connect(os.path.join(library, u"zotero.sqlite"))
+    expected = set(row[0] for row in conn.execute(
+        word_query, (word, word + u"\U0010ffff"))) & set(zotero.index)
+    conn.close()
+    assert expected
+    assert set(item.id for item in zotero.search(query)) == expected
@@ -0,0 +1,180 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# Notes are looked up in an index of their headings, by the first characters
+# of the author and by year. This should find the same notes as reading all
+# notes for every search.
+
+import os
+import random
+import re
+
+import pytest
+
+from libzotero._noteProvider import gnoteProvider
+from libzotero._noteProvider.gnoteProvider import GnoteProvider
+
+# Authors that are shorter than the key length are looked up differently
+authors = [u"Li", u"Lin", u"Liu", u"Doe", u"Doering", u"Smith", u"O",
+           u"Wu", u"Müller"]
+years = [u"2001", u"2002", u"2003"]
+
+pytestmark = pytest.mark.skipif(os.name != u"posix",
+                                reason=u"Gnote only runs on POSIX systems")
+
+
+class Item(object):
+
+    def __init__(self, author, date):
+
+        self.authors = [author]
+        self.date = date
+
+
+def random_note(rng):
+
+    lines = [u"Reading notes"]
+    for i in range(rng.randint(0, 6)):
+        author = rng.choice(authors)
+        year = rng.choice(years)
+        lines.append(rng.choice([
+            u"<bold>%s et al. (%s)</bold>" % (author, year),
+            u"<bold>%s and %s (%s) on memory</bold>" % (
+                author, rng.choice(authors), year),
+            u"<bold>%s (ed.) (%s)</bold>" % (author, year),
+            u"<bold>%s (%sa)</bold>" % (author, year),
+            u"<bold>Review of %s (%s)</bold>" % (author, year),
+            u"<bold>%s</bold>" % author,
+            u"%s (%s) is cited here" % (author, year),
+            ]))
+        lines += [u"Some text about %s" % rng.choice(authors)] * \
+            rng.randint(0, 2)
+    return u"<note><text><note-content version=\"0.1\">%s</note-content>" \
+        u"</text></note>\n" % u"\n".join(lines)
+
+
+def write_note(path, text):
+
+    with open(path, u"w", encoding=u"utf-8") as f:
+        f.write(text)
+
+
+def linear_scan(path, item):
+
+    """
+    Returns:
+    The paths of all notes with a heading that matches an item, found by
+    reading every note as Qnotero did before the headings were indexed.
+    """
+
+    p = re.compile(r"<bold>%s.*\(%s\)" % (item.authors[0], item.date),
+                   re.IGNORECASE)
+    found = set()
+    for name in os.listdir(path):
+        if os.path.splitext(name)[1] != u".note":
+            continue
+        with open(os.path.join(path, name), encoding=u"utf-8") as f:
+            if p.search(f.read()) is not None:
+                found.add(os.path.join(path, name))
+    return found
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    path = tmp_path / u".local" / u"share" / u"gnote"
+    path.mkdir(parents=True)
+    rng = random.Random(0)
+    for i in range(60):
+        write_note(str(path / (u"%d.note" % i)), random_note(rng))
+    write_note(str(path / u"manifest.xml"), u"<bold>Doe (2001)</bold>")
+    # Of several matching notes, the one with the first path is returned,
+    # so that all matching notes can be found
+    monkeypatch.setattr(gnoteProvider.GnoteNote, u"matchScore",
+                        lambda note, item: note.cmd)
+    provider = GnoteProvider(None)
+    provider.rescan_interval = 0
+    assert provider.path == str(path)
+    return provider
+
+
+def note_path(note):
+
+    return None if note is None else note.cmd.split(u"=", 1)[1]
+
+
+def check(provider):
+
+    checked = 0
+    for author in authors + [u"Do", u"Lo", u"Smi"]:
+        for year in years + [u"2004"]:
+            item = Item(author, year)
+            found = linear_scan(provider.path, item)
+            note = provider.search(item)
+            assert note_path(note) == (min(found) if found else None), \
+                (author, year)
+            if note is not None:
+                assert u"<b>%s</b>" % year in note.preview
+                checked += 1
+    return checked
+
+
+def test_search(provider):
+
+    assert check(provider) > 20
+
+
+def test_changed_notes(provider):
+
+    check(provider)
+    rng = random.Random(1)
+    names = sorted(os.listdir(provider.path))
+    for name in names[:10]:
+        os.remove(os.path.join(provider.path, name))
+    for name in names[10:20]:
+        write_note(os.path.join(provider.path, name), random_note(rng))
+    for i in range(10):
+        write_note(os.path.join(provider.path, u"new%d.note" % i),
+                   random_note(rng))
+    # A change that keeps the size of a note is found by its time
+    name = os.path.join(provider.path, names[20])
+    with open(name, encoding=u"utf-8") as f:
+        text = f.read()
+    write_note(name, text.replace(u"200", u"199"))
+    st = os.stat(name)
+    os.utime(name, (st.st_atime, st.st_mtime + 10))
+    check(provider)
+    assert len(provider.notes) == 60
+    # Notes are only read again if they have changed
+    read = []
+    parse = provider.parse
+    provider.parse = lambda path: read.append(path) or parse(path)
+    write_note(name, text)
+    os.utime(name, (st.st_atime, st.st_mtime + 20))
+    check(provider)
+    assert read == [name]
+
+
+def test_missing_folder(tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    provider = GnoteProvider(None)
+    assert provider.path is None
+    assert provider.search(Item(u"Doe", u"2001")) is None
@@ -0,0 +1,159 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+import json
+import threading
+import time
+
+import pytest
+
+from libqnotero import listener
+from libqnotero.listener import Listener, connect, header, receive, send
+from libzotero.libzotero import SearchResults
+
+
+class Item(object):
+
+    def __init__(self, item_id):
+
+        self.id = item_id
+
+    def as_dict(self):
+
+        return {u"id": self.id}
+
+
+class Zotero(object):
+
+    """Answers searches, and blocks searches for "slow" until released"""
+
+    def __init__(self):
+
+        self.release = threading.Event()
+
+    def search(self, query, limit=None):
+
+        if query == u"slow":
+            assert self.release.wait(10)
+        if query == u"fail":
+            raise ValueError(u"failed")
+        items = [Item(i) for i in range(len(query))]
+        return SearchResults(items[:limit], len(items))
+
+    def stats(self):
+
+        return {u"items": 3}
+
+
+class Signal(object):
+
+    def __init__(self):
+
+        self.emitted = 0
+
+    def emit(self):
+
+        self.emitted += 1
+
+
+class Qnotero(object):
+
+    def __init__(self):
+
+        self.zotero = Zotero()
+        self.sysTray = type(u"SysTray", (), {})()
+        self.sysTray.listenerActivated = Signal()
+        self.indexer = type(u"Indexer", (), {})()
+        self.indexer.update = lambda: None
+
+
+@pytest.fixture
+def qnotero(tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    monkeypatch.setattr(listener, u"getConfig", lambda key: 0)
+    if not listener.useUnixSocket():
+        pytest.skip(u"needs Unix domain sockets")
+    qnotero = Qnotero()
+    server = Listener(qnotero)
+    server.start()
+    yield qnotero
+    qnotero.zotero.release.set()
+    server.stop()
+    server.join(5)
+
+
+def test_commands(qnotero):
+
+    assert send(u"activate") == {u"ok": True}
+    assert qnotero.sysTray.listenerActivated.emitted == 1
+    assert send(u"search abcd") == {
+        u"total": 4, u"results": [{u"id": i} for i in range(4)]}
+    assert send(u"stats") == {u"items": 3}
+    assert send(u"reindex") == {u"ok": True}
+    assert send(u"search fail") == {u"error": u"failed"}
+    assert u"error" in send(u"unknown")
+
+
+def test_fragmented_messages(qnotero):
+
+    # Several commands in one write, split at arbitrary places, are all
+    # answered in order
+    data = b""
+    for command in u"search a", u"stats", u"search abc", u"search ä":
+        message = command.encode(u"utf-8")
+        data += header.pack(len(message)) + message
+    sock = connect()
+    try:
+        for i in range(0, len(data), 3):
+            sock.sendall(data[i:i + 3])
+            time.sleep(.001)
+        replies = [json.loads(receive(sock).decode(u"utf-8"))
+                   for i in range(4)]
+    finally:
+        sock.close()
+    assert [reply.get(u"total") for reply in replies] == [1, None, 3, 1]
+
+
+def test_message_too_long(qnotero):
+
+    sock = connect()
+    try:
+        sock.sendall(header.pack(listener.max_message_size + 1))
+        with pytest.raises(ConnectionError):
+            receive(sock)
+    finally:
+        sock.close()
+    assert send(u"stats") == {u"items": 3}
+
+
+def test_slow_search(qnotero):
+
+    # A slow search doesn't hold up other clients, and its reply still
+    # comes before the replies to later commands on the same connection
+    slow = connect()
+    try:
+        for command in b"search slow", b"stats":
+            slow.sendall(header.pack(len(command)) + command)
+        assert send(u"activate", timeout=2.) == {u"ok": True}
+        assert send(u"search ab", timeout=2.)[u"total"] == 2
+        qnotero.zotero.release.set()
+        assert json.loads(receive(slow).decode(u"utf-8"))[u"total"] == 4
+        assert json.loads(receive(slow).decode(u"utf-8")) == {u"items": 3}
+    finally:
+        slow.close()
@@ -0,0 +1,145 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+import os
+import threading
+
+import pytest
+
+from libzotero._noteProvider.mdNoteProvider import MdNoteProvider
+
+notes = {
+    u"by-key.md": u"---\nzotero-key: ABCD2345\n---\nNotes on the key item\n",
+    u"by-link.md": u"See zotero://select/library/items/LINK2345 for this.\n",
+    u"by-doi.md": u"# Reading\n\nhttps://doi.org/10.1234/Some.Paper.\n",
+    u"by-cite.md": u"---\ncitekey: \"@smith2010\"\n---\nSmith's paper\n",
+    u"@jones2001.md": u"Notes named after the citation key\n",
+    u"sub/headings.md": u"# Papers\n\n## Müller et al. (2015)\nFirst\n\n"
+                        u"### Details\nMore\n\n## Other 2016\nSecond\n",
+    u".hidden/doe2019.md": u"Hidden\n",
+    u"ignored.pdf": u"doe2019\n",
+    }
+
+
+class Item(object):
+
+    def __init__(self, key=None, doi=None, authors=(), date=None):
+
+        self.key = key
+        self.doi = doi
+        self.authors = list(authors)
+        self.date = date
+
+
+def write_notes(path, notes):
+
+    for rel_path, text in notes.items():
+        note_path = os.path.join(path, rel_path)
+        os.makedirs(os.path.dirname(note_path), exist_ok=True)
+        with open(note_path, u"w", encoding=u"utf-8") as f:
+            f.write(text)
+
+
+@pytest.fixture
+def provider(tmp_path):
+
+    path = str(tmp_path / u"notes")
+    write_notes(path, notes)
+    provider = MdNoteProvider(path, str(tmp_path / u"index"))
+    provider.rescan_interval = 0
+    return provider
+
+
+def note_name(note):
+
+    return None if note is None else \
+        os.path.relpath(note.path, os.path.dirname(note.path))
+
+
+@pytest.mark.parametrize(u"item, expected", [
+    (Item(key=u"ABCD2345"), u"by-key.md"),
+    (Item(key=u"LINK2345"), u"by-link.md"),
+    (Item(doi=u"10.1234/some.paper"), u"by-doi.md"),
+    (Item(authors=[u"Smith"], date=u"2010"), u"by-cite.md"),
+    (Item(authors=[u"Jones"], date=u"2001"), u"@jones2001.md"),
+    (Item(authors=[u"Muller"], date=u"2015"), u"headings.md"),
+    (Item(authors=[u"Other"], date=u"2016"), u"headings.md"),
+    (Item(authors=[u"Doe"], date=u"2019"), None),
+    (Item(key=u"NONE2345", authors=[u"Smith"], date=u"2011"), None),
+    ])
+def test_search(provider, item, expected):
+
+    assert note_name(provider.search(item)) == expected
+
+
+def test_heading_preview(provider):
+
+    note = provider.search(Item(authors=[u"Muller"], date=u"2015"))
+    # The part under the heading, including its subheadings, is previewed
+    assert u"First" in note.preview and u"More" in note.preview
+    assert u"Second" not in note.preview
+
+
+def test_changed_notes(provider):
+
+    item = Item(authors=[u"Smith"], date=u"2010")
+    assert note_name(provider.search(item)) == u"by-cite.md"
+    os.remove(os.path.join(provider.path, u"by-cite.md"))
+    write_notes(provider.path, {u"smith2010.txt": u"Moved\n"})
+    assert note_name(provider.search(item)) == u"smith2010.txt"
+    with open(os.path.join(provider.path, u"smith2010.txt"), u"w") as f:
+        f.write(u"Changed, and no longer about it\n")
+    os.rename(os.path.join(provider.path, u"smith2010.txt"),
+              os.path.join(provider.path, u"other.txt"))
+    assert provider.search(item) is None
+
+
+def test_stored_index(provider, tmp_path, monkeypatch):
+
+    item = Item(key=u"ABCD2345")
+    assert note_name(provider.search(item)) == u"by-key.md"
+    # No temporary files are left behind
+    assert sorted(os.listdir(str(tmp_path))) == [u"index", u"notes"]
+    # Notes that haven't changed are not read again
+    reopened = MdNoteProvider(provider.path, provider.index_path)
+    monkeypatch.setattr(reopened, u"parse", lambda rel_path: 1 / 0)
+    assert note_name(reopened.search(item)) == u"by-key.md"
+
+
+def test_search_during_scan(provider):
+
+    item = Item(key=u"ABCD2345")
+    assert note_name(provider.search(item)) == u"by-key.md"
+    # While another thread scans the folder, the current index is used
+    scanning = threading.Event()
+    release = threading.Event()
+    scan = provider.scan
+
+    def slow_scan():
+
+        scanning.set()
+        release.wait(10)
+        scan()
+
+    provider.scan = slow_scan
+    thread = threading.Thread(target=provider.search, args=(item,))
+    thread.start()
+    assert scanning.wait(10)
+    assert note_name(provider.search(item)) == u"by-key.md"
+    release.set()
+    thread.join(10)
@@ -0,0 +1,153 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# Phrase searches only decode the parts of files that are not ASCII, and
+# only scan the files that contain the words of a phrase. They should find
+# the same as a scan of the entire normalized text of every file.
+
+import os
+import random
+import re
+import sqlite3
+import unicodedata
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero.libzotero import LibZotero
+from libzotero.phrase_search import cache_file, phrase_pattern, scan_file
+from libzotero.zotero_item import normalize
+
+# Words with accents, ligatures, and other characters that are not ASCII,
+# both composed and decomposed
+special_words = [u"café", u"Naïve", unicodedata.normalize(u"NFD", u"naïve"),
+                 u"Ærø", u"ﬁnal", u"“quoted”", u"Müller", u"straße",
+                 u"résumé", u"naive", u"cafe", u"final", u"muller"]
+
+ascii_words = [u"the", u"neural", u"network", u"of", u"memory", u"a",
+               u"attention", u"in", u"cognition"]
+
+
+def brute_force(text, phrase):
+
+    return re.search(phrase_pattern(phrase)[1], normalize(text)) is not None
+
+
+def random_text(rng):
+
+    words = []
+    for i in range(rng.randint(1, 40)):
+        if rng.random() < .3:
+            words.append(rng.choice(special_words))
+        else:
+            words.append(rng.choice(ascii_words))
+        # Long stretches of ASCII text separate the parts that are decoded
+        if rng.random() < .05:
+            words += rng.choices(ascii_words, k=rng.randint(50, 500))
+    text = u""
+    for w in words:
+        text += w + rng.choice([u" ", u" ", u"\n", u"  ", u" "])
+    return text
+
+
+def random_phrase(rng, text):
+
+    words = text.split()
+    i = rng.randrange(len(words))
+    phrase = u" ".join(words[i:i + rng.randint(1, 3)])
+    if rng.random() < .3:
+        phrase = normalize(phrase)
+    elif rng.random() < .3:
+        phrase = u" ".join(rng.choices(special_words + ascii_words, k=2))
+    return phrase.lower()
+
+
+def test_scan_file(tmp_path):
+
+    rng = random.Random(0)
+    path = str(tmp_path / cache_file)
+    for i in range(300):
+        text = random_text(rng)
+        with open(path, u"w", encoding=u"utf-8") as f:
+            f.write(text)
+        for j in range(5):
+            phrase = random_phrase(rng, text)
+            assert scan_file(path, phrase_pattern(phrase)) == \
+                brute_force(text, phrase), (text, phrase)
+
+
+@pytest.fixture(scope=u"module")
+def library(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"zotero"))
+    generate(path, 200, fulltext_words=300)
+    return path
+
+
+@pytest.fixture
+def zotero(library, tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    monkeypatch.setenv(u"USERPROFILE", str(tmp_path))
+    zotero = LibZotero(library)
+    yield zotero
+    zotero.close()
+
+
+def attachment_texts(library):
+
+    """
+    Returns:
+    A list of (parent item id, text) tuples for all attachments with text.
+    """
+
+    conn = sqlite3.connect(os.path.join(library, u"zotero.sqlite"))
+    texts = []
+    for parent_id, key in conn.execute(u"""
+            select itemAttachments.parentItemID, items.key
+            from itemAttachments, items
+            where items.itemID = itemAttachments.itemID"""):
+        path = os.path.join(library, u"storage", key, cache_file)
+        if os.path.exists(path):
+            with open(path, encoding=u"utf-8") as f:
+                texts.append((parent_id, f.read()))
+    conn.close()
+    return texts
+
+
+@pytest.mark.parametrize(u"parallel", [False, True])
+def test_search_phrase(library, zotero, parallel):
+
+    if parallel:
+        zotero.phrase_search.max_workers = 2
+        zotero.phrase_search.parallel_size = 0
+    texts = attachment_texts(library)
+    rng = random.Random(1)
+    # Phrases are typed with the accents of the text, because the words of
+    # a phrase are first looked up in Zotero's word tables
+    phrases = [u"xqzv wkly", u"café", u"ærø caf"]
+    for i in range(20):
+        words = rng.choice(texts)[1].split()
+        i = rng.randrange(len(words) - 3)
+        phrases.append(u" ".join(words[i:i + rng.randint(2, 3)]).lower())
+    for phrase in phrases:
+        expected = set(parent_id for parent_id, text in texts
+                       if brute_force(text, phrase)) & set(zotero.index)
+        assert set(item.id for item in zotero.search_phrase(phrase)) == \
+            expected, phrase
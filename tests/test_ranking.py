@@ -0,0 +1,161 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# Search results are ranked by relevance, and retrieved one page at a time.
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero.libzotero import LibZotero, parse_query
+from libzotero.search_cache import cache_key
+
+queries = [u"memory", u"neural network", u"author:doe", u"tag:review",
+           u"2010", u"netwrk~", u"title:the", u"zzqx"]
+
+
+@pytest.fixture(scope=u"module")
+def library(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"zotero"))
+    generate(path, 500)
+    return path
+
+
+@pytest.fixture
+def zotero(library, tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    monkeypatch.setenv(u"USERPROFILE", str(tmp_path))
+    zotero = LibZotero(library)
+    yield zotero
+    zotero.close()
+
+
+def ids(results):
+
+    return [item.id for item in results]
+
+
+def fields(item, term):
+
+    """
+    Returns:
+    The set of fields of an item that contain a term.
+    """
+
+    return set(field for field, text in item.get_search_keys()
+               if term in text)
+
+
+@pytest.mark.parametrize(u"query", queries)
+@pytest.mark.parametrize(u"page_size", [1, 7, 50])
+def test_pages(zotero, query, page_size):
+
+    key = cache_key(parse_query(query))
+    matches = [item for item in zotero.index.values() if item.match(key)]
+    results = zotero.search(query)
+    assert results.total == len(results) == len(matches)
+    assert sorted(ids(results)) == sorted(ids(matches))
+    pages = []
+    offset = 0
+    while True:
+        page = zotero.search(query, limit=page_size, offset=offset)
+        assert page.total == len(matches)
+        assert len(page) <= page_size
+        if len(page) == 0:
+            break
+        pages += ids(page)
+        offset += len(page)
+    assert pages == ids(results)
+    # Further pages are also retrieved from the results themselves
+    first = zotero.search(query, limit=page_size)
+    pages = ids(first)
+    while len(pages) < first.total:
+        pages += ids(first.page(len(pages), page_size))
+    assert pages == ids(results)
+    assert len(zotero.search(query, limit=10, offset=len(matches))) == 0
+
+
+@pytest.mark.parametrize(u"query", queries)
+def test_order(zotero, query):
+
+    # Items are ordered by relevance, and items that are equally relevant
+    # by id
+    key = cache_key(parse_query(query))
+    ranking = [(-zotero.relevance(item, key), item.id)
+               for item in zotero.search(query)]
+    assert ranking == sorted(ranking)
+
+
+@pytest.mark.parametrize(u"query, better, worse", [
+    (u"memory", u"title", u"abs"),
+    (u"attention", u"title", u"abs"),
+    (u"doe", u"author", u"abs"),
+    ])
+def test_field_weights(zotero, query, better, worse):
+
+    # Items that contain a word in an important field come before items that
+    # contain it in a less important field only
+    results = zotero.search(query)
+    matched = [fields(item, query) for item in results]
+    better_rows = [i for i, f in enumerate(matched) if better in f]
+    worse_rows = [i for i, f in enumerate(matched)
+                  if worse in f and len(f) == 1]
+    assert better_rows and worse_rows
+    assert max(better_rows) < min(worse_rows)
+
+
+def test_recency(zotero):
+
+    # Of the items that match equally well, recent items come first
+    key = cache_key(parse_query(u"memory"))
+    results = zotero.search(u"memory")
+    checked = 0
+    for item, next_item in zip(results, results[1:]):
+        if item.score(key) != next_item.score(key):
+            continue
+        ages = [zotero.current_year - int(i.date) for i in (item, next_item)]
+        if ages[1] < zotero.recency_years:
+            assert ages[0] <= ages[1], (item.date, next_item.date)
+            checked += 1
+    assert checked > 10
+
+
+def test_opened(zotero):
+
+    # An item that has been opened comes before items that match equally
+    # well, also if they are more recent
+    key = cache_key(parse_query(u"memory"))
+    results = zotero.search(u"memory")
+    top_score = results[0].score(key)
+    opened = [item for item in results if item.score(key) == top_score][-1]
+    assert opened is not results[0]
+    for i in range(2):
+        zotero.item_opened(opened)
+    results = zotero.search(u"memory")
+    assert results[0] is opened
+    # Opening an item that only contains a word in its abstract does not
+    # move it above the items that contain the word in their title
+    abs_only = [item for item in results
+                if fields(item, u"memory") == set([u"abs"])]
+    zotero.item_opened(abs_only[0])
+    results = zotero.search(u"memory")
+    assert ids(results).index(abs_only[0].id) > \
+        max(i for i, item in enumerate(results)
+            if u"title" in fields(item, u"memory"))
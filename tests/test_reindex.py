@@ -0,0 +1,221 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# Reindexing only the items that have changed should give the same index as
+# building it again from scratch.
+
+import os.path
+import shutil
+import sqlite3
+import time
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero.libzotero import LibZotero
+
+queries = [u"neural", u"author:doe", u"tag:review", u"collection:memory",
+           u"2010", u"kahnemann~", u"title:ecology"]
+
+
+@pytest.fixture(scope=u"module")
+def original(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"original"))
+    generate(path, 300)
+    return path
+
+
+@pytest.fixture
+def library(original, tmp_path):
+
+    path = str(tmp_path / u"zotero")
+    shutil.copytree(original, path)
+    return path
+
+
+def open_library(path, home, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", home)
+    monkeypatch.setenv(u"USERPROFILE", home)
+    return LibZotero(path)
+
+
+def touch(conn, item_id):
+
+    conn.execute(u"update items set clientDateModified = ? where itemID = ?",
+                 (time.strftime(u"%Y-%m-%d %H:%M:%S", time.gmtime()),
+                  item_id))
+
+
+def regular_items(conn):
+
+    return [row[0] for row in conn.execute(u"""
+        select items.itemID from items
+        where itemTypeID not in (1, 14)
+            and itemID not in (select itemID from deletedItems)
+        order by itemID""")]
+
+
+def edit_title(conn):
+
+    item_id = regular_items(conn)[0]
+    conn.execute(u"insert into itemDataValues (value) values (?)",
+                 (u"Quixotic renamed title",))
+    conn.execute(u"""update itemData set valueID = last_insert_rowid()
+        where itemID = ? and fieldID = 1""", (item_id,))
+    touch(conn, item_id)
+
+
+def trash(conn):
+
+    item_id = regular_items(conn)[1]
+    conn.execute(u"insert into deletedItems (itemID) values (?)", (item_id,))
+    touch(conn, item_id)
+
+
+def restore(conn):
+
+    item_id = conn.execute(u"select min(itemID) from deletedItems") \
+        .fetchone()[0]
+    conn.execute(u"delete from deletedItems where itemID = ?", (item_id,))
+    touch(conn, item_id)
+
+
+def change_tags(conn):
+
+    item_id = conn.execute(u"select min(itemID) from itemTags").fetchone()[0]
+    conn.execute(u"delete from itemTags where itemID = ?", (item_id,))
+    conn.execute(u"insert into tags (name) values (?)", (u"freshtag",))
+    conn.execute(u"insert into itemTags values (?, last_insert_rowid(), 0)",
+                 (item_id,))
+    touch(conn, item_id)
+
+
+def change_creators(conn):
+
+    item_id = regular_items(conn)[2]
+    conn.execute(u"delete from itemCreators where itemID = ?", (item_id,))
+    conn.execute(u"insert into creators (firstName, lastName, fieldMode) "
+                 u"values (?, ?, 0)", (u"Ada", u"Quuxley"))
+    conn.execute(u"insert into itemCreators values "
+                 u"(?, last_insert_rowid(), 1, 0)", (item_id,))
+    touch(conn, item_id)
+
+
+def change_attachment(conn):
+
+    # Only the attachment itself is marked as modified, as Zotero does
+    item_id = conn.execute(u"""select min(itemID) from itemAttachments
+        where contentType = 'application/pdf'""").fetchone()[0]
+    conn.execute(u"update itemAttachments set path = ? where itemID = ?",
+                 (u"storage:Renamed attachment.pdf", item_id))
+    touch(conn, item_id)
+
+
+def add_attachment(conn):
+
+    parent_id = regular_items(conn)[3]
+    conn.execute(u"""insert into items (itemTypeID, libraryID, key)
+        values (14, 1, 'NEWATTCH')""")
+    conn.execute(u"""insert into itemAttachments
+        (itemID, parentItemID, linkMode, contentType, path)
+        values (last_insert_rowid(), ?, 0, 'application/pdf',
+            'storage:New attachment.pdf')""", (parent_id,))
+    touch(conn, parent_id)
+
+
+edits = [edit_title, trash, restore, change_tags, change_creators,
+         change_attachment, add_attachment]
+
+
+def index_state(zotero):
+
+    """
+    Returns:
+    Everything that a search depends on, in a form that can be compared.
+    """
+
+    postings = dict(((field, token), sorted(item_ids))
+                    for field, field_postings in
+                    zotero.search_index.postings.items()
+                    for token, item_ids in field_postings.items()
+                    if len(item_ids) > 0)
+    return {
+        u"items": dict((item_id, item.as_dict())
+                       for item_id, item in zotero.index.items()),
+        u"postings": postings,
+        u"vocabulary": set(token for field, token in postings),
+        u"collection_index": zotero.collection_index,
+        u"tag_index": zotero.tag_index,
+        u"deleted_items": zotero.deleted_items,
+        u"retracted_items": zotero.retracted_items,
+        }
+
+
+@pytest.mark.parametrize(u"edit", [[edit] for edit in edits] + [edits],
+                         ids=[edit.__name__ for edit in edits] + [u"all"])
+def test_delta_reindex(library, tmp_path, monkeypatch, edit):
+
+    zotero = open_library(library, str(tmp_path / u"delta"), monkeypatch)
+    # Fill the search cache, so that the filtered cache is checked too
+    for query in queries:
+        zotero.search(query)
+    conn = sqlite3.connect(os.path.join(library, u"zotero.sqlite"))
+    for f in edit:
+        f(conn)
+    conn.commit()
+    conn.close()
+    reindexed = []
+    reindex_items = zotero.reindex_items
+    monkeypatch.setattr(zotero, u"reindex_items", lambda changed:
+                        reindexed.append(changed) or reindex_items(changed))
+    assert zotero.update()
+    assert len(reindexed) == 1 and len(reindexed[0]) > 0
+    rebuilt = open_library(library, str(tmp_path / u"full"), monkeypatch)
+    assert index_state(zotero) == index_state(rebuilt)
+    for key, results in zotero.search_cache.entries.items():
+        assert [item.id for item in results] == \
+            sorted(item.id for item in rebuilt.index.values()
+                   if item.match(key)), key
+    for query in queries + [u"quixotic", u"quuxley", u"tag:freshtag"]:
+        assert [item.id for item in zotero.search(query)] == \
+            [item.id for item in rebuilt.search(query)], query
+    zotero.close()
+    rebuilt.close()
+
+
+def test_snapshot_after_delta(library, tmp_path, monkeypatch):
+
+    zotero = open_library(library, str(tmp_path), monkeypatch)
+    with open(zotero.snapshot_path, u"rb") as fd:
+        snapshot = fd.read()
+    conn = sqlite3.connect(os.path.join(library, u"zotero.sqlite"))
+    edit_title(conn)
+    conn.commit()
+    conn.close()
+    assert zotero.update()
+    assert [item.id for item in zotero.search(u"quixotic")]
+    # A small update is only saved when the library is closed
+    with open(zotero.snapshot_path, u"rb") as fd:
+        assert fd.read() == snapshot
+    zotero.close()
+    reopened = LibZotero(library, auto_update=False)
+    assert index_state(reopened) == index_state(zotero)
+    reopened.close()
@@ -0,0 +1,163 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# While typing, each search narrows the results of the previous keystroke
+# instead of searching the index again. This should give the same results as
+# a search with an empty cache.
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero.libzotero import LibZotero, parse_query
+from libzotero.search_cache import SearchCache, cache_key, narrows
+
+# Queries that are typed, and partly erased and typed again
+typed = [
+    u"neural network",
+    u"author:doe memory",
+    u"title:netwrk~ memory",
+    u"kahnemann~ 2010",
+    u"tag:review doe",
+    u"smith author:smi",
+    u"abs:cognition attention",
+    u"collection:memory neur~",
+    u"date:20 title:eco",
+    ]
+
+
+def keystrokes(query):
+
+    """
+    Returns:
+    The text of the search box after every keystroke, while the query is
+    typed, its last word is erased, and the query is typed again.
+    """
+
+    texts = [query[:i] for i in range(1, len(query) + 1)]
+    erased = query.rsplit(u" ", 1)[0]
+    texts += [query[:i] for i in range(len(query) - 1, len(erased) - 1, -1)]
+    texts += [query[:i] for i in range(len(erased) + 1, len(query) + 1)]
+    return texts
+
+
+@pytest.fixture(scope=u"module")
+def library(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"zotero"))
+    generate(path, 500)
+    return path
+
+
+@pytest.fixture
+def zotero(library, tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    monkeypatch.setenv(u"USERPROFILE", str(tmp_path))
+    zotero = LibZotero(library)
+    fresh = LibZotero(library, auto_update=False)
+    yield zotero, fresh
+    zotero.close()
+    fresh.close()
+
+
+def fresh_search(fresh, query):
+
+    fresh.search_cache = SearchCache()
+    return [item.id for item in fresh.search(query)]
+
+
+@pytest.mark.parametrize(u"max_entries, max_results", [
+    (128, 100000),
+    # Searches are forgotten after a few keystrokes, or when they have
+    # many results
+    (3, 100000),
+    (128, 60),
+    (1, 10),
+    ])
+def test_typing(zotero, max_entries, max_results):
+
+    zotero, fresh = zotero
+    zotero.search_cache = SearchCache(max_entries, max_results)
+    narrowed = 0
+    for query in typed:
+        for text in keystrokes(query):
+            key = cache_key(parse_query(text))
+            if zotero.search_cache.get(key) is None and \
+                    zotero.search_cache.narrowest(key) is not None:
+                narrowed += 1
+            assert [item.id for item in zotero.search(text)] == \
+                fresh_search(fresh, text), text
+            assert len(zotero.search_cache) <= max_entries
+            assert zotero.search_cache.size <= max_results
+    # Most keystrokes narrow a cached search, unless the cache is small
+    if max_results > 60:
+        assert narrowed > 100
+    else:
+        assert narrowed > 0
+
+
+def test_narrows(zotero):
+
+    # If a query narrows another query, every item that matches the query
+    # matches the other query as well
+    zotero, fresh = zotero
+    keys = set()
+    for query in typed:
+        for text in keystrokes(query):
+            keys.add(cache_key(parse_query(text)))
+    # Empty queries are not searched, and not cached
+    keys.discard(())
+    keys = sorted(keys, key=repr)
+    matches = dict((key, set(item.id for item in fresh.index.values()
+                             if item.match(key)))
+                   for key in keys)
+    checked = 0
+    for key in keys:
+        for cached_key in keys:
+            if narrows(key, cached_key):
+                assert matches[key] <= matches[cached_key], \
+                    (key, cached_key)
+                checked += 1
+    assert checked > len(keys)
+    # Fuzzy terms only narrow the same fuzzy term
+    assert narrows(((None, u"netwrk~"),), ((None, u"netwrk~"),))
+    assert not narrows(((None, u"netwrks~"),), ((None, u"netwrk~"),))
+    assert not narrows(((None, u"netwrk"),), ((None, u"netwrk~"),))
+    # A field prefix only narrows searches in the same or more fields
+    assert narrows(((u"author", u"smith"),), ((None, u"smi"),))
+    assert not narrows(((None, u"smith"),), ((u"author", u"smi"),))
+    assert not narrows(((u"title", u"smith"),), ((u"author", u"smi"),))
+
+
+def test_filtered(zotero):
+
+    # The cache that is kept after a reindex still narrows searches correctly
+    zotero, fresh = zotero
+    for text in keystrokes(typed[0]):
+        zotero.search(text)
+    removed = set(item.id for item in zotero.search(u"neural")[::2])
+    cache = zotero.search_cache.filtered(
+        lambda key, results: not any(item.id in removed for item in results))
+    assert 0 < len(cache) < len(zotero.search_cache)
+    assert cache.size == sum(len(results)
+                             for results in cache.entries.values())
+    zotero.search_cache = cache
+    for text in keystrokes(typed[0]):
+        assert [item.id for item in zotero.search(text)] == \
+            fresh_search(fresh, text), text
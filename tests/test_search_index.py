@@ -0,0 +1,133 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+#
+# The suffix array and the inverted index replace scans over all words and
+# all items, and should find exactly what these scans find.
+
+import random
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero.inverted_index import InvertedIndex
+from libzotero.libzotero import LibZotero, parse_query
+from libzotero.suffix_array import SuffixArray
+
+# The field scopes of the queries
+term_types = None, u"author", u"title", u"publication", u"date", u"tag", \
+    u"collection", u"abs"
+
+
+@pytest.fixture(scope=u"module")
+def items(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"zotero"))
+    generate(path, 500)
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv(u"HOME", str(tmp_path_factory.mktemp(u"home")))
+    monkeypatch.setenv(u"USERPROFILE", str(tmp_path_factory.mktemp(u"home")))
+    zotero = LibZotero(path)
+    items = list(zotero.index.values())
+    zotero.close()
+    monkeypatch.undo()
+    return items
+
+
+@pytest.fixture(scope=u"module")
+def search_index(items):
+
+    search_index = InvertedIndex(items)
+    search_index.prepare()
+    return search_index
+
+
+def infixes(words, n, seed=0):
+
+    """
+    Arguments:
+    words		--	A list of words.
+    n			--	The number of infixes.
+
+    Keyword arguments:
+    seed		--	The seed of the random generator. (default=0)
+
+    Returns:
+    A list of random parts of the words, and some terms that occur in none
+    of them.
+    """
+
+    rng = random.Random(seed)
+    terms = [u"zzqx", u"\xe9\xe9", u"a" * 40]
+    for i in range(n):
+        word = rng.choice(words)
+        start = rng.randrange(len(word))
+        terms.append(word[start:rng.randint(start + 1, len(word))])
+    return terms
+
+
+def test_suffix_array(search_index):
+
+    words = search_index.vocabulary
+    suffix_array = SuffixArray(words)
+    for term in infixes(words, 500):
+        assert sorted(suffix_array.find(term)) == \
+            sorted(word for word in words if term in word), term
+
+
+def test_suffix_array_added_words(search_index):
+
+    words = search_index.vocabulary
+    suffix_array = SuffixArray(words[::2])
+    copy = suffix_array.copy()
+    for word in words[1::2]:
+        copy.add(word)
+    for term in infixes(words, 200, seed=1):
+        assert sorted(copy.find(term)) == \
+            sorted(word for word in words if term in word), term
+        # The original is not affected by the words of the copy
+        assert sorted(suffix_array.find(term)) == \
+            sorted(word for word in words[::2] if term in word), term
+
+
+def test_inverted_index(items, search_index):
+
+    rng = random.Random(2)
+    terms = infixes(search_index.vocabulary, 200, seed=2)
+    for term in terms:
+        term_type = rng.choice(term_types)
+        key = [(term_type, term)]
+        assert search_index.search(key) == \
+            set(item.id for item in items if item.match(key)), key
+
+
+@pytest.mark.parametrize(u"query", [
+    u"neural network",
+    u"author:muller 20",
+    u"title:cognit journal:of",
+    u"kahnemann~",
+    u"title:netwrk~",
+    u"year:20 tag:review",
+    u"abs:memo collection:ologie",
+    u"café ærø",
+    ])
+def test_inverted_index_queries(items, search_index, query):
+
+    key = parse_query(query)
+    assert search_index.search(key) == \
+        set(item.id for item in items if item.match(key))
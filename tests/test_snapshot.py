@@ -0,0 +1,72 @@
+#-*- coding:utf-8 -*-
+
+#  This file is part of Qnotero.
+#
+#      Qnotero is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      Qnotero is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with Qnotero.  If not, see <https://www.gnu.org/licenses/>.
+#      Copyright (c) 2019 E. Albiter
+
+import os
+
+import pytest
+
+from benchmarks.generate import generate
+from libzotero.libzotero import LibZotero
+from libzotero.snapshot import read_snapshot
+
+
+@pytest.fixture(scope=u"module")
+def library(tmp_path_factory):
+
+    path = str(tmp_path_factory.mktemp(u"zotero"))
+    generate(path, 100)
+    return path
+
+
+@pytest.fixture
+def snapshot(library, tmp_path, monkeypatch):
+
+    monkeypatch.setenv(u"HOME", str(tmp_path))
+    monkeypatch.setenv(u"USERPROFILE", str(tmp_path))
+    zotero = LibZotero(library)
+    zotero.close()
+    return zotero.snapshot_path
+
+
+def test_no_temporary_files(snapshot):
+
+    assert read_snapshot(snapshot) is not None
+    assert os.listdir(os.path.dirname(snapshot)) == \
+        [os.path.basename(snapshot)]
+
+
+@pytest.mark.parametrize(u"old, new", [
+    # Invalid JSON
+    (b'{"', b'{{'),
+    # A missing key
+    (b'"watermark"', b'"watermarx"'),
+    # A header that is not an object
+    (b'{"', b'["'),
+    ])
+def test_damaged_header(library, snapshot, old, new):
+
+    with open(snapshot, u"rb") as fd:
+        data = fd.read()
+    assert old in data
+    with open(snapshot, u"wb") as fd:
+        fd.write(data.replace(old, new, 1))
+    # The index is rebuilt from the database instead
+    zotero = LibZotero(library)
+    assert len(zotero.index) > 0
+    zotero.close()
+    assert read_snapshot(snapshot) is not None